@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+"""Benchmark suite for loading, building, colliding and playing boards
+
+Usage: python acbench.py [options] [files]
+
+Options:
+ -k ..., --kinds=...    Comma separated benchmarks to run, out of parse, build,
+                        collide, tick and frame (default parse,build,collide,tick)
+ -r ..., --repeat=...   Number of timed loads and builds per file (default 10)
+ -s ..., --scale=...    Comma separated copy counts for synthetic boards (default 1,4,16)
+ -g ..., --generate=... Comma separated peg counts for generated boards (default none)
+ -q ..., --queries=...  Number of ball positions to query per file (default 5000)
+ -b ..., --balls=...    Comma separated ball counts to tick with (default 1)
+ -f ..., --frames=...   Number of frames to time per tick and frame run (default 200)
+ -c, --collide          Only run the collide benchmark
+ -m, --multiball        Only run the tick benchmark, with 1, 8 and 64 balls
+ -j ..., --json=...     Add the results to a file, as one JSON object per line
+ -l ..., --label=...    Label the results with this in the JSON file, like a revision
+ -p ..., --compare=...  Compare the medians with the last results in a JSON file
+ -h, --help             Display this menu
+
+The benchmarks are:
+ parse    Load each file with the line-by-line parser, the bulk fast path and
+          the compiled cache
+ build    Create the objects of each board and process their surfaces, with
+          tuple geometry, array geometry and shared instances
+ collide  Look up the closest surface for random ball positions, with the
+          brute force search over every object and with the collision grid
+ tick     Run the physics steps of one frame of a game, with the paddles
+          flipping and every ball launched
+ frame    Run the physics steps and draw one frame in a window, like
+          ACRenderer.animate, needs OpenGL and a display
+
+Every benchmark runs on each file, Pinball0_5.ac and Pinball0_6.ac by
+default, and on synthetic boards built by copying every object of the
+first file the given number of times. A scale of 1 is the files themselves.
+Generated boards are laid out by pinballboard.py with the default mix of
+other objects, so they give the same inputs for every run at any size.
+
+For each run, the time per sample is given as its median, 90th and 99th
+percentile, with the throughput at the median.
+"""
+
+import os
+import sys
+import copy
+import json
+import getopt
+import random
+import shutil
+import tempfile
+
+from acloader import *
+from accache import *
+from acwriter import *
+from acclock import *
+from acprofile import *
+from pinballboard import *
+
+
+KINDS = ('parse', 'build', 'collide', 'tick', 'frame')
+CHUNK = 100   # Collision queries timed together as one sample, single queries are too short to time
+
+results = []  # Every result of this run, as written to the JSON file
+
+
+def scaleObjects(objects, factor, unique = ('ball',)):
+  """Copy the kids of each top level object factor times, shifting each copy along x
+
+  Objects named in unique are only kept once, so the board still has a single ball.
+  """
+  scaled = []
+  for obj in objects:
+    obj = copy.deepcopy(obj)
+    kids = obj.get('kids', [])
+    obj['kids'] = []
+    for i in range(factor):
+      for k in kids:
+        if i and k.get('name') in unique:
+          continue
+        k = copy.deepcopy(k)
+        k['loc'] = (k['loc'][0] + 2.0*i, k['loc'][1], k['loc'][2])
+        obj['kids'].append(k)
+    scaled.append(obj)
+  return scaled
+
+def report(kind, name, variant, samples, work = 1, unit = '/s', **extra):
+  """Print and save the percentiles of the seconds each sample took, with the work done per sample"""
+  samples = sorted(samples)
+  result = {
+    'kind': kind,
+    'file': os.path.basename(name),
+    'variant': variant,
+    'samples': len(samples),
+    'mean': sum(samples)/len(samples),
+    'min': samples[0],
+    'p50': percentile(samples, 50),
+    'p90': percentile(samples, 90),
+    'p99': percentile(samples, 99),
+    'max': samples[-1],
+    'throughput': work/max(percentile(samples, 50), 1e-9),
+    'unit': unit,
+  }
+  result.update(extra)
+  results.append(result)
+  print "%-8s %-24s %-10s %7d %10.3f ms %10.3f ms %10.3f ms %12.1f %s" % (kind, result['file'], variant, len(samples),
+    result['p50']*1000, result['p90']*1000, result['p99']*1000, result['throughput'], unit)
+
+def timeRuns(run, repeat):
+  """Time a function repeat times, returns the seconds of each run"""
+  times = []
+  for i in range(repeat):
+    start = monotonic()
+    run()
+    times.append(monotonic() - start)
+  return times
+
+def benchParse(name, repeat):
+  """Parse throughput of every parser path for a single file"""
+  size = os.path.getsize(name)
+  paths = [
+    ('line', lambda: ACLoader(name, fast=False)),
+    ('fast', lambda: ACLoader(name)),
+    ('cache', lambda: ACCachedLoader(name)),
+  ]
+
+  ACCachedLoader(name)  # Make sure the cache is compiled before timing it
+  for (label, load) in paths:
+    report('parse', name, label, timeRuns(load, repeat), size/1048576.0, 'MB/s')
+
+def benchBuild(name, repeat):
+  """Time to create the objects of a board and process their surfaces, for each way of storing geometry"""
+  import acengine
+
+  variants = [('tuples', False, False), ('instanced', False, True)]
+  if numpy is not None:
+    variants.insert(1, ('arrays', True, False))
+
+  for (label, arrays, instancing) in variants:
+    engine = acengine.ACEngine(name, arrays=arrays, instancing=instancing)
+    objects = ACCachedLoader(name, arrays=arrays).objects
+
+    def build():
+      engine.meshes = {}
+      engine.dynamic = []
+      return engine.createObjects(objects)
+    count = len(acengine.ACCollisionIndex(build()).entries)
+    report('build', name, label, timeRuns(build, repeat), count, 'objects/s')
+
+def benchCollide(name, queries):
+  """Closest surface queries per second of the brute force search and the collision grid"""
+  import pinballgame
+
+  settings = copy.deepcopy(pinballgame.SETTINGS)
+  settings['gamefile'] = name
+  game = pinballgame.PinballGame(settings)
+  ball = game.ball
+  ball.hidden = False
+
+  # Random ball positions spread over the board
+  game.collisions.build(ball.radius, ball.location[1])
+  boxes = [b for b in game.collisions.regions.values() if b and b is not True]
+  (x0, z0) = (min([b[0] for b in boxes]), min([b[1] for b in boxes]))
+  (x1, z1) = (max([b[2] for b in boxes]), max([b[3] for b in boxes]))
+  rand = random.Random(0)
+  points = [[rand.uniform(x0, x1), ball.location[1], rand.uniform(z0, z1)] for i in range(queries)]
+
+  paths = [
+    ('brute', lambda: ball.getClosestSurface(game.loaders)),
+    ('grid', lambda: ball.getClosestSurface()),
+  ]
+  for (label, query) in paths:
+    times = []
+    for c in range(0, len(points), CHUNK):
+      start = monotonic()
+      for p in points[c:c + CHUNK]:
+        ball.location = p
+        query()
+      times.append(monotonic() - start)
+    report('collide', name, label, times, CHUNK, 'queries/s')
+
+def playFrame(game, settings, i):
+  """Run the physics steps of frame i of a game, flipping the paddles and launching balls like a player"""
+  keys = settings['keys']
+  # Flip the paddles now and then so balls don't all pile up on them
+  if i % 70 == 0:
+    game.input(-1, keys['l'])
+    game.input(-1, keys['r'])
+  elif i % 70 == 20:
+    game.input(1, keys['l'])
+    game.input(1, keys['r'])
+  for s in range(max(1, settings['rate']/settings['fps'])):
+    game.step()
+  if not game.inPlay():
+    game.input(-1, keys['fire'])
+    game.input(1, keys['fire'])
+
+def timeFrames(game, settings, frames, draw = None):
+  """Launch every ball and give them half a second to spread out, then time frames
+
+  Returns the seconds of each frame, and the average number of balls in play.
+  """
+  game.input(-1, settings['keys']['fire'])
+  game.input(1, settings['keys']['fire'])
+  i = 0
+  while game.queued or i < settings['fps']/2:
+    playFrame(game, settings, i)
+    i += 1
+
+  times = []
+  inPlay = 0
+  for j in range(frames):
+    start = monotonic()
+    playFrame(game, settings, i + j)
+    if draw:
+      draw()
+    times.append(monotonic() - start)
+    inPlay += len([b for b in game.balls if not b.hidden])
+  return (times, float(inPlay)/frames)
+
+def benchTick(name, counts, frames):
+  """Physics time per frame of a game, with each number of balls"""
+  import pinballgame
+
+  for count in counts:
+    settings = copy.deepcopy(pinballgame.SETTINGS)
+    settings['gamefile'] = name
+    settings['balls'] = count
+    game = pinballgame.PinballGame(settings)
+    (times, inPlay) = timeFrames(game, settings, frames)
+    report('tick', name, '%d ball%s' % (count, count != 1 and 's' or ''), times, 1, 'frames/s', inPlay=inPlay)
+
+def benchFrame(name, frames):
+  """Time per frame of a game in a window, the physics steps and drawing"""
+  import pinball
+
+  if not getattr(benchFrame, 'started', False):
+    pinball.glutInit(sys.argv)
+    benchFrame.started = True
+
+  settings = copy.deepcopy(pinball.SETTINGS)
+  settings['gamefile'] = name
+  game = pinball.Pinball(settings)
+  try:
+    (times, inPlay) = timeFrames(game, settings, frames, game.displayFunc)
+  finally:
+    pinball.glutDestroyWindow(game.window)
+  report('frame', name, 'window', times, 1, 'frames/s', inPlay=inPlay)
+
+def compare(name):
+  """Print how the medians of this run changed from the last results for the same benchmarks in a JSON file"""
+  old = {}
+  for line in open(name):
+    if line.strip():
+      r = json.loads(line)
+      old[(r['kind'], r['file'], r['variant'])] = r
+
+  print
+  print "%-8s %-24s %-10s %13s %13s %8s" % ('kind', 'file', 'variant', 'old median', 'new median', 'change')
+  for r in results:
+    o = old.get((r['kind'], r['file'], r['variant']))
+    if o:
+      print "%-8s %-24s %-10s %10.3f ms %10.3f ms %+7.1f%%" % (r['kind'], r['file'], r['variant'], o['p50']*1000, r['p50']*1000,
+                                                           (r['p50'] - o['p50'])*100/o['p50'])
+
+
+if __name__ == "__main__":
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'k:r:s:g:q:b:f:cmj:l:p:h', ["kinds=", "repeat=", "scale=", "generate=", "queries=", "balls=", "frames=",
+                                                                     "collide", "multiball", "json=", "label=", "compare=", "help"])
+  except getopt.GetoptError:
+    print __doc__
+    sys.exit(2)
+
+  kinds = ['parse', 'build', 'collide', 'tick']
+  repeat = 10
+  scales = [1, 4, 16]
+  pegs = []
+  queries = 5000
+  counts = [1]
+  frames = 200
+  output = None
+  label = None
+  previous = None
+  for opt, arg in opts:
+    if opt in ('-k', '--kinds'):
+      kinds = arg.split(',')
+    elif opt in ('-r', '--repeat'):
+      repeat = int(arg)
+    elif opt in ('-s', '--scale'):
+      scales = [int(x) for x in arg.split(',')]
+    elif opt in ('-g', '--generate'):
+      pegs = [int(x) for x in arg.split(',')]
+    elif opt in ('-q', '--queries'):
+      queries = int(arg)
+    elif opt in ('-b', '--balls'):
+      counts = [int(x) for x in arg.split(',')]
+    elif opt in ('-f', '--frames'):
+      frames = int(arg)
+    elif opt in ('-c', '--collide'):
+      kinds = ['collide']
+    elif opt in ('-m', '--multiball'):
+      kinds = ['tick']
+      counts = [1, 8, 64]
+    elif opt in ('-j', '--json'):
+      output = arg
+    elif opt in ('-l', '--label'):
+      label = arg
+    elif opt in ('-p', '--compare'):
+      previous = arg
+    elif opt in ('-h', '--help'):
+      print __doc__
+      sys.exit()
+
+  unknown = [k for k in kinds if k not in KINDS]
+  if unknown:
+    print "Unknown benchmark %s, pick from %s" % (', '.join(unknown), ', '.join(KINDS))
+    sys.exit(2)
+
+  files = args or ['Pinball0_5.ac', 'Pinball0_6.ac']
+  tmp = tempfile.mkdtemp()
+
+  try:
+    # The files themselves, then the synthetic and generated boards
+    boards = 1 in scales and list(files) or []
+    source = ACLoader(files[0])
+    for factor in scales:
+      if factor != 1:
+        boards.append(os.path.join(tmp, "synthetic_x%d.ac" % factor))
+        ACWriter(boards[-1], source.materials, scaleObjects(source.objects, factor))
+    for count in pegs:
+      boards.append(os.path.join(tmp, "pegs_%d.ac" % count))
+      writeBoard(boards[-1], pegs = count)
+
+    print "%-8s %-24s %-10s %7s %13s %13s %13s %14s" % ('kind', 'file', 'variant', 'samples', 'median', 'p90', 'p99', 'throughput')
+    for kind in [k for k in KINDS if k in kinds]:
+      for name in boards:
+        if kind == 'parse':
+          benchParse(name, repeat)
+        elif kind == 'build':
+          benchBuild(name, repeat)
+        elif kind == 'collide':
+          benchCollide(name, queries)
+        elif kind == 'tick':
+          benchTick(name, counts, frames)
+        elif kind == 'frame':
+          benchFrame(name, frames)
+  finally:
+    shutil.rmtree(tmp)
+
+  if previous:
+    compare(previous)
+
+  if output:
+    out = open(output, 'a')
+    for r in results:
+      r['label'] = label
+      out.write(json.dumps(r, sort_keys=True) + '\n')
+    out.close()
@@ -0,0 +1,309 @@
+
+import os
+import sys
+import mmap
+import struct
+import marshal
+import hashlib
+from array import array
+
+from acloader import *
+from acgeometry import *
+
+
+CACHE_MAGIC = 'ACB1'
+CACHE_VERSION = 1
+CACHE_EXT = 'b'   # Pinball0_5.ac -> Pinball0_5.acb
+
+# magic, version, source mtime, source size, source sha1, tree/vert/surf/idx/uv section offsets
+HEADER = struct.Struct('<4sIdQ20s5Q')
+STAMP = struct.Struct('<dQ')        # source mtime and size, where they are in the header
+STAMP_OFFSET = struct.calcsize('<4sI')
+
+
+class ACCacheError(Exception): pass
+
+class ACCache:
+  """Compiled binary form of the data parsed by ACLoader, stored next to the .ac file
+
+  The file holds the materials and object tree as a marshalled structure, plus
+  flat arrays for every vertex, surface and surface reference in the board.
+  """
+
+  def __init__(self, name):
+    self.source = name
+    self.path = name + CACHE_EXT
+
+  def sourceStamp(self):
+    """Get the mtime and size of the source file"""
+    st = os.stat(self.source)
+    return (st.st_mtime, st.st_size)
+
+  def sourceHash(self):
+    """Get the sha1 digest of the source file"""
+    f = open(self.source, 'rb')
+    try:
+      return hashlib.sha1(f.read()).digest()
+    finally:
+      f.close()
+
+  def restamp(self, stamp):
+    """Write a new source mtime and size into the header, after the hash showed the source is the same"""
+    f = open(self.path, 'r+b')
+    try:
+      f.seek(STAMP_OFFSET)
+      f.write(STAMP.pack(*stamp))
+    finally:
+      f.close()
+
+  def load(self, arrays = False):
+    """Load materials and objects from the cache, returns None if it is missing or stale
+
+    Array geometry is read straight from the mapped file without copying it,
+    so every process that loads the same board shares one read only copy of
+    its vertices and surfaces. The mapping stays open until the last array
+    using it is freed.
+    """
+    try:
+      f = open(self.path, 'rb')
+    except IOError:
+      return None
+
+    try:
+      try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      except (ValueError, EnvironmentError):
+        return None
+      data = self.__read(mm, arrays)
+      if not (data and arrays):
+        mm.close()
+      return data
+    finally:
+      f.close()
+
+  def __view(self, mm, dtype, start, end, width):
+    """Get a read only array of a section of the mapped file, without copying it"""
+    a = numpy.frombuffer(mm, dtype=dtype, count=(end - start)/numpy.dtype(dtype).itemsize, offset=start)
+    if width:
+      a = a.reshape((-1, width))
+    return a
+
+  def __read(self, mm, arrays):
+    """Decode a mapped cache file"""
+    if len(mm) < HEADER.size:
+      return None
+
+    (magic, version, mtime, size, digest, tree, verts, surfs, idx, uvs) = HEADER.unpack_from(mm, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+      return None
+
+    # A file cut short, or sections that do not hold whole items, is treated as missing
+    if not HEADER.size <= tree <= verts <= surfs <= idx <= uvs <= len(mm):
+      return None
+    if (surfs - verts) % 24 or (idx - surfs) % 16 or (uvs - idx) % 4 or (len(mm) - uvs) % 16:
+      return None
+
+    # mtime and size are cheap, only hash the source when they do not match
+    stamp = self.sourceStamp()
+    if (mtime, size) != stamp:
+      if digest != self.sourceHash():
+        return None
+      try:
+        self.restamp(stamp)   # So the next load does not hash it again
+      except EnvironmentError:
+        pass
+
+    try:
+      (materials, objects) = marshal.loads(mm[tree:verts])
+    except (EOFError, ValueError, TypeError):
+      return None
+    if arrays:
+      if numpy is None:
+        raise ImportError("Array geometry needs the python-numpy package installed")
+      # Every object's geometry is a view into these four arrays, which are views of the file
+      sections = (self.__view(mm, '<f8', verts, surfs, 3),
+                  self.__view(mm, '<i4', surfs, idx, 4),
+                  self.__view(mm, '<i4', idx, uvs, 0),
+                  self.__view(mm, '<f8', uvs, len(mm), 2))
+      return (materials, [self.__inflateArrays(o, materials, *sections) for o in objects])
+
+    vdata = self.__array('d', mm[verts:surfs])
+    sdata = self.__array('i', mm[surfs:idx])
+    idata = self.__array('i', mm[idx:uvs])
+    uvdata = self.__array('d', mm[uvs:])
+
+    return (materials, [self.__inflate(o, materials, vdata, sdata, idata, uvdata) for o in objects])
+
+  def __array(self, type, data):
+    """Build an array from little endian data"""
+    a = array(type)
+    a.fromstring(data)
+    if sys.byteorder != 'little':
+      a.byteswap()
+    return a
+
+  def __inflate(self, rec, materials, vdata, sdata, idata, uvdata):
+    """Rebuild the ACLoader object dict for a cached object record"""
+    (obj, vstart, vcount, sstart, scount, kids) = rec
+
+    v = vdata[vstart*3:(vstart + vcount)*3]
+    obj['verts'] = zip(v[0::3], v[1::3], v[2::3])
+
+    surfaces = []
+    for i in range(sstart, sstart + scount):
+      (type, mat, rstart, rcount) = sdata[i*4:i*4 + 4]
+      surf = { 'type': type }
+      if mat >= 0:
+        surf['mat'] = mat
+        surf['material'] = materials[mat]
+      uv = uvdata[rstart*2:(rstart + rcount)*2]
+      surf['refs'] = zip(idata[rstart:rstart + rcount], uv[0::2], uv[1::2])
+      surfaces.append(surf)
+    obj['surfaces'] = surfaces
+
+    if kids is not None:
+      obj['kids'] = [self.__inflate(k, materials, vdata, sdata, idata, uvdata) for k in kids]
+    return obj
+
+  def __inflateArrays(self, rec, materials, vdata, sdata, idata, uvdata):
+    """Rebuild an object dict for a cached object record with ACGeometry arrays"""
+    (obj, vstart, vcount, sstart, scount, kids) = rec
+
+    surfs = sdata[sstart:sstart + scount]
+    (rstart, rend) = (0, 0)
+    if scount:
+      (rstart, rend) = (surfs[0, 2], surfs[-1, 2] + surfs[-1, 3])
+    offsets = numpy.append(surfs[:, 2], rend) - rstart
+
+    g = ACGeometry(vdata[vstart:vstart + vcount], idata[rstart:rend], offsets.astype(numpy.int32),
+                   uvdata[rstart:rend], surfs[:, 0].copy(), surfs[:, 1].copy(), materials)
+    (obj['geometry'], obj['verts'], obj['surfaces']) = (g, g.verts, g)
+
+    if kids is not None:
+      obj['kids'] = [self.__inflateArrays(k, materials, vdata, sdata, idata, uvdata) for k in kids]
+    return obj
+
+  def save(self, materials, objects):
+    """Compile the loaded materials and objects into the cache file"""
+    vdata = array('d')
+    sdata = array('i')
+    idata = array('i')
+    uvdata = array('d')
+    tree = [self.__flatten(o, vdata, sdata, idata, uvdata) for o in objects]
+
+    if sys.byteorder != 'little':
+      [a.byteswap() for a in (vdata, sdata, idata, uvdata)]
+
+    sections = [marshal.dumps((materials, tree)), vdata.tostring(), sdata.tostring(), idata.tostring(), uvdata.tostring()]
+    offsets = []
+    pos = HEADER.size
+    for s in sections:
+      offsets.append(pos)
+      pos += len(s)
+
+    (mtime, size) = self.sourceStamp()
+    header = HEADER.pack(CACHE_MAGIC, CACHE_VERSION, mtime, size, self.sourceHash(), *offsets)
+
+    # Write to a temp file and rename so a partial cache is never read
+    tmp = '%s.%d.tmp' % (self.path, os.getpid())
+    f = open(tmp, 'wb')
+    try:
+      f.write(header)
+      [f.write(s) for s in sections]
+    finally:
+      f.close()
+    os.rename(tmp, self.path)
+
+  def __flatten(self, obj, vdata, sdata, idata, uvdata):
+    """Append an object's geometry to the flat arrays and return its tree record"""
+    meta = dict([(k, v) for (k, v) in obj.items() if k not in ('verts', 'surfaces', 'kids', 'geometry')])
+
+    vstart = len(vdata)/3
+    sstart = len(sdata)/4
+    if obj.has_key('geometry'):
+      g = obj['geometry']
+      for i in range(len(g)):
+        sdata.extend((int(g.types[i]), int(g.mats[i]), len(idata) + int(g.offsets[i]), int(g.counts[i])))
+      vdata.extend(g.verts.ravel().tolist())
+      idata.extend(g.refs.tolist())
+      uvdata.extend(g.uvs.ravel().tolist())
+    else:
+      for v in obj['verts']:
+        if len(v) != 3:
+          raise ACCacheError("Vertex in %s does not have 3 components" % meta.get('name'))
+        vdata.extend(v)
+
+      for s in obj['surfaces']:
+        sdata.extend((s['type'], s.get('mat', -1), len(idata), len(s['refs'])))
+        for (i, u, v) in s['refs']:
+          idata.append(i)
+          uvdata.extend((u, v))
+
+    kids = None
+    if obj.has_key('kids'):
+      kids = [self.__flatten(k, vdata, sdata, idata, uvdata) for k in obj['kids']]
+
+    return (meta, vstart, len(obj['verts']), sstart, len(obj['surfaces']), kids)
+
+
+class ACCachedLoader:
+  """Drop-in replacement for ACLoader that reads from the compiled cache when it is current
+
+  With lazy set and no usable cache, the board is only parsed as iterObjects
+  is read, and the cache is written once the whole board has been read.
+  """
+  def __init__(self, name, cache = True, arrays = False, lazy = False):
+    self.cached = False
+    self.cache = cache
+    self.stream = None
+    data = None
+
+    c = ACCache(name)
+    if cache:
+      data = c.load(arrays)
+
+    if data:
+      self.cached = True
+      (self.materials, self.objects) = data
+    elif lazy:
+      self.stream = ACLoader(name, arrays, lazy=True, keep=cache)
+      (self.materials, self.objects) = (self.stream.materials, None)
+    else:
+      loader = ACLoader(name, arrays)
+      (self.materials, self.objects) = (loader.materials, loader.objects)
+      self.__save(c)
+
+    self.source = c
+
+  def __save(self, c):
+    """Write the cache if caching is enabled"""
+    if self.cache:
+      try:
+        c.save(self.materials, self.objects)
+      except (EnvironmentError, ACCacheError), e:
+        pass  # A cache that cannot be written just means a slower start next time
+
+  def iterObjects(self):
+    """Yield top level objects, parsing them as they are needed when they did not come from the cache"""
+    if self.objects is not None:
+      for obj in self.objects:
+        yield obj
+      return
+
+    objects = []
+    for obj in self.stream.iterObjects():
+      yield obj
+      objects.append(obj)
+
+    self.objects = objects
+    self.__save(self.source)
+
+
+if __name__ == "__main__":
+  if (len(sys.argv) != 2):
+    print "Usage: accache.py <filename>"
+    sys.exit(0)
+
+  loader = ACLoader(sys.argv[1])
+  ACCache(sys.argv[1]).save(loader.materials, loader.objects)
+  print "Compiled %s" % (sys.argv[1] + CACHE_EXT)
@@ -0,0 +1,77 @@
+
+import time
+import ctypes
+import ctypes.util
+
+
+class _timespec(ctypes.Structure):
+  _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+
+try:
+  _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1').clock_gettime
+  _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+  def monotonic():
+    """Seconds from a monotonic, high resolution clock"""
+    t = _timespec()
+    _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+    return t.tv_sec + t.tv_nsec*1e-9
+except (OSError, AttributeError):
+  monotonic = time.time   # No clock_gettime on this platform, fall back to wall clock time
+
+
+class ACScheduler:
+  """Fixed timestep scheduler that decouples physics steps from frames
+
+  Every frame, the real time passed is added to an accumulator, and as many
+  fixed physics steps as fit in it are run. Left over time is carried into
+  the next frame, and alpha says how far between the last two steps the frame
+  falls so moving objects can be drawn in between. If a frame falls too far
+  behind, at most maxSteps are run and the rest of the time is dropped so a
+  stall does not turn into a spiral of catching up.
+  """
+
+  def __init__(self, rate = 200, frameRate = 100, maxSteps = 10, clock = monotonic):
+    self.step = 1.0/rate          # seconds per physics step, has to be under a second
+    self.frameInterval = 1.0/frameRate
+    self.maxSteps = maxSteps
+    self.clock = clock
+    self.accumulator = 0.0
+    self.last = None
+    self.frameStart = None
+    self.fps = 0.0                # smoothed frames per second
+    self.steps = 0                # total physics steps run
+    self.dropped = 0.0            # seconds of simulation skipped because of stalls
+
+  def advance(self):
+    """Start a frame, returns the number of physics steps to run for it"""
+    now = self.clock()
+    if self.last is None:
+      self.last = now
+    frame = now - self.last
+    self.last = self.frameStart = now
+
+    if frame > 0:
+      self.fps = self.fps and self.fps*0.9 + 0.1/frame or 1.0/frame
+
+    self.accumulator += frame
+    steps = int(self.accumulator/self.step)
+    if steps > self.maxSteps:
+      self.dropped += (steps - self.maxSteps)*self.step
+      self.accumulator -= (steps - self.maxSteps)*self.step
+      steps = self.maxSteps
+
+    self.accumulator -= steps*self.step
+    self.steps += steps
+    return steps
+
+  def alpha(self):
+    """How far the current frame is between the last physics step and the next one"""
+    return min(self.accumulator/self.step, 1.0)
+
+  def frameDelay(self):
+    """Milliseconds to wait before starting the next frame"""
+    wait = self.frameInterval - (self.clock() - self.frameStart)
+    return max(int(wait*1000), 0)
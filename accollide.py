@@ -0,0 +1,444 @@
+
+import math
+from array import array
+
+from acgeometry import numpy
+
+
+BIG = 1.0e6   # Half size of the box regions get clipped from, anything reaching it is unbounded
+BATCH_ROWS = 256  # Below this many planes, numpy's call overhead costs more than a plain loop with early outs
+
+
+def touchingPairs(spheres):
+  """Find the pairs of (center, radius) spheres that overlap, as sorted (i, j) index pairs with i < j
+
+  Sweep and prune along x: the spheres are visited in order of their lowest
+  x, and each is only compared with the ones whose x extent it reaches.
+  """
+  order = sorted([(c[0] - r, i) for (i, (c, r)) in enumerate(spheres)])
+  active = []
+  pairs = []
+  for (lo, i) in order:
+    (c, r) = spheres[i]
+    active = [j for j in active if spheres[j][0][0] + spheres[j][1] >= lo]
+    for j in active:
+      (d, q) = spheres[j]
+      (dx, dy, dz) = (c[0] - d[0], c[1] - d[1], c[2] - d[2])
+      if dx*dx + dy*dy + dz*dz < (r + q)*(r + q):
+        pairs.append((min(i, j), max(i, j)))
+    active.append(i)
+  pairs.sort()
+  return pairs
+
+def clipPolygon(poly, a, b, c):
+  """Clip a convex polygon of (x, z) points to the half plane a*x + b*z <= c"""
+  out = []
+  n = len(poly)
+  for i in range(n):
+    p = poly[i]
+    q = poly[(i + 1) % n]
+    dp = a*p[0] + b*p[1] - c
+    dq = a*q[0] + b*q[1] - c
+    if dp <= 0:
+      out.append(p)
+    if (dp < 0 < dq) or (dq < 0 < dp):
+      t = dp/(dp - dq)
+      out.append((p[0] + (q[0] - p[0])*t, p[1] + (q[1] - p[1])*t))
+  return out
+
+
+class ACPlaneTable:
+  """World space collision planes of every object in one flat table
+
+  Each row is a surface the ball can hit: its world space normal, the plane
+  constant n.p for a point p on the surface, and which of its object's
+  surfaces it is. Near horizontal surfaces are left out when the row is built
+  rather than on every check. An object's rows are rebuilt only when its
+  vertices or position change. Objects that turn, like paddles, keep their
+  rows in their own unrotated frame, and the ball is moved into that frame to
+  test them.
+
+  The rows are kept in flat arrays of numbers rather than Python objects, so
+  reading them never writes to their memory. Processes forked after the rows
+  are built, like the sweep workers, keep sharing them instead of each
+  getting its own copy of every page they read.
+
+  With numpy and enough candidate planes, the distances to all of them are
+  computed in one batched operation. The arithmetic is done in the same order
+  as Ball.getClosestObjectSurface, so both give exactly the same distances.
+  """
+
+  def __init__(self):
+    self.norms = array('d')     # world space normal of each row, three numbers a row
+    self.consts = array('d')    # plane constant of each row
+    self.surfaces = array('i')  # number of the surface each row belongs to, in its object's surfaces
+    self.objects = {}     # object -> (first row, row count, vertices, position) its rows were built from
+    self.ranges = {}      # object -> (first row, row count) for static objects, whose rows never change
+    self.indices = {}     # (first row, row count) -> numpy array of row numbers
+    self.arrays = None    # (norms, consts) as numpy views of the rows, None when they have grown since
+
+  def __planes(self, obj, verts, pos):
+    """Build the rows of an object"""
+    rows = []
+    for (k, s) in enumerate(obj.surfaces):
+      n = s['norm']
+      if abs(n[1]) > 0.05:
+        continue
+      p1 = verts[s['refs'][0][0]]
+      rows.append((n, n[0]*(pos[0]+p1[0]) + n[1]*(pos[1]+p1[1]) + n[2]*(pos[2] + p1[2]), k))
+    return rows
+
+  def surface(self, obj, row):
+    """Get the surface of a row, turned like its object"""
+    return obj.worldSurface(obj.surfaces[self.surfaces[row]])
+
+  def views(self):
+    """Get the rows as (norms, consts) numpy arrays, without copying them"""
+    if self.arrays is None:
+      self.arrays = (numpy.frombuffer(self.norms, dtype=float).reshape(-1, 3), numpy.frombuffer(self.consts, dtype=float))
+    return self.arrays
+
+  def lookup(self, obj):
+    """Get the (first row, row count) of an object, building or rebuilding its rows if needed"""
+    r = self.ranges.get(obj)
+    if r:
+      return r
+
+    verts = obj.getVertices()
+    pos = obj.vecAdd(obj.position, obj.meshOffset)
+    entry = self.objects.get(obj)
+    if entry and entry[2] is verts and entry[3] == pos:
+      return entry[0:2]
+
+    rows = self.__planes(obj, verts, pos)
+    if entry and entry[1] == len(rows):
+      start = entry[0]    # Same planes moved, overwrite them in place
+    else:
+      start = len(self.consts)
+      self.arrays = None  # Growing the arrays can move them, so the numpy views must not outlive this
+      self.norms.extend([0.0]*3*len(rows))
+      self.consts.extend([0.0]*len(rows))
+      self.surfaces.extend([0]*len(rows))
+
+    # Array geometry gives numpy scalars, the arrays turn them back into plain floats
+    for (i, (n, d, k)) in enumerate(rows):
+      j = 3*(start + i)
+      (self.norms[j], self.norms[j + 1], self.norms[j + 2]) = (n[0], n[1], n[2])
+      self.consts[start + i] = d
+      self.surfaces[start + i] = k
+
+    self.objects[obj] = (start, len(rows), verts, pos)
+    if obj.static:
+      self.ranges[obj] = (start, len(rows))
+    return (start, len(rows))
+
+  def closest(self, objs, loc, radius):
+    """Find the closest surface of the objects that the ball is inside of, like Ball.getClosestSurface"""
+    ranges = [self.lookup(o) for o in objs]
+    if numpy is None or sum([r[1] for r in ranges]) < BATCH_ROWS:
+      return self.__closestLoop(objs, ranges, loc, radius)
+    return self.__closestArrays(objs, ranges, loc, radius)
+
+  def closestMany(self, queries, radius):
+    """Same as closest for each of a list of (objects, location), for balls of the same radius
+
+    With numpy and enough candidate planes between them, the distances of every
+    ball to all of its planes are computed in one batched operation.
+    """
+    ranges = [[self.lookup(o) for o in objs] for (objs, loc) in queries]
+    if numpy is None or sum([r[1] for rs in ranges for r in rs]) < BATCH_ROWS:
+      return [self.closest(objs, loc, radius) for (objs, loc) in queries]
+
+    (norms, consts) = self.views()
+
+    # One group of rows for every ball and object it could be inside of
+    groups = [(k, o, r) for (k, (objs, loc)) in enumerate(queries) for (o, r) in zip(objs, ranges[k]) if r[1]]
+    results = [(None, None, float('inf'))]*len(queries)
+    if not groups:
+      return results
+
+    rows = numpy.concatenate([self.__indices(r) for (k, o, r) in groups])
+    counts = numpy.array([r[1] for (k, o, r) in groups])
+    l = numpy.repeat(numpy.array([o.localPoint(queries[k][1]) for (k, o, r) in groups], dtype=float), counts, axis=0).T
+    n = norms[rows]
+    D = (n[:, 0]*l[0] + n[:, 1]*l[1] + n[:, 2]*l[2]) - consts[rows]
+
+    starts = numpy.cumsum(counts) - counts
+    inside = numpy.maximum.reduceat(D, starts) <= radius
+    for g in numpy.nonzero(inside)[0]:
+      (k, o, r) = groups[g]
+      d = D[starts[g]:starts[g] + counts[g]]
+      i = numpy.abs(d).argmin()
+      if abs(d[i]) < abs(results[k][2]):
+        results[k] = (self.surface(o, r[0] + i), o, float(d[i]))
+    return results
+
+  def __closestLoop(self, objs, ranges, loc, radius):
+    """Check the rows of one object after another"""
+    (surface, object, dist) = (None, None, float('inf'))
+    norms = self.norms
+    consts = self.consts
+    for (o, (start, count)) in zip(objs, ranges):
+      l = o.localPoint(loc)
+      (s, d) = (None, float('inf'))
+      for i in xrange(start, start + count):
+        j = 3*i
+        D = (norms[j]*l[0] + norms[j + 1]*l[1] + norms[j + 2]*l[2]) - consts[i]
+        # If ball farther than radius, it cannot be inside
+        if D > radius:
+          s = None
+          break
+        if abs(D) < abs(d):
+          (s, d) = (i, D)
+
+      if s is not None and abs(d) < abs(dist):
+        (surface, object, dist) = (self.surface(o, s), o, d)
+    return (surface, object, dist)
+
+  def sweep(self, objs, p0, p1, radius):
+    """Find the first surface a ball moving from p0 to p1 runs into
+
+    Returns (t, surface, object) with t the fraction of the way to p1 where
+    the ball touches the surface, or (None, None, None) if it gets there
+    without running into anything. The segment is clipped against every
+    object's planes, each pushed out by the radius, so nothing is skipped
+    however far the ball moves. Objects the ball starts inside of are left
+    to getClosestSurface.
+    """
+    norms = self.norms
+    consts = self.consts
+    (first, surface, object) = (None, None, None)
+    for o in objs:
+      (start, count) = self.lookup(o)
+      (l0, l1) = (o.localPoint(p0), o.localPoint(p1))
+      d = (l1[0] - l0[0], l1[1] - l0[1], l1[2] - l0[2])
+      (enter, leave, plane) = (float('-inf'), float('inf'), None)
+      for i in xrange(start, start + count):
+        (j, k) = (3*i, 3*i + 1)
+        f = (norms[j]*l0[0] + norms[k]*l0[1] + norms[k + 1]*l0[2]) - consts[i] - radius
+        df = norms[j]*d[0] + norms[k]*d[1] + norms[k + 1]*d[2]
+        if df < 0:
+          t = -f/df
+          if t > enter:
+            (enter, plane) = (t, i)
+        elif df > 0:
+          leave = min(leave, -f/df)
+        elif f > 0:
+          plane = None    # Moving parallel to, and outside of, this plane
+          break
+        if enter > leave or enter > 1:
+          plane = None
+          break
+
+      if plane is not None and enter >= 0 and (first is None or enter < first):
+        (first, surface, object) = (enter, self.surface(o, plane), o)
+    return (first, surface, object)
+
+  def __indices(self, r):
+    """Get the row numbers of a (first row, row count) range as an array"""
+    a = self.indices.get(r)
+    if a is None:
+      a = self.indices[r] = numpy.arange(r[0], r[0] + r[1])
+    return a
+
+  def __closestArrays(self, objs, ranges, loc, radius):
+    """Compute the distances to every row of every object at once"""
+    (norms, consts) = self.views()
+
+    # Objects without vertical surfaces can never be hit
+    keep = [(o, r) for (o, r) in zip(objs, ranges) if r[1]]
+    if not keep:
+      return (None, None, float('inf'))
+
+    rows = numpy.concatenate([self.__indices(r) for (o, r) in keep])
+    counts = numpy.array([r[1] for (o, r) in keep])
+    n = norms[rows]
+    l = loc
+    if [o for (o, r) in keep if o.rotation]:
+      # Rows of rotated objects are in their own frames, so give every row the ball location in its frame
+      l = numpy.repeat(numpy.array([o.localPoint(loc) for (o, r) in keep], dtype=float), counts, axis=0).T
+    D = (n[:, 0]*l[0] + n[:, 1]*l[1] + n[:, 2]*l[2]) - consts[rows]
+
+    # The ball is inside an object when it is within its radius of all the object's planes
+    starts = numpy.cumsum(counts) - counts
+    inside = numpy.maximum.reduceat(D, starts) <= radius
+
+    (surface, object, dist) = (None, None, float('inf'))
+    for k in numpy.nonzero(inside)[0]:
+      d = D[starts[k]:starts[k] + counts[k]]
+      i = numpy.abs(d).argmin()
+      if abs(d[i]) < abs(dist):
+        o = keep[k][0]
+        (surface, object, dist) = (self.surface(o, keep[k][1][0] + i), o, float(d[i]))
+    return (surface, object, dist)
+
+
+class ACCollisionIndex:
+  """Uniform grid in the board's x-z plane for finding the objects a ball can hit
+
+  Ball.getClosestObjectSurface only reports a surface when the ball is within
+  its radius of every vertical plane of an object. For each object, that
+  region is found by clipping a polygon with all of those planes, and the
+  object is added to every grid cell its bounding box touches. A query then
+  only checks the objects in the ball's cell, in the same order as the brute
+  force search, so it returns exactly the same result.
+
+  Surface planes are not quite vertical, so each region is widened to hold
+  for ball heights within yTolerance of the height the grid was built for,
+  and the grid is rebuilt if the ball leaves that band. Objects that move
+  (static = False) rotate around their location, so they get a region that
+  covers every angle. Hidden objects are skipped at query time.
+
+  Like the plane rows, the cells are kept in flat arrays: the objects of
+  every cell one after the other in members, and where each cell starts in
+  starts, for the cells counted row by row from the corner in cells.
+  """
+
+  def __init__(self, objects, cellSize = 0.1, yTolerance = 0.25):
+    self.cellSize = cellSize
+    self.yTolerance = yTolerance
+    self.entries = []       # (order, object) in the order the brute force search visits them
+    self.cells = None       # (first i, first j, cells along x, cells along z) of the grid
+    self.starts = None      # where the objects of each cell start in members
+    self.members = None     # entry numbers of the objects in each cell
+    self.key = None         # (radius, y) the grid was built for, None when out of date
+    self.planes = ACPlaneTable()
+    self.__collect(objects)
+
+  def __collect(self, objects):
+    """Number objects in the order the brute force search visits them"""
+    for o in objects:
+      self.entries.append((len(self.entries), o))
+      self.__collect(o.subobjects)
+
+  def region(self, obj, radius, y):
+    """Get the (x0, z0, x1, z1) box the ball center has to be in to hit an object, or None if it can't
+
+    Returns True if the region is unbounded.
+    """
+    if len(obj.surfaces) < 3 or not obj.collides:
+      return None
+
+    verts = obj.getVertices()
+    pos = obj.vecAdd(obj.position, obj.meshOffset)
+    tol = self.yTolerance
+
+    poly = [(-BIG, -BIG), (BIG, -BIG), (BIG, BIG), (-BIG, BIG)]
+    for s in obj.surfaces:
+      n = s['norm']
+      if abs(n[1]) > 0.05:
+        continue
+      p1 = verts[s['refs'][0][0]]
+      d = n[0]*(pos[0] + p1[0]) + n[1]*(pos[1] + p1[1]) + n[2]*(pos[2] + p1[2])
+
+      # n.loc - d <= radius, with the ball height anywhere in y +- tol
+      poly = clipPolygon(poly, n[0], n[2], radius + d - n[1]*y + abs(n[1])*tol)
+      if not poly:
+        return None
+
+    xs = [p[0] for p in poly]
+    zs = [p[1] for p in poly]
+    if max(map(abs, xs + zs)) >= BIG/2:
+      return True
+
+    if not obj.static:
+      # Cover the region rotated to any angle around the object's location
+      r = max([math.hypot(x - pos[0], z - pos[2]) for (x, z) in poly])
+      (xs, zs) = ([pos[0] - r, pos[0] + r], [pos[2] - r, pos[2] + r])
+
+    pad = 1e-6
+    return (min(xs) - pad, min(zs) - pad, max(xs) + pad, max(zs) + pad)
+
+  def build(self, radius, y):
+    """Build the grid for a ball of the given radius, at about the given height"""
+    grid = {}
+    self.unbounded = []
+    self.regions = {}
+    self.key = (radius, y)
+    cs = self.cellSize
+    for (order, obj) in self.entries:
+      box = self.region(obj, radius, y)
+      self.regions[order] = box
+      if box is True:
+        self.unbounded.append((order, obj))
+      elif box:
+        for i in range(int(math.floor(box[0]/cs)), int(math.floor(box[2]/cs)) + 1):
+          for j in range(int(math.floor(box[1]/cs)), int(math.floor(box[3]/cs)) + 1):
+            grid.setdefault((i, j), []).append(order)
+
+    # Entries are visited in order, so every cell is already sorted
+    (i0, j0, nx, nz) = (0, 0, 0, 0)
+    if grid:
+      (i0, j0) = (min([c[0] for c in grid]), min([c[1] for c in grid]))
+      (nx, nz) = (max([c[0] for c in grid]) - i0 + 1, max([c[1] for c in grid]) - j0 + 1)
+    self.cells = (i0, j0, nx, nz)
+    self.starts = array('i', [0])
+    self.members = array('i')
+    for i in range(nx):
+      for j in range(nz):
+        self.members.extend(grid.get((i0 + i, j0 + j), []))
+        self.starts.append(len(self.members))
+
+  def update(self, obj):
+    """Rebuild an object's rows and the grid on the next query, after its geometry or position changed"""
+    self.planes.ranges.pop(obj, None)
+    self.key = None
+
+  def __column(self, i, j, j1):
+    """Get the entry numbers of the objects in cells i,j to i,j1, which follow each other in members"""
+    (i0, j0, nx, nz) = self.cells
+    (i, j, j1) = (i - i0, max(j - j0, 0), min(j1 - j0, nz - 1))
+    if i < 0 or i >= nx or j > j1:
+      return ()
+    return self.members[self.starts[i*nz + j]:self.starts[i*nz + j1 + 1]]
+
+  def __check(self, ball):
+    """Rebuild the grid if it was built for a different ball size or height"""
+    y = ball.location[1]
+    if self.key is None or self.key[0] != ball.radius or abs(y - self.key[1]) > self.yTolerance:
+      self.build(ball.radius, y)
+
+  def candidates(self, ball):
+    """Get the objects a ball could be hitting, in brute force search order"""
+    self.__check(ball)
+    loc = ball.location
+    cs = self.cellSize
+    entries = self.entries
+    j = int(math.floor(loc[2]/cs))
+    cell = [entries[k] for k in self.__column(int(math.floor(loc[0]/cs)), j, j)]
+    if self.unbounded:
+      cell = sorted(cell + self.unbounded)
+    return cell
+
+  def near(self, ball, end):
+    """Get the visible objects a ball moving from its location to end could run into"""
+    self.__check(ball)
+    loc = ball.location
+    cs = self.cellSize
+    (j, j1) = (int(math.floor(min(loc[2], end[2])/cs)), int(math.floor(max(loc[2], end[2])/cs)))
+    found = set([order for (order, o) in self.unbounded])
+    for i in range(int(math.floor(min(loc[0], end[0])/cs)), int(math.floor(max(loc[0], end[0])/cs)) + 1):
+      found.update(self.__column(i, j, j1))
+    objs = [self.entries[k][1] for k in sorted(found)]
+    return [o for o in objs if o is not ball and not self.isHidden(o)]
+
+  def isHidden(self, obj):
+    """Check if an object or any of its parents are hidden"""
+    while obj:
+      if obj.hidden:
+        return True
+      obj = obj.parent
+    return False
+
+  def closestSurface(self, ball):
+    """Same result as Ball.getClosestSurface over every object, only checking nearby objects"""
+    objs = [o for (order, o) in self.candidates(ball) if o is not ball and not self.isHidden(o)]
+    return self.planes.closest(objs, ball.location, ball.radius)
+
+  def closestSurfaces(self, balls):
+    """closestSurface of several balls of the same size, with their plane checks batched together"""
+    queries = []
+    for ball in balls:
+      objs = [o for (order, o) in self.candidates(ball) if o is not ball and not self.isHidden(o)]
+      queries.append((objs, ball.location))
+    return self.planes.closestMany(queries, balls[0].radius)
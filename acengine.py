@@ -0,0 +1,384 @@
+
+import copy
+import math
+
+from acloader import *
+from accache import *
+from acgeometry import *
+from acclock import *
+from accollide import *
+from acreplay import *
+from acprofile import *
+
+
+class ACEngine:
+  """Loads a board into objects and runs their physics, without any GL
+
+  This is everything but the window, so boards can be simulated headless.
+  ACRenderer adds the window, and gets to set up and free whatever it needs
+  for drawing through the boardLoading, objectCreated, boardLoaded and
+  releaseObjects hooks.
+  """
+  state = ('steps',)   # Attributes that change as the game runs, saved by checkpoint
+
+  def __init__(self, filename, arrays = False, instancing = False, physicsRate = 200):
+    self.arrays = arrays
+    self.instancing = instancing  # Share geometry between copies of the same mesh
+    self.delta = 1.0/physicsRate   # Seconds each physics step covers, as passed to update functions
+    self.steps = 0      # Physics steps run so far
+    self.alpha = 0.0    # How far between the last two physics steps the current frame falls
+    self.meshes = {}
+    self.dynamic = []   # Objects that move, and so get interpolated between physics steps
+    self.collisions = None    # Grid of where on the board each object can be hit
+    self.replay = None  # ACRecorder or ACReplay that keys and steps go through
+    self.profiler = None  # ACProfiler timing the phases of each frame, if attached
+
+    self.loaders = []
+    self.loadBoard(filename)
+
+  def loadBoard(self, filename):
+    """Replace the current objects with the ones of a board file"""
+    self.releaseObjects(self.loaders)
+    self.meshes = {}
+    self.dynamic = []
+
+    # Load model data, from the compiled cache when possible, creating Python objects as they are parsed
+    loader = ACCachedLoader(filename, arrays=self.arrays, lazy=True)
+    self.boardLoading(loader)
+    self.loaders = self.createObjects(loader.iterObjects())
+    self.collisions = ACCollisionIndex(self.loaders)
+    self.boardLoaded()
+    if self.profiler:
+      self.profiler.attach(self)
+
+  def boardLoading(self, loader):
+    """Hook called with the loader of a board, before its objects are created"""
+    pass
+
+  def objectCreated(self, obj):
+    """Hook called for every object as it is created"""
+    pass
+
+  def boardLoaded(self):
+    """Hook called after all objects of a board are created"""
+    pass
+
+  def releaseObjects(self, objs):
+    """Hook called with the objects of the old board when loading a new one"""
+    pass
+
+  def findMesh(self, obj):
+    """Share the geometry of an object with an earlier copy of it, once its position is known
+
+    Objects with the same key are only shared when the copy's vertices and
+    normals come out exactly the same in world space as the object's own, so
+    collisions work out exactly as without instancing. An object only gets a
+    mesh once a second copy of it turns up.
+    """
+    (key, anchor) = meshKey(obj.vertices, obj.surfaces, obj.texfile)
+    if key is None:
+      return
+
+    candidates = self.meshes.setdefault(key, [])
+    for mesh in candidates:
+      offset = obj.vecSub(anchor, mesh.anchor)
+      if mesh.matches(obj, offset):
+        if not mesh.users:
+          mesh.setSource(mesh.source)
+        obj.meshOffset = offset
+        mesh.share(obj)
+        return
+    candidates.append(ACMesh(obj, anchor))
+
+  def createObjects(self, objs, parent=None):
+    """Create all of the python objects based on object data give"""
+    objects = []
+    for obj in objs:
+      inst = self.getObjectClass(obj)(obj, self)
+      inst.parent = parent
+      inst.position = parent and list(parent.vecAdd(parent.position, inst.location)) or inst.location
+      if self.instancing and inst.static:
+        self.findMesh(inst)
+      self.objectCreated(inst)
+      inst.subobjects = self.createObjects(obj['kids'], inst)
+      inst.computeBounds()
+      if not inst.static:
+        self.dynamic.append(inst)
+      objects.append(inst)
+
+    return objects
+
+  def getObjectClass(self, data):
+    """Callback to decide what type of class should be instantiated, based on object data"""
+    return ACObject
+
+  def step(self):
+    """Run one physics step"""
+    if self.replay:
+      self.replay.stepping(self)
+    [o.saveState() for o in self.dynamic]
+    self.update(self.delta)
+    self.steps += 1
+    if self.replay:
+      self.replay.stepped(self)
+
+  def update(self, time):
+    """Update every object for one physics step"""
+    [l.update(time) for l in self.loaders]
+
+  def simulate(self, steps, inputs = ()):
+    """Run physics steps as fast as possible, with scripted key presses
+
+    inputs is a list of (step, direction, key), each passed to input before
+    that step runs, like a key going down (-1) or up (1) in a window.
+    """
+    inputs = sorted(inputs)
+    i = 0
+    for s in xrange(self.steps, self.steps + steps):
+      while i < len(inputs) and inputs[i][0] <= s:
+        self.input(inputs[i][1], inputs[i][2])
+        i += 1
+      self.step()
+
+  def input(self, direction, key, x = 0, y = 0):
+    """Pass a key going down (-1) or up (1) to keyFunc, unless a replay that is playing holds it back"""
+    if self.replay and not self.replay.input(self, direction, key):
+      return
+    self.keyFunc(direction, key, x, y)
+
+  def keyFunc(self, direction, key, x, y):
+    """Handle a key going down (-1) or up (1)"""
+    pass
+
+  def allObjects(self):
+    """Get every object of the board, parents before their subobjects"""
+    return [o for (order, o) in self.collisions.entries]
+
+  def checkpoint(self):
+    """Save the state attributes of the engine and every object, for restore to go back to"""
+    return [[copy.copy(getattr(o, k)) for k in o.state] for o in [self] + self.allObjects()]
+
+  def restore(self, saved):
+    """Go back to the state saved by checkpoint"""
+    for (o, values) in zip([self] + self.allObjects(), saved):
+      for (k, v) in zip(o.state, values):
+        setattr(o, k, copy.copy(v))
+    [o.saveState() for o in self.dynamic]   # Nothing to draw in between after a jump
+
+class ACObject:
+  """An object of a board, its geometry and where it is
+
+  Drawing is left to ACRenderer, objects only describe how to draw
+  themselves, like the rotation from drawRotation.
+  """
+  static = True   # Object never moves or hides, so the batch backend can draw it
+  collides = True # A ball can run into the object, balls themselves only collide with each other
+  state = ('location', 'hidden', 'rotation')   # Attributes that change as the game runs
+
+  def __init__(self, data, engine):
+    self.debug = False
+    self.hidden = False
+    self.showNormal = False
+    self.useDisplaylist = True
+    if data.has_key('name'):
+      self.name = data['name']
+    else:
+      self.name = '__blank__'
+    self.engine = engine
+    self.moving = False
+    self.location = list(data['loc'])
+    self.prevLocation = None  # location before the last physics step
+    self.type = data['type']
+    self.vertices = data['verts']
+    self.texture = None       # ACTexture the renderer loaded the texture file into
+    self.texfile =  data.has_key('texture') and data['texture'] or ''
+
+    self.surfaces = data['surfaces']
+    self.geometry = data.get('geometry') # ACGeometry arrays backing vertices and surfaces, if loaded in array mode
+    self.subobjects = []
+    self.batched = False          # Drawn by the renderer's batch backend
+    self.subtreeBatched = False   # Object and all subobjects drawn by the batch backend
+    self.mesh = None              # Mesh shared with identical copies of this object
+    self.meshOffset = (0, 0, 0)   # Translation from the shared mesh to this object's vertices
+    self.rotation = 0.0           # Angle in radians the object is turned by about the y axis, through its position
+    self.prevRotation = 0.0       # rotation before the last physics step
+
+    self.processSurfaces()
+
+  def processSurfaces(self):
+    """Go through the object's surfaces and calculate normals, centers and object centroid"""
+
+    vs = self.getVertices() # Use vertex function to allow for transformed coorditates from paddle
+
+    nv = len(vs)
+    if nv == 0:
+      return
+
+    # Array geometry does the same calculations on all surfaces at once
+    if self.geometry is not None:
+      self.centroid = self.geometry.process(vs)
+      return
+
+    # Calculate the centroid of the object
+    x = y = z = 0
+    for i,j,k in vs:
+      x += i
+      y += j
+      z += k
+    self.centroid = ( x/nv, y/nv, z/nv )
+
+    for s in self.surfaces:
+      nv = len(s['refs'])
+
+      # can only calculate normal if there are > 2 vertices
+      if nv > 2:
+        r = s['refs']
+
+        v0 = vs[r[0][0]]
+        v1 = vs[r[1][0]]
+        v2 = vs[r[2][0]]
+
+        # Calculate normal using cross product of first three vertices
+        vn1 = self.vecSub(v0, v1)
+        vn2 = self.vecSub(v0, v2)
+        n = self.vecCross(vn1, vn2)
+        s['norm'] = self.vecNorm(n)
+
+        # Calculate the center of the surface, used when displaying normals
+        tot = (0,0,0)
+        for r in s['refs']:
+          tot = self.vecAdd(vs[r[0]], tot)
+        s['center'] = self.vecMult(tot, 1.0/len(s['refs']))
+
+      else:
+        s['norm'] = (0,0,0)
+        s['center'] = (0,0,0)
+
+  def getVertices(self):
+    """Placeholder vertices lookup"""
+    return self.vertices
+
+  def vecNorm(self, vec):
+    """Normalize a given vector"""
+    len = abs(math.sqrt(sum([i**2 for i in vec])))
+    if len == 0:
+      return (0,0,0)
+    return tuple([i/len for i in vec])
+
+  def vecSub(self, v1, v2):
+    """Subtract two vectors"""
+    return ( v1[0]-v2[0], v1[1]-v2[1], v1[2]-v2[2] )
+  def vecAdd(self, v1, v2):
+    """Add two vectors"""
+    return ( v1[0]+v2[0], v1[1]+v2[1], v1[2]+v2[2] )
+  def vecMult(self, v, n):
+    """Multiply a vector with a scalar"""
+    return ( v[0]*n, v[1]*n, v[2]*n )
+  def vecCross(self, v1, v2):
+    """Calculate the cross product of two vectors"""
+    return ( v1[1]*v2[2] - v1[2]*v2[1], v1[2]*v2[0] - v1[0]*v2[2], v1[0]*v2[1] - v1[1]*v2[0])
+  def vecDot(self, v1, v2):
+    """Calculate the dot product of two vectors"""
+    return v1[0]*v2[0] + v1[1]*v2[1] + v1[2]*v2[2]
+  def vecMag(self, v):
+    """Calculate the magnitude of a vector"""
+    return abs(math.sqrt(sum([i**2 for i in v])))
+
+  def localPoint(self, p):
+    """Turn a world space point into the object's unrotated frame, where its vertices and surfaces are"""
+    if not self.rotation:
+      return p
+    (c, s) = (math.cos(self.rotation), math.sin(self.rotation))
+    (x, z) = (p[0] - self.position[0], p[2] - self.position[2])
+    return (self.position[0] + x*c + z*s, p[1], self.position[2] - x*s + z*c)
+
+  def worldSurface(self, surface):
+    """Get a surface with its normal turned by the object's rotation, for use outside of the object's frame"""
+    if not self.rotation:
+      return surface
+    (c, s) = (math.cos(self.rotation), math.sin(self.rotation))
+    n = surface['norm']
+    return {'norm': (n[0]*c - n[2]*s, n[1], n[0]*s + n[2]*c), 'refs': surface['refs'], 'surface': surface}
+
+  def computeBounds(self):
+    """Calculate the bounding spheres of the object and its subtree, relative to its location"""
+    verts = self.getVertices()
+    if self.static:
+      self.bounds = boundingSphere(verts, self.meshOffset)
+    elif len(verts):
+      # Moving objects rotate around their location, so use a sphere around it that covers every angle
+      self.bounds = ((0, 0, 0), max([self.vecMag(v) for v in verts]))
+    else:
+      self.bounds = None
+
+    kids = self.subobjects
+    self.subtreeStatic = self.static and not [k for k in kids if not k.subtreeStatic]
+    self.subtreeBounds = enclosingSphere([self.bounds] + [k.subtreeBounds and (self.vecAdd(k.location, k.subtreeBounds[0]), k.subtreeBounds[1]) for k in kids])
+    self.subtreeCount = (len(self.surfaces) and 1 or 0) + sum([k.subtreeCount for k in kids])
+
+  def update(self, time):
+    """Update the object's position based on a given passed time"""
+    [obj.update(time) for obj in self.subobjects]
+
+  def saveState(self):
+    """Remember the state before a physics step, so frames can be drawn between steps"""
+    self.prevLocation = self.location
+    self.prevRotation = self.rotation
+
+  def lerp(self, prev, cur):
+    """Interpolate a value between the last two physics steps for the current frame"""
+    return prev + (cur - prev)*self.engine.alpha
+
+  def renderLocation(self):
+    """Get the location to draw the object at for the current frame"""
+    if self.prevLocation is None:
+      return self.location
+    return [self.lerp(p, c) for (p, c) in zip(self.prevLocation, self.location)]
+
+  def drawRotation(self):
+    """Get the (angle in degrees, axis) to turn the object by when drawing the current frame, or None"""
+    if not (self.rotation or self.prevRotation):
+      return None
+    return (-1*math.degrees(self.lerp(self.prevRotation, self.rotation)), (0.0, 1.0, 0.0))
+
+class ACMesh:
+  """Geometry, surfaces and display list shared by objects that are translated copies of each other"""
+  def __init__(self, source, anchor):
+    self.source = source    # first object with this geometry, it keeps its own
+    self.anchor = anchor    # first vertex of the source object
+    self.users = 0          # number of objects using the mesh, none until a second copy turns up
+    self.displaylist = None # display list the renderer built for the mesh
+
+  def matches(self, obj, offset):
+    """Check an object is exactly the source moved by offset, the way collisions see its vertices and normals"""
+    src = self.source
+    (a, b) = [numpy is not None and isinstance(v, numpy.ndarray) and v.tolist() or v for v in (src.vertices, obj.vertices)]
+    p = obj.position
+    q = obj.vecAdd(p, offset)
+    for (u, v) in zip(a, b):
+      if (q[0] + u[0], q[1] + u[1], q[2] + u[2]) != (p[0] + v[0], p[1] + v[1], p[2] + v[2]):
+        return False
+
+    if src.geometry is not None:
+      return numpy.array_equal(src.geometry.norms, obj.geometry.norms)
+    return [s.get('norm') for s in src.surfaces] == [s.get('norm') for s in obj.surfaces]
+
+  def setSource(self, obj):
+    """Take the processed geometry, and any display list, of the first object with this mesh"""
+    self.vertices = obj.vertices
+    self.surfaces = obj.surfaces
+    self.geometry = obj.geometry
+    self.centroid = getattr(obj, 'centroid', None)
+    self.displaylist = getattr(obj, 'displaylist', None)
+    obj.mesh = self
+    self.users = 1
+
+  def share(self, obj):
+    """Point an object at the shared geometry instead of its own copy"""
+    obj.vertices = self.vertices
+    obj.surfaces = self.surfaces
+    obj.geometry = self.geometry
+    if self.centroid:
+      obj.centroid = obj.vecAdd(self.centroid, obj.meshOffset)
+    obj.mesh = self
+    self.users += 1
@@ -1,44 +1,53 @@
 
-from acrenderer import *
+from acengine import *
+from aclog import *
 
 
-class ACGame(ACRenderer):
-  """Game specific class that builds functionality on the static renderer"""
-  def __init__(self, filename, width = 800, height=600, title='ACGame', wireframe=False):
+class ACGame(ACEngine):
+  """Game specific class that builds functionality on the engine, still without any GL"""
+  state = ACEngine.state + ('score',)
+
+  def __init__(self, filename, arrays=False, instancing=False, physicsRate=200):
     self.keypress = []  # List of functions to trigger when key is pressed
     self.score = 0      # The current game score
+    self.events = None  # List to record (step, event, object name) in, when set
+    self.log = None     # ACEventLog to stream events to, when set
 
-    ACRenderer.__init__(self, filename, width, height, title, wireframe)
-
-    # Configure basic overhead light
-    glLightfv(GL_LIGHT2, GL_AMBIENT, (0.2, 0.2, 0.2, 1.0))
-    glLightfv(GL_LIGHT2, GL_DIFFUSE, (0.5, 0.5, 0.5, 1.0))
-    glLightfv(GL_LIGHT2, GL_SPECULAR, (1.0, 1.0, 1.0, 1.0))
-    glEnable(GL_LIGHT2)
+    ACEngine.__init__(self, filename, arrays, instancing, physicsRate)
 
-  def render(self):
-    # Render light above current view location
-    glLightfv(GL_LIGHT2, GL_POSITION, (0, 4.24, 4.24))
-    ACRenderer.render(self)
+  def loadBoard(self, filename):
+    """Drop the key callbacks of the old board's objects before loading a new one"""
+    self.keypress = []
+    ACEngine.loadBoard(self, filename)
 
   def keyFunc(self, direction, key, x, y):
     """When a key is pressed, we call and object callbacks that registered a keypress callback"""
     [f(direction, key, x, y) for f in self.keypress]
-    ACRenderer.keyFunc(self, direction, key, x, y)
 
   def getObjectClass(self, dat):
     """Override basic object so all objects are ACGameObjects"""
-    c = ACRenderer.getObjectClass(self, dat)
+    c = ACEngine.getObjectClass(self, dat)
     if c == ACObject:
       return ACGameObject
     return c
 
-  def addPoints(self, points):
+  def addPoints(self, points, obj = None):
     """Add to total score"""
     self.score += points
+    if points:
+      self.event('score', obj, points)
+
+  def event(self, name, obj = None, value = 0):
+    """Record something that happened, to an object if there is one, if events are being recorded or logged"""
+    if self.events is not None:
+      self.events.append((self.steps, name, obj and obj.name or ''))
+    if self.log:
+      self.log.log(self.steps, name, obj and obj.name or '', value)
 
 class ACGameObject(ACObject):
   """Base game object class that handles points and animating motion due to velocity"""
+  state = ACObject.state + ('velocity', 'points')
+
   def __init__(self, data, r):
     ACObject.__init__(self, data, r)
 
@@ -53,11 +62,15 @@ class ACGameObject(ACObject):
 
   def hitBy(self, object, surface):
     """Record points due to a hit"""
-    self.renderer.addPoints(self.points)
+    self.engine.addPoints(self.points, self)
+
+  def pointVelocity(self, point):
+    """Velocity of a point on the object, for working out bounces"""
+    return self.velocity
 
   def update(self, time):
-    """Update location based on velocity and time"""
-    self.location = self.vecAdd(self.location, self.vecMult(self.velocity, time.microseconds/1000000.0))
+    """Update location based on velocity and the seconds passed"""
+    self.location = self.vecAdd(self.location, self.vecMult(self.velocity, time))
 
     [child.update(time) for child in self.subobjects]
 
@@ -0,0 +1,223 @@
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+class ACSurface:
+  """Light-weight view of one surface of an ACGeometry
+
+  Supports the same keys as the surface dicts built by ACLoader, so code
+  like hitBy can take either one.
+  """
+
+  def __init__(self, geometry, index):
+    self.geometry = geometry
+    self.index = index
+
+  def __getitem__(self, key):
+    g = self.geometry
+    i = self.index
+    if key == 'norm':
+      return tuple(g.norms[i].tolist())
+    elif key == 'center':
+      return tuple(g.centers[i].tolist())
+    elif key == 'refs':
+      (a, b) = (g.offsets[i], g.offsets[i+1])
+      return zip(g.refs[a:b].tolist(), g.uvs[a:b, 0].tolist(), g.uvs[a:b, 1].tolist())
+    elif key == 'type':
+      return int(g.types[i])
+    elif key == 'mat' and g.mats[i] >= 0:
+      return int(g.mats[i])
+    elif key == 'material' and g.mats[i] >= 0:
+      return g.materials[g.mats[i]]
+    raise KeyError(key)
+
+  def has_key(self, key):
+    try:
+      self[key]
+    except KeyError:
+      return False
+    return True
+
+  def get(self, key, default = None):
+    try:
+      return self[key]
+    except KeyError:
+      return default
+
+  def __eq__(self, other):
+    return isinstance(other, ACSurface) and other.geometry is self.geometry and other.index == self.index
+
+  def __ne__(self, other):
+    return not self == other
+
+
+class ACGeometry:
+  """Struct-of-arrays geometry for a single object
+
+  verts is an (n, 3) float array. Surface i uses refs[offsets[i]:offsets[i+1]]
+  as vertex indices, with matching rows of uvs. norms and centers hold one
+  row per surface and are filled in by process(). The geometry also acts as
+  a sequence of ACSurface views so it can stand in for the surface list.
+  """
+
+  def __init__(self, verts, refs, offsets, uvs, types, mats, materials):
+    if numpy is None:
+      raise ImportError("Array geometry needs the python-numpy package installed")
+
+    self.verts = verts
+    self.refs = refs
+    self.offsets = offsets
+    self.uvs = uvs
+    self.types = types
+    self.mats = mats
+    self.materials = materials
+    self.counts = numpy.diff(offsets)
+    self.norms = numpy.zeros((len(types), 3))
+    self.centers = numpy.zeros((len(types), 3))
+
+  @classmethod
+  def fromLists(cls, verts, surfaces, materials):
+    """Build geometry from the vertex tuples and surface dicts made by ACLoader"""
+    if numpy is None:
+      raise ImportError("Array geometry needs the python-numpy package installed")
+
+    offsets = [0]
+    refs = []
+    uvs = []
+    for s in surfaces:
+      for r in s['refs']:
+        refs.append(r[0])
+        uvs.append(r[1:3])
+      offsets.append(len(refs))
+
+    return cls(numpy.asarray(verts, dtype=numpy.float64).reshape((-1, 3)),
+               numpy.array(refs, dtype=numpy.int32),
+               numpy.array(offsets, dtype=numpy.int32),
+               numpy.array(uvs, dtype=numpy.float64).reshape((-1, 2)),
+               numpy.array([s['type'] for s in surfaces], dtype=numpy.int32),
+               numpy.array([s.get('mat', -1) for s in surfaces], dtype=numpy.int32),
+               materials)
+
+  def __len__(self):
+    return len(self.types)
+
+  def __getitem__(self, i):
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError(i)
+    return ACSurface(self, i)
+
+  def __iter__(self):
+    return (ACSurface(self, i) for i in xrange(len(self)))
+
+  def firstVerts(self, verts = None):
+    """Get the first vertex of every surface as an (nsurf, 3) array"""
+    if verts is None:
+      verts = self.verts
+    return numpy.asarray(verts)[self.refs[self.offsets[:-1]]]
+
+  def process(self, verts = None):
+    """Calculate the surface normals and centers and return the object centroid"""
+    if verts is None:
+      verts = self.verts
+    verts = numpy.asarray(verts, dtype=numpy.float64)
+    if len(verts) == 0:
+      return None
+
+    self.norms[:] = 0
+    self.centers[:] = 0
+
+    # can only calculate normal if there are > 2 vertices
+    full = numpy.nonzero(self.counts > 2)[0]
+    if len(full):
+      start = self.offsets[full]
+      v0 = verts[self.refs[start]]
+      n = numpy.cross(v0 - verts[self.refs[start + 1]], v0 - verts[self.refs[start + 2]])
+      mag = numpy.sqrt((n*n).sum(axis=1))
+      mag[mag == 0] = numpy.inf   # zero length normals stay (0, 0, 0)
+      self.norms[full] = n/mag[:, None]
+
+      tot = numpy.add.reduceat(verts[self.refs], self.offsets[:-1][self.counts > 0], axis=0)
+      centers = numpy.zeros((len(self), 3))
+      centers[self.counts > 0] = tot
+      self.centers[full] = centers[full]/self.counts[full][:, None]
+
+    return tuple(verts.mean(axis=0).tolist())
+
+
+def meshKey(verts, surfaces, texture = None, places = 6):
+  """Get a key that is the same for meshes that only differ by a translation
+
+  Returns the key and the first vertex, which the mesh is anchored to. The key
+  is None for objects without vertices. Rounding makes the key the same for
+  copies that are only close to each other, so it only finds candidates to be
+  checked exactly.
+  """
+  if len(verts) == 0:
+    return (None, None)
+
+  v0 = tuple([float(x) for x in verts[0]])
+  shape = tuple([round(v[i] - v0[i], places) for v in verts for i in range(3)])
+
+  if isinstance(surfaces, ACGeometry):
+    g = surfaces
+    faces = tuple([a.tostring() for a in (g.refs, g.offsets, g.types, g.mats, g.uvs)])
+  else:
+    faces = tuple([(s['type'], s.get('mat', -1), tuple(s['refs'])) for s in surfaces])
+
+  return ((texture, shape, faces), v0)
+
+
+def boundingSphere(verts, offset = (0, 0, 0)):
+  """Get a sphere around vertices, as a center and radius. Returns None if there are no vertices"""
+  if len(verts) == 0:
+    return None
+
+  lo = [min([v[i] for v in verts]) for i in range(3)]
+  hi = [max([v[i] for v in verts]) for i in range(3)]
+  c = tuple([(lo[i] + hi[i])/2.0 for i in range(3)])
+  r = max([((v[0]-c[0])**2 + (v[1]-c[1])**2 + (v[2]-c[2])**2) for v in verts])**0.5
+  return (tuple([c[i] + offset[i] for i in range(3)]), r)
+
+def enclosingSphere(spheres):
+  """Get a sphere around a list of spheres, skipping any that are None"""
+  spheres = [s for s in spheres if s]
+  if not spheres:
+    return None
+
+  lo = [min([c[i] - r for (c, r) in spheres]) for i in range(3)]
+  hi = [max([c[i] + r for (c, r) in spheres]) for i in range(3)]
+  center = tuple([(lo[i] + hi[i])/2.0 for i in range(3)])
+  r = max([((c[0]-center[0])**2 + (c[1]-center[1])**2 + (c[2]-center[2])**2)**0.5 + r for (c, r) in spheres])
+  return (center, r)
+
+
+class ACFrustum:
+  """Planes of a view frustum, in the coordinates the GL matrices were read in
+
+  Matrices are flat column major lists of 16 numbers, as GL returns them.
+  """
+
+  def __init__(self, proj, model):
+    # clip matrix = projection * modelview
+    c = [sum([proj[k*4 + r]*model[col*4 + k] for k in range(4)]) for col in range(4) for r in range(4)]
+    rows = [[c[col*4 + r] for col in range(4)] for r in range(4)]
+
+    # left, right, bottom, top, near and far planes
+    self.planes = []
+    for i in range(3):
+      for sign in (1, -1):
+        p = [rows[3][j] + sign*rows[i][j] for j in range(4)]
+        mag = (p[0]**2 + p[1]**2 + p[2]**2)**0.5 or 1.0
+        self.planes.append(tuple([x/mag for x in p]))
+
+  def sphereVisible(self, c, r):
+    """Check if any part of a sphere is inside the frustum"""
+    for (a, b, d, e) in self.planes:
+      if a*c[0] + b*c[1] + d*c[2] + e < -r:
+        return False
+    return True
@@ -1,12 +1,63 @@
 
 import sys
+from itertools import islice
 
+from acgeometry import ACGeometry, numpy
 
 
 class ACFormatError(Exception): pass
 
+class ACObjectStream:
+  """Lazily parsed run of objects, used for the kids of objects from a lazy ACLoader
+
+  Objects are parsed from the file as the stream is iterated. Moving on to the
+  next object first finishes parsing the rest of the previous object's kids, so
+  a lazy board has to be read in file order. When the loader keeps objects,
+  iterating a finished stream again replays them.
+  """
+
+  def __init__(self, loader, num):
+    self.loader = loader
+    self.num = num
+    self.count = 0      # number of objects parsed so far
+    self.last = None    # most recently parsed object
+    self.objects = []   # parsed objects, only filled when the loader keeps them
+
+  def __len__(self):
+    return self.num
+
+  def __iter__(self):
+    if self.count == self.num and self.loader.keep:
+      return iter(self.objects)
+    return self
+
+  def next(self):
+    self.__finishLast()
+    if self.count == self.num:
+      raise StopIteration
+
+    self.last = self.loader.readObject()
+    self.count += 1
+    if self.loader.keep:
+      self.objects.append(self.last)
+    return self.last
+
+  def __finishLast(self):
+    """Parse whatever was not read of the last object's kids"""
+    if self.last is not None and isinstance(self.last.get('kids'), ACObjectStream):
+      self.last['kids'].drain()
+
+  def drain(self):
+    """Parse the rest of the stream"""
+    for obj in self:
+      pass
+
 class ACLoader:
-  def __init__(self, name):
+  def __init__(self, name, arrays = False, fast = True, lazy = False, keep = True):
+    self.arrays = arrays  # Store geometry as ACGeometry arrays instead of tuples and dicts
+    self.fast = fast      # Convert whole vertex and ref blocks at once instead of line by line
+    self.lazy = lazy      # Parse objects only as iterObjects and the kids streams are read
+    self.keep = keep      # Keep lazily parsed kids so they can be iterated again
     self.materials = []
     self.objects = []
     self.file = file(name)
@@ -14,15 +65,30 @@ class ACLoader:
     if not self.file.readline().strip() == "AC3Db":
       raise ACFormatError("File is not an AC3D file")
 
+    if not lazy:
+      self.objects = list(self.iterObjects())
+
+  def iterObjects(self):
+    """Parse and yield top level objects one at a time
+
+    For a lazy loader, each object's kids are an ACObjectStream that parses
+    them on demand. This can only be iterated once for a given loader.
+    """
     for line in self.file:
       line = line.strip()
       if not self.__parseMaterial(line):
         obj = self.__parseObject(line)
         if obj:
-          self.objects.append(obj)
+          yield obj
+          if isinstance(obj.get('kids'), ACObjectStream):
+            obj['kids'].drain()
         else:
           raise ACFormatError("Error: Expecting material or object")
 
+  def readObject(self):
+    """Parse the object starting on the next line of the file"""
+    return self.__parseObject(self.file.next())
+
   def __parseMaterial(self, line):
     """Parse MATERIAL data from a given line, if it is there"""
     if line.startswith('MATERIAL'):
@@ -70,9 +136,17 @@ class ACLoader:
         elif line.startswith('numsurf'):
           obj['surfaces'] = self.__parseSurfaces(int(line.split()[1]))
         elif line.startswith('kids'):
-          obj['kids'] = self.__parseObjects(int(line.split(' ', 1)[1]))
+          if self.lazy:
+            obj['kids'] = ACObjectStream(self, int(line.split(' ', 1)[1]))
+          else:
+            obj['kids'] = self.__parseObjects(int(line.split(' ', 1)[1]))
           break
 
+      if self.arrays:
+        obj['geometry'] = ACGeometry.fromLists(obj['verts'], obj['surfaces'], self.materials)
+        obj['verts'] = obj['geometry'].verts
+        obj['surfaces'] = obj['geometry']
+
       return obj
 
   def __parseSurface(self):
@@ -89,32 +163,105 @@ class ACLoader:
       surf['material'] = self.materials[surf['mat']]
       line = self.file.next()
     if line.startswith('refs'):
-      refs = []
-      for i in range(int(line.split()[1])):
-        nums = self.file.next().split()
-        refs.append((int(nums[0]), float(nums[1]), float(nums[2])))
-      surf['refs'] = refs
+      surf['refs'] = self.__parseRefs(int(line.split()[1]))
     else:
       raise ACFormatError('Missing surface refs')
 
     return surf
 
+  def __readLines(self, num):
+    """Read a block of lines in one go"""
+    lines = list(islice(self.file, num))
+    if len(lines) != num:
+      raise ACFormatError("Unexpected end of file")
+    return lines
+
+  def __parseRefs(self, num):
+    """Parse surface refs one line at a time"""
+    refs = []
+    for i in range(num):
+      nums = self.file.next().split()
+      refs.append((int(nums[0]), float(nums[1]), float(nums[2])))
+    return refs
+
   def __parseVerts(self, num):
     """Parse vertices"""
+    if self.fast:
+      return self.__convertVerts(self.__readLines(num))
+
     verts = []
     for i in range(num):
       verts.append(tuple([float(x) for x in self.file.next().strip().split()]))
 
     return verts
 
+  def __convertVerts(self, lines):
+    """Convert a block of vertex lines in one step"""
+    text = ' '.join(lines)
+    if self.arrays:
+      nums = numpy.fromstring(text, sep=' ')
+    else:
+      nums = map(float, text.split())
+    if len(nums) != 3*len(lines):
+      # Not exactly three numbers per line, fall back to converting line by line
+      return [tuple([float(x) for x in l.split()]) for l in lines]
+    if self.arrays:
+      return nums.reshape((-1, 3))
+    return zip(nums[0::3], nums[1::3], nums[2::3])
+
   def __parseSurfaces(self, num):
     """Parse surfaces"""
+    if self.fast:
+      return self.__convertSurfaces(num)
+
     surfs = []
     for line in range(num):
       surfs.append(self.__parseSurface())
 
     return surfs
 
+  def __convertSurfaces(self, num):
+    """Parse a block of surfaces, gathering every ref line and converting them all in one step"""
+    surfs = []
+    counts = []
+    lines = []
+    for i in range(num):
+      header = self.file.next()
+      if not header.startswith('SURF'):
+        raise ACFormatError("Missing surface header")
+
+      surf = { 'type': int(header.split()[1], 16) }
+
+      line = self.file.next()
+      if line.startswith('mat'):
+        surf['mat'] = int(line.split()[1])
+        surf['material'] = self.materials[surf['mat']]
+        line = self.file.next()
+      if not line.startswith('refs'):
+        raise ACFormatError('Missing surface refs')
+
+      n = int(line.split()[1])
+      lines.extend(islice(self.file, n))
+      counts.append(n)
+      surfs.append(surf)
+
+    if len(lines) != sum(counts):
+      raise ACFormatError("Unexpected end of file")
+
+    nums = ' '.join(lines).split()
+    if len(nums) == 3*len(lines):
+      refs = zip(map(int, nums[0::3]), map(float, nums[1::3]), map(float, nums[2::3]))
+    else:
+      # Not exactly three numbers per line, fall back to converting line by line
+      refs = [(int(n[0]), float(n[1]), float(n[2])) for n in [l.split() for l in lines]]
+
+    pos = 0
+    for (surf, n) in zip(surfs, counts):
+      surf['refs'] = refs[pos:pos + n]
+      pos += n
+
+    return surfs
+
   def __parseObjects(self, num):
     """Parse all objects"""
     objs = []
@@ -127,10 +274,18 @@ if __name__ == "__main__":
     print "Usage: acloader.py <filename>"
     sys.exit(0)
 
-  print "Loading %s" % sys.argv[1]
-  tmp = ACLoader(sys.argv[1])
-  print "Loaded properly"
-
   import pprint
   pp = pprint.PrettyPrinter(indent=2)
-  pp.pprint(tmp.objects)
+
+  def show(obj, depth):
+    """Print an object, then stream its kids so only one branch of the tree is in memory"""
+    data = dict([(k, v) for (k, v) in obj.items() if k != 'kids'])
+    print '\n'.join([' '*depth + l for l in pp.pformat(data).split('\n')])
+    for kid in obj.get('kids', []):
+      show(kid, depth + 4)
+
+  print "Loading %s" % sys.argv[1]
+  tmp = ACLoader(sys.argv[1], lazy=True, keep=False)
+  for obj in tmp.iterObjects():
+    show(obj, 0)
+  print "Loaded properly"
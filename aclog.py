@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""Reads back a game event log
+
+Usage: python aclog.py [options] log-file
+
+Options:
+ -d, --dump             Print every event instead of counts
+ -h, --help             Display this menu
+
+Counts the events of each kind, and of each kind on each object. Events
+left out by a rate limit are counted in 'suppressed' events, and ones lost
+because the writer fell behind in 'dropped' events.
+"""
+
+import sys
+import struct
+import getopt
+import threading
+
+
+LOG_MAGIC = 'ACL1'
+HEADER = struct.Struct('<4s')      # magic
+NAME = struct.Struct('<cHB')      # 'N', id, length of the name that follows
+EVENT = struct.Struct('<cIHHi')   # 'E', physics step, kind id, object name id, value
+
+
+class ACEventLog:
+  """Streams game events to a compact binary file, without holding up the game
+
+  log only puts the event in a ring buffer of capacity events. A background
+  thread writes the buffer out in batches, when batch events are waiting or
+  every interval seconds. If the game gets so far ahead that the buffer is
+  full, the oldest events are overwritten and counted in a 'dropped' event.
+
+  limits caps how many events of a kind are kept per second of game time,
+  as {kind: count} with rate physics steps a second. The events of a kind
+  left out in a second are written as one 'suppressed' event, with the kind
+  as its name and the count as its value.
+
+  Kinds and object names are written once and then referred to by number.
+  """
+
+  def __init__(self, filename, rate = 200, limits = None, capacity = 65536, batch = 1024, interval = 0.5):
+    self.rate = rate
+    self.limits = limits or {}
+    self.capacity = capacity
+    self.batch = batch
+    self.interval = interval
+    self.ring = [None]*capacity
+    self.written = 0        # Events put in the ring so far
+    self.flushed = 0        # Events taken out of the ring by the writer, or overwritten
+    self.dropped = 0        # Events overwritten since the writer last got to the ring
+    self.windows = {}       # kind -> [first step of the second, events kept, events left out]
+    self.ids = {}           # name -> id in the file
+    self.lock = threading.Lock()
+    self.wake = threading.Event()
+    self.closing = False
+
+    self.file = open(filename, 'wb')
+    self.file.write(HEADER.pack(LOG_MAGIC))
+    self.thread = threading.Thread(target=self.__run)
+    self.thread.daemon = True   # An unclosed log doesn't keep the program running
+    self.thread.start()
+
+  def log(self, step, kind, name = '', value = 0):
+    """Add an event at a physics step, on the object with name"""
+    limit = self.limits.get(kind)
+    if limit is not None and not self.__allow(step, kind, limit):
+      return
+    self.__put((step, kind, name, value))
+
+  def __allow(self, step, kind, limit):
+    """Count an event against its kind's limit, returns if it is kept"""
+    w = self.windows.get(kind)
+    if w is None or step - w[0] >= self.rate:
+      if w and w[2]:
+        self.__put((step, 'suppressed', kind, w[2]))
+      w = self.windows[kind] = [step, 0, 0]
+    if w[1] >= limit:
+      w[2] += 1
+      return False
+    w[1] += 1
+    return True
+
+  def __put(self, event):
+    """Add an event to the ring, overwriting the oldest one if it is full"""
+    self.lock.acquire()
+    try:
+      if self.written - self.flushed >= self.capacity:
+        self.flushed += 1
+        self.dropped += 1
+      self.ring[self.written % self.capacity] = event
+      self.written += 1
+      waiting = self.written - self.flushed
+    finally:
+      self.lock.release()
+    if waiting >= self.batch:
+      self.wake.set()
+
+  def __take(self):
+    """Take every event waiting in the ring"""
+    self.lock.acquire()
+    try:
+      events = [self.ring[i % self.capacity] for i in xrange(self.flushed, self.written)]
+      self.flushed = self.written
+      if self.dropped:
+        events.append((events and events[-1][0] or 0, 'dropped', '', self.dropped))
+        self.dropped = 0
+    finally:
+      self.lock.release()
+    return events
+
+  def __id(self, name, out):
+    """Get the number of a name, adding a record for it the first time"""
+    i = self.ids.get(name)
+    if i is None:
+      i = self.ids[name] = len(self.ids)
+      data = name[:255]
+      out.append(NAME.pack('N', i, len(data)) + data)
+    return i
+
+  def __write(self, events):
+    """Write a batch of events to the file"""
+    out = []
+    for (step, kind, name, value) in events:
+      (k, n) = (self.__id(kind, out), self.__id(name, out))
+      out.append(EVENT.pack('E', step, k, n, value))
+    self.file.write(''.join(out))
+    self.file.flush()
+
+  def __run(self):
+    """Writer thread, writes out the ring whenever it is woken or the interval passes"""
+    while True:
+      self.wake.wait(self.interval)
+      self.wake.clear()
+      closing = self.closing
+      events = self.__take()
+      if events:
+        self.__write(events)
+      if closing:
+        break
+
+  def close(self):
+    """Write out the suppressed counts and every event left, and close the file"""
+    if self.closing:
+      return
+    for (kind, w) in sorted(self.windows.items()):
+      if w[2]:
+        self.__put((w[0] + self.rate - 1, 'suppressed', kind, w[2]))
+    self.closing = True
+    self.wake.set()
+    self.thread.join()
+    self.file.close()
+
+
+def readLog(filename):
+  """Get the (step, kind, name, value) of every event in a log file, stopping at one cut short"""
+  data = open(filename, 'rb').read()
+  if len(data) < HEADER.size or HEADER.unpack_from(data)[0] != LOG_MAGIC:
+    raise ValueError("%s is not an event log" % filename)
+
+  names = {}
+  events = []
+  pos = HEADER.size
+  while pos < len(data):
+    if data[pos] == 'N':
+      if pos + NAME.size > len(data):
+        break
+      (t, i, length) = NAME.unpack_from(data, pos)
+      pos += NAME.size
+      names[i] = data[pos:pos + length]
+      pos += length
+    else:
+      if pos + EVENT.size > len(data):
+        break
+      (t, step, kind, name, value) = EVENT.unpack_from(data, pos)
+      pos += EVENT.size
+      events.append((step, names[kind], names[name], value))
+  return events
+
+
+if __name__ == "__main__":
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'dh', ["dump", "help"])
+  except getopt.GetoptError:
+    print __doc__
+    sys.exit(2)
+
+  dump = False
+  for opt, arg in opts:
+    if opt in ('-d', '--dump'):
+      dump = True
+    elif opt in ('-h', '--help'):
+      print __doc__
+      sys.exit()
+
+  if len(args) != 1:
+    print __doc__
+    sys.exit(2)
+
+  events = readLog(args[0])
+  if dump:
+    for (step, kind, name, value) in events:
+      print "%8d %-12s %-20s %d" % (step, kind, name, value)
+    sys.exit()
+
+  kinds = {}
+  objects = {}
+  for (step, kind, name, value) in events:
+    kinds[kind] = kinds.get(kind, 0) + 1
+    if name:
+      # Suppressed events are named after the kind left out, and count how many were
+      objects[(kind, name)] = objects.get((kind, name), 0) + (kind == 'suppressed' and value or 1)
+
+  print "%d events, steps %d to %d" % (len(events), events and events[0][0] or 0, events and events[-1][0] or 0)
+  for kind in sorted(kinds):
+    print "%-12s %8d" % (kind, kinds[kind])
+  for (kind, name) in sorted(objects):
+    print "  %-12s %-20s %8d" % (kind, name, objects[(kind, name)])
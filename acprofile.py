@@ -0,0 +1,142 @@
+
+import json
+import collections
+
+from acclock import *
+
+
+def percentile(samples, p):
+  """Get the nearest rank percentile p, from 0 to 100, of sorted samples"""
+  return samples[min(len(samples) - 1, int(len(samples)*p/100.0))]
+
+
+class ACProfiler:
+  """Times the phases of every frame, to see where the time of a slow frame went
+
+  Phases are spans opened with begin and closed with end, and they nest. Each
+  phase is charged only the time spent in it outside of the phases inside it,
+  so the phases of a frame add up to the frame. The engine and renderer only
+  call into the profiler when one is attached, so it costs nothing while off.
+
+  attach also times the update of every object, and the collision queries,
+  as phases named after the object's class, by wrapping those methods of
+  each instance. Wrapped methods are put back by detach.
+
+  The totals of the last window frames are kept for rolling percentiles.
+  When tracing, the spans down to traceDepth deep are kept as Chrome trace
+  events, with a counter event per frame holding every phase's total, for
+  writeTrace to save and chrome://tracing or Perfetto to open.
+  """
+
+  def __init__(self, window = 300, refresh = 30, trace = False, traceDepth = 2, maxEvents = 1000000):
+    self.window = window
+    self.refresh = refresh  # Frames between working out the percentiles again for summary
+    self.frames = collections.deque(maxlen=window)  # {phase: seconds} of each recent frame
+    self.current = {}       # {phase: seconds} of the frame in progress
+    self.stack = []         # [phase, start, seconds in nested phases] of the open spans
+    self.trace = trace
+    self.traceDepth = traceDepth
+    self.maxEvents = maxEvents
+    self.events = []        # Chrome trace events
+    self.origin = monotonic()
+    self.overlay = True     # Draw the percentiles over the window
+    self.wrapped = []       # (object, method name) wrapped by attach
+    self.count = 0          # Frames timed so far
+    self.lines = None       # Last summary, and the frame it was made at
+    self.linesAt = 0
+
+  def begin(self, phase):
+    """Open a span of a phase"""
+    self.stack.append([phase, monotonic(), 0.0])
+
+  def end(self):
+    """Close the innermost open span"""
+    now = monotonic()
+    (phase, start, nested) = self.stack.pop()
+    total = now - start
+    self.current[phase] = self.current.get(phase, 0.0) + total - nested
+    if self.stack:
+      self.stack[-1][2] += total
+    if self.trace and len(self.stack) < self.traceDepth and len(self.events) < self.maxEvents:
+      self.events.append({'name': phase, 'ph': 'X', 'ts': (start - self.origin)*1e6, 'dur': total*1e6, 'pid': 1, 'tid': 1})
+
+  def startFrame(self):
+    """Start timing a frame"""
+    self.current = {}
+    self.begin('frame')
+
+  def endFrame(self):
+    """Finish the frame, adding its phase totals to the window"""
+    while self.stack:
+      self.end()
+    self.frames.append(self.current)
+    self.count += 1
+    if self.trace and len(self.events) < self.maxEvents:
+      self.events.append({'name': 'phases (ms)', 'ph': 'C', 'ts': (monotonic() - self.origin)*1e6, 'pid': 1,
+                          'args': dict([(k, v*1000) for (k, v) in self.current.items()])})
+
+  def timed(self, phase, func):
+    """Wrap a function so every call of it is a span of phase"""
+    def call(*args, **kwargs):
+      self.begin(phase)
+      try:
+        return func(*args, **kwargs)
+      finally:
+        self.end()
+    return call
+
+  def wrap(self, obj, name, phase):
+    """Time a method of one instance as phase"""
+    setattr(obj, name, self.timed(phase, getattr(obj, name)))
+    self.wrapped.append((obj, name))
+
+  def attach(self, engine):
+    """Start profiling an engine, timing the updates of its objects by class and its collision queries"""
+    self.detach(engine)
+    engine.profiler = self
+    for o in engine.allObjects():
+      self.wrap(o, 'update', 'update ' + o.__class__.__name__)
+    index = engine.collisions
+    [self.wrap(index, name, 'collide') for name in ('closestSurface', 'closestSurfaces', 'near')]
+    self.wrap(index.planes, 'sweep', 'collide')
+
+  def detach(self, engine):
+    """Stop profiling, putting back the methods attach wrapped"""
+    for (obj, name) in self.wrapped:
+      if name in obj.__dict__:
+        delattr(obj, name)
+    self.wrapped = []
+    if engine.profiler is self:
+      engine.profiler = None
+
+  def percentiles(self, p = (50, 99)):
+    """Get (phase, [percentiles in seconds]) over the window, slowest phase first
+
+    A frame that did not go through a phase counts as taking no time in it.
+    """
+    frames = list(self.frames)
+    phases = set()
+    [phases.update(f) for f in frames]
+    stats = []
+    for phase in phases:
+      samples = sorted([f.get(phase, 0.0) for f in frames])
+      stats.append((phase, [percentile(samples, q) for q in p]))
+    stats.sort(key=lambda s: (-s[1][-1], s[0]))
+    return stats
+
+  def summary(self, count = 12):
+    """Get lines of text of the slowest phases for the overlay, only worked out again every refresh frames"""
+    if self.lines is None or self.count - self.linesAt >= self.refresh:
+      self.lines = ["%-24s %8s %8s" % ("phase (%d frames)" % len(self.frames), "p50 ms", "p99 ms")]
+      for (phase, (p50, p99)) in self.percentiles()[:count]:
+        self.lines.append("%-24s %8.3f %8.3f" % (phase, p50*1000, p99*1000))
+      self.linesAt = self.count
+    return self.lines
+
+  def writeTrace(self, filename):
+    """Save the trace events as a Chrome trace JSON file"""
+    out = open(filename, 'w')
+    try:
+      json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, out)
+    finally:
+      out.close()
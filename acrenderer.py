@@ -11,18 +11,51 @@ except ImportError, e:
   sys.exit(1)
 
 
-import datetime
-import math
+import ctypes
+from array import array
 
-from acloader import *
+from acengine import *
+from actexture import *
+
+
+BATCH_FLOATS = 8                  # x y z, nx ny nz, u v per vertex
+BATCH_STRIDE = BATCH_FLOATS*4
+
+
+# OpenGL's own default material, for surfaces of a batch that come before any with a material
+DEFAULT_MATERIAL = {'name': 'default', 'rgb': (0.8, 0.8, 0.8), 'amb': (0.2, 0.2, 0.2), 'emis': (0.0, 0.0, 0.0), 'spec': (0.0, 0.0, 0.0), 'shi': 0, 'trans': 1.0}
+
+def setMaterial(mat):
+  """Set material properties for the following surfaces"""
+  glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE,  mat['rgb'] + (mat['trans'],))
+  glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION,  mat['emis'] + (1,))
+  glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT,  mat['amb'] + (1,))
+  glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR,  mat['spec'] + (1,))
+  glMateriali(GL_FRONT_AND_BACK, GL_SHININESS, mat['shi'])
 
 
 class ACRenderer:
-  def __init__(self, filename, width = 800, height = 600, title = "ACRenderer", wireframe = False):
+  """OpenGL window that draws the objects of an ACEngine
 
-    self.currenttime = datetime.datetime.now()
+  This is a mixin, put it before an engine class in the bases, as in
+  ACViewer, and call both constructors, this one first so the GL context
+  exists when the board is loaded. It only fills in the engine's hooks, so
+  it never hides an engine subclass's methods.
+  """
+  def __init__(self, width = 800, height = 600, title = "ACRenderer", wireframe = False, batch = False, culling = True,
+               physicsRate = 200, frameRate = 100):
+
+    self.scheduler = ACScheduler(physicsRate, frameRate)  # Fixed rate physics steps, independent of frame rate
     self.fps = 0
     self.wireframe = wireframe
+    self.batch = batch      # Draw static objects with the batched vertex buffer backend instead of display lists
+    self.batcher = None
+    self.culling = culling    # Skip objects outside of the view frustum
+    self.frustum = None
+    self.drawn = 0            # Objects drawn in the last frame
+    self.culled = 0           # Objects skipped in the last frame for being out of view
+    self.textures = ACTextureCache()  # Texture files shared by all objects of all loaded boards
+    self.profileText = ACText(GLUT_BITMAP_9_BY_15)  # Lines of the profiler overlay
 
     # setup OpenGL window
     glutInitDisplayMode(GLUT_RGBA | GLUT_DOUBLE | GLUT_ALPHA | GLUT_DEPTH)
@@ -46,66 +79,291 @@ class ACRenderer:
     # Trigger resize to set window sizes and opengl context
     self.reshapeFunc(width, height)
 
-    # Load model data and parse into Python objects
-    self.loaders = self.createObjects(ACLoader(filename).objects)
-    self.toggle = 0 # Toggle used to track when to exec display callback
-    self.animate(0)
-
-  def animate(self, arg):
-    """Timer callback for OpenGL. Used to animate objects"""
-    time = datetime.datetime.now()
-    d = time - self.currenttime
-    self.currenttime = time
-    [l.update(d) for l in self.loaders] # Update objects
-    self.fps = 1000000/d.microseconds
-
-    self.toggle += 1
-
-    if self.toggle == 2:
-      self.toggle = 0
-      self.displayFunc()  # Trigger display callback ever two animation cycles
-
-    # schedule this function to run again
-    glutTimerFunc(5, self.animate, 0)
+  def boardLoading(self, loader):
+    """Start decoding textures before any geometry is built"""
+    # A cached board lists every texture up front
+    if loader.objects is not None:
+      self.textures.prefetch(self.findTextures(loader.objects))
+
+  def objectCreated(self, obj):
+    """Load the texture of an object and build its display list"""
+    # load the texture data from the file, shared with any other object using it
+    if obj.texfile:
+      obj.texture = self.textures.acquire(obj.texfile)
+
+    if obj.mesh and obj.mesh.displaylist is not None:
+      obj.displaylist = obj.mesh.displaylist
+    elif not (self.batch and obj.static):
+      self.genList(obj)
+      if obj.mesh:
+        obj.mesh.displaylist = obj.displaylist
+
+    if obj.type == 'light':
+      self.addLight(obj)
+
+  def boardLoaded(self):
+    """Batch the static objects of a new board"""
+    if self.batch:
+      self.batcher = ACBatchRenderer(self)
+      self.batcher.build(self.loaders)
+
+  def releaseObjects(self, objs):
+    """Free the GL resources of the old board's objects"""
+    [self.releaseObject(o) for o in objs]
+    if self.batcher:
+      self.batcher.release()
+      self.batcher = None
+
+  def addLight(self, obj):
+    """Create an OpenGL light at the location of a light object"""
+    glLightfv(GL_LIGHT1, GL_AMBIENT, (0.4, 0.4, 0.4, 1.0))
+    glLightfv(GL_LIGHT1, GL_DIFFUSE, (0.4, 0.4, 0.4, 1.0))
+    glLightfv(GL_LIGHT1, GL_SPECULAR, (1.0, 1.0, 1.0, 1.0))
+    glLightfv(GL_LIGHT1, GL_POSITION, obj.location)
+    glEnable(GL_LIGHT1)
 
-  def createObjects(self, objs, parent=None):
-    """Create all of the python objects based on object data give"""
-    objects = []
+  def findTextures(self, objs):
+    """Get the texture files used by objects and their kids"""
+    files = []
     for obj in objs:
-      inst = self.getObjectClass(obj)(obj, self)
-      inst.parent = parent
-      inst.position = parent and list(parent.vecAdd(parent.position, inst.location)) or inst.location
-      inst.subobjects = self.createObjects(obj['kids'], inst)
-      objects.append(inst)
+      if obj.has_key('texture'):
+        files.append(obj['texture'])
+      files.extend(self.findTextures(obj.get('kids', [])))
+    return files
 
-    return objects
-
-
-  def getObjectClass(self, data):
-    """Callback to decide what type of class should be instantiated, based on object data"""
-    if data['type'] == 'light':
-      return ACLight
-    else:
-      return ACObject
+  def animate(self, arg):
+    """Timer callback for OpenGL. Runs the physics steps due since the last frame, then draws a frame"""
+    prof = self.profiler
+    if prof:
+      prof.startFrame()
+      prof.begin('physics')
+    for i in range(self.scheduler.advance()):
+      self.step()
+    if prof:
+      prof.end()
+
+    self.alpha = self.scheduler.alpha()
+    self.fps = int(self.scheduler.fps)
+    self.displayFunc()
+    if prof:
+      prof.endFrame()
+
+    # schedule this function to run again when the next frame is due
+    glutTimerFunc(self.scheduler.frameDelay(), self.animate, 0)
 
   def displayFunc(self):
     """Clear the screen, render all items and swap the GL buffers"""
+    prof = self.profiler
+    if prof:
+      prof.begin('textures')
+    self.textures.uploadPending()  # Textures decoded in the background since the last frame
+    if prof:
+      prof.end()
+      prof.begin('render')
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)	# Clear The Screen And The Depth Buffer
     glLoadIdentity()
     self.render()
+    if prof:
+      prof.end()
+      if prof.overlay:
+        prof.begin('profiler')
+        self.renderProfile()
+        prof.end()
+      prof.begin('swap')
     glutSwapBuffers()
+    if prof:
+      prof.end()
 
   def render(self):
     """Render the objects loaded into this renderer"""
 
     glEnable(GL_LIGHTING)
-    [l.render() for l in self.loaders]
+    self.drawn = self.culled = 0
+    self.frustum = self.culling and self.getFrustum() or None
+
+    if self.batcher:
+      self.batcher.draw()
+    [self.renderObject(l) for l in self.loaders]
+
+  def getFrustum(self):
+    """Get the view frustum for the current projection and modelview matrices"""
+    proj = [float(x) for row in glGetDoublev(GL_PROJECTION_MATRIX) for x in row]
+    model = [float(x) for row in glGetDoublev(GL_MODELVIEW_MATRIX) for x in row]
+    return ACFrustum(proj, model)
+
+  def isVisible(self, bounds, origin):
+    """Check a bounding sphere, relative to the board position origin, against the view frustum"""
+    f = self.frustum
+    return not (f and bounds) or f.sphereVisible((origin[0] + bounds[0][0], origin[1] + bounds[0][1], origin[2] + bounds[0][2]), bounds[1])
+
+  def renderObject(self, obj, origin = (0, 0, 0)):
+    """Draw an object and subobjects based on it's location, origin is the parent's board position"""
+    if obj.hidden or obj.subtreeBatched:
+      return
+
+    loc = obj.renderLocation()
+    pos = obj.vecAdd(origin, loc)
+
+    # Skip the whole subtree if it can't move and is out of view
+    if obj.subtreeStatic and not self.isVisible(obj.subtreeBounds, pos):
+      self.culled += obj.subtreeCount
+      return
+
+    glTranslate(loc[0], loc[1], loc[2])
+    if obj.surfaces and not obj.batched:
+      if self.isVisible(obj.bounds, pos):
+        rot = obj.drawRotation()
+        if rot:
+          glRotate(rot[0], rot[1][0], rot[1][1], rot[1][2])
+        self.drawObject(obj)
+        if rot:
+          glRotate(-1*rot[0], rot[1][0], rot[1][1], rot[1][2])
+        self.drawn += 1
+      else:
+        self.culled += 1
+    [self.renderObject(o, pos) for o in obj.subobjects]
+    glTranslate(-1*loc[0], -1*loc[1], -1*loc[2])
+
+  def drawObject(self, obj):
+    """Draw an object at the current location"""
+    prof = self.profiler
+    if prof:
+      prof.begin('texture bind')
+    # Texture name is 0, drawing untextured, until the texture is decoded and uploaded
+    glBindTexture(GL_TEXTURE_2D, obj.texture and obj.texture.name or 0)
+    if prof:
+      prof.end()
+      prof.begin('draw ' + obj.__class__.__name__)
+    if obj.mesh:
+      # The shared display list is built from the mesh's first object, move it over to this one
+      o = obj.meshOffset
+      glTranslate(o[0], o[1], o[2])
+      glCallList(obj.displaylist)
+      glTranslate(-1*o[0], -1*o[1], -1*o[2])
+    else:
+      glCallList(obj.displaylist)
+    if prof:
+      prof.end()
+
+  def genList(self, obj, render = False):
+    """Generate a displaylist for an object"""
+
+    if not render:
+      obj.displaylist = glGenLists(1)
+      glNewList(obj.displaylist, GL_COMPILE)
+
+    verts = obj.getVertices()
+    type = self.wireframe and GL_LINE_LOOP or GL_POLYGON
+
+    if obj.geometry is not None:
+      # Read straight from the geometry arrays, converted to lists once for fast indexing
+      g = obj.geometry
+      verts = numpy.asarray(verts).tolist()
+      (refs, uvs, offsets, norms, centers, mats) = [a.tolist() for a in (g.refs, g.uvs, g.offsets, g.norms, g.centers, g.mats)]
+
+      for i in range(len(g)):
+        glBegin(type)
+        glNormal3dv(norms[i])
+        # A surface without a material (-1) keeps the one before it, like one without a mat line
+        if mats[i] >= 0:
+          setMaterial(g.materials[mats[i]])
+        for j in range(offsets[i], offsets[i+1]):
+          glTexCoord2d(uvs[j][0], uvs[j][1])
+          glVertex3dv(verts[refs[j]])
+        glEnd()
+
+        if obj.showNormal:
+          self.drawNormal(centers[i], norms[i])
+
+    else:
+      for surface in obj.surfaces:
+        glBegin(type)
+
+        # Set surface normal
+        if surface.has_key('norm'):
+          glNormal3dv(surface['norm'])
+        if surface.has_key('material'):
+          setMaterial(surface['material'])
+
+        # render the surface polygon itself
+        for ref in surface['refs']:
+          glTexCoord2d(ref[1], ref[2])
+          glVertex3dv(verts[ref[0]])
+        glEnd()
+
+        # If enabled, render the surface's normals 
+        if obj.showNormal and surface.has_key('norm'):
+          self.drawNormal(surface['center'], surface['norm'])
+
+    if not render:
+      glEndList()
+
+  def drawNormal(self, c, norm):
+    """Render a surface normal as a short line from the surface center"""
+    glTranslate(c[0], c[1], c[2])
+    glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, (0, 0, 0))
+    glBegin(GL_LINES)
+    glVertex3dv((0,0,0))
+    glVertex3dv((norm[0]*0.05, norm[1]*0.05, norm[2]*0.05))
+    glEnd()
+    glTranslate(-1*c[0], -1*c[1], -1*c[2])
+
+  def releaseObject(self, obj):
+    """Free the GL resources of an object and subobjects"""
+    if obj.texture:
+      self.textures.release(obj.texture)
+      obj.texture = None
+    if obj.mesh:
+      obj.mesh.users -= 1
+      if obj.mesh.users == 0 and hasattr(obj, 'displaylist'):
+        glDeleteLists(obj.displaylist, 1)
+    elif hasattr(obj, 'displaylist'):
+      glDeleteLists(obj.displaylist, 1)
+    if hasattr(obj, 'displaylist'):
+      del obj.displaylist
+    [self.releaseObject(o) for o in obj.subobjects]
 
   def displayString(self, pos, str, font = GLUT_BITMAP_HELVETICA_18):
     """Render a GLUT font string"""
+    prof = self.profiler
+    if prof:
+      prof.begin('text')
     glRasterPos3f(pos[0], pos[1], pos[2])
     for c in str:
       glutBitmapCharacter(font, ord(c))
+    if prof:
+      prof.end()
+
+  def drawText(self, text, lines):
+    """Draw lines of (pos, string) with an ACText, only rebuilding the lines that changed"""
+    prof = self.profiler
+    if prof:
+      prof.begin('text')
+    text.draw(lines)
+    if prof:
+      prof.end()
+
+  def renderProfile(self):
+    """Draw the profiler's rolling percentiles over the top left of the window, in pixels"""
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    glOrtho(0, self.width, 0, self.height, -1, 1)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+    glDisable(GL_LIGHTING)
+    glDisable(GL_DEPTH_TEST)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glColor3f(1.0, 1.0, 0.0)
+
+    self.profileText.draw([((10, self.height - 20 - 15*i, 0), line) for (i, line) in enumerate(self.profiler.summary())])
+
+    glEnable(GL_DEPTH_TEST)
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
 
   def reshapeFunc(self, w, h):
     """Handle the window resize event"""
@@ -123,224 +381,217 @@ class ACRenderer:
 
   def keyUp(self, key, x, y):
     """Handle someone releasing a pressed key"""
-    self.keyFunc( 1, key, x, y)
+    self.input( 1, key, x, y)
 
   def keyDown(self, key, x, y):
     """Handle someone pressing down a key"""
-    self.keyFunc(-1, key, x, y)
-
-  def keyFunc(self, direction, key, x, y):
-    """Handle a key press from glut"""
     if key == '\033': # Escape key
       glutDestroyWindow(self.window)
       sys.exit()
+    self.input(-1, key, x, y)
 
   def run(self):
     """Execute the main loop of glut, this will never exit"""
+    glutTimerFunc(0, self.animate, 0)
     glutMainLoop()
 
-class ACObject:
-  def __init__(self, data, renderer):
-    self.debug = False
-    self.hidden = False
-    self.showNormal = False
-    self.useDisplaylist = True
-    if data.has_key('name'):
-      self.name = data['name']
-    else:
-      self.name = '__blank__'
-    self.renderer = renderer
-    self.moving = False
-    self.location = list(data['loc'])
-    self.type = data['type']
-    self.vertices = data['verts']
-    self.texture = 0
-
-    # load the texture data from the file
-    if data.has_key('texture'):
-      self.__loadTexture(data['texture'])
-    self.texfile =  data.has_key('texture') and data['texture'] or ''
-
-    self.surfaces = data['surfaces']
-    self.subobjects = []
-
-    self.processSurfaces()
-    self.genList()
-
-  def processSurfaces(self):
-    """Go through the object's surfaces and calculate normals, centers and object centroid"""
-
-    vs = self.getVertices() # Use vertex function to allow for transformed coorditates from paddle
-
-    nv = len(vs)
-    if nv == 0:
-      return
-
-    # Calculate the centroid of the object
-    x = y = z = 0
-    for i,j,k in vs:
-      x += i
-      y += j
-      z += k
-    self.centroid = ( x/nv, y/nv, z/nv )
-
-    for s in self.surfaces:
-      nv = len(s['refs'])
-
-      # can only calculate normal if there are > 2 vertices
-      if nv > 2:
-        r = s['refs']
-
-        v0 = vs[r[0][0]]
-        v1 = vs[r[1][0]]
-        v2 = vs[r[2][0]]
-
-        # Calculate normal using cross product of first three vertices
-        vn1 = self.vecSub(v0, v1)
-        vn2 = self.vecSub(v0, v2)
-        n = self.vecCross(vn1, vn2)
-        s['norm'] = self.vecNorm(n)
-
-        # Calculate the center of the surface, used when displaying normals
-        tot = (0,0,0)
-        for r in s['refs']:
-          tot = self.vecAdd(vs[r[0]], tot)
-        s['center'] = self.vecMult(tot, 1.0/len(s['refs']))
-
-      else:
-        s['norm'] = (0,0,0)
-        s['center'] = (0,0,0)
-
-  def getVertices(self):
-    """Placeholder vertices lookup"""
-    return self.vertices
-
-  def vecNorm(self, vec):
-    """Normalize a given vector"""
-    len = abs(math.sqrt(sum([i**2 for i in vec])))
-    if len == 0:
-      return (0,0,0)
-    return tuple([i/len for i in vec])
-
-  def vecSub(self, v1, v2):
-    """Subtract two vectors"""
-    return ( v1[0]-v2[0], v1[1]-v2[1], v1[2]-v2[2] )
-  def vecAdd(self, v1, v2):
-    """Add two vectors"""
-    return ( v1[0]+v2[0], v1[1]+v2[1], v1[2]+v2[2] )
-  def vecMult(self, v, n):
-    """Multiply a vector with a scalar"""
-    return ( v[0]*n, v[1]*n, v[2]*n )
-  def vecCross(self, v1, v2):
-    """Calculate the cross product of two vectors"""
-    return ( v1[1]*v2[2] - v1[2]*v2[1], v1[2]*v2[0] - v1[0]*v2[2], v1[0]*v2[1] - v1[1]*v2[0])
-  def vecDot(self, v1, v2):
-    """Calculate the dot product of two vectors"""
-    return v1[0]*v2[0] + v1[1]*v2[1] + v1[2]*v2[2]
-  def vecMag(self, v):
-    """Calculate the magnitude of a vector"""
-    return abs(math.sqrt(sum([i**2 for i in v])))
-
-  def update(self, time):
-    """Update the object's position based on a given passed time"""
-    [obj.update(time) for obj in self.subobjects]
-
-  def render(self):
-    """Draw the object and subobjects based on it's location"""
-    if self.hidden:
-      return
-
-    glTranslate(self.location[0], self.location[1], self.location[2])
-    if self.surfaces:
-      self.draw()
-    [obj.render() for obj in self.subobjects]
-    glTranslate(-1*self.location[0], -1*self.location[1], -1*self.location[2])
-
-  def draw(self):
-    """Function to draw the object at the given location"""
-    glBindTexture(GL_TEXTURE_2D, self.texture)
-    glCallList(self.displaylist)
-
-  def genList(self, render = False):
-    """Generate a displaylist for the object"""
-
-    if not render:
-      self.displaylist = glGenLists(1)
-      glNewList(self.displaylist, GL_COMPILE)
-
-    verts = self.getVertices()
-
-    for surface in self.surfaces:
-      type = self.renderer.wireframe and GL_LINE_LOOP or GL_POLYGON
-      glBegin(type)
-
-      # Set surface normal
-      if surface.has_key('norm'):
-        glNormal3dv(surface['norm'])
-      mat = surface['material']
-
-      # Set material properties for this surface
-      glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE,  mat['rgb'] + (mat['trans'],))
-      glMaterialfv(GL_FRONT_AND_BACK, GL_EMISSION,  mat['emis'] + (1,))
-      glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT,  mat['amb'] + (1,))
-      glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR,  mat['spec'] + (1,))
-      glMateriali(GL_FRONT_AND_BACK, GL_SHININESS, mat['shi'])
-
-      # render the surface polygon itself
-      for ref in surface['refs']:
-        glTexCoord2d(ref[1], ref[2])
-        glVertex3dv(verts[ref[0]])
-      glEnd()
-
-      # If enabled, render the surface's normals 
-      if self.showNormal and surface.has_key('norm'):
-        c = surface['center']
-        glTranslate(c[0], c[1], c[2])
-        glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, (0, 0, 0))
-        glBegin(GL_LINES)
-        glVertex3dv((0,0,0))
-        glVertex3dv(self.vecMult(surface['norm'], 0.05))
-        glEnd()
-        glTranslate(-1*c[0], -1*c[1], -1*c[2])
-    if not render:
+class ACText:
+  """Lines of bitmap text drawn from display lists, for text that is drawn every frame
+
+  Each character of the font is compiled into a display list once. Every
+  line gets a display list that moves to the line's position and calls the
+  character lists for its string, and is only compiled again when the line
+  changes. One more list calls all of the line lists, so drawing every line
+  is a single call however many characters they have.
+  """
+  def __init__(self, font = GLUT_BITMAP_HELVETICA_18):
+    self.font = font
+    self.base = None    # First of the 256 character display lists
+    self.list = None    # Display list that calls every line's list
+    self.lineLists = [] # Display list of each line
+    self.lines = []     # (pos, string) each line's list was compiled from
+
+  def compileFont(self):
+    """Compile a display list for each character of the font"""
+    self.base = glGenLists(256)
+    for i in range(256):
+      glNewList(self.base + i, GL_COMPILE)
+      glutBitmapCharacter(self.font, i)
       glEndList()
 
-  def __loadTexture(self, file):
-    """Loads the object's texture file into an openGL texture object"""
+  def compileLine(self, i, line):
+    """Compile the display list of one line"""
+    (pos, str) = line
+    glNewList(self.lineLists[i], GL_COMPILE)
+    glRasterPos3f(pos[0], pos[1], pos[2])
+    glListBase(self.base)
+    if str:
+      glCallLists(str)
+    glEndList()
+    self.lines[i] = line
+
+  def setCount(self, count):
+    """Change the number of lines, compiling the list that calls them again"""
+    while len(self.lineLists) < count:
+      self.lineLists.append(glGenLists(1))
+      self.lines.append(None)
+    while len(self.lineLists) > count:
+      glDeleteLists(self.lineLists.pop(), 1)
+      self.lines.pop()
+
+    if self.list is None:
+      self.list = glGenLists(1)
+    glNewList(self.list, GL_COMPILE)
+    [glCallList(l) for l in self.lineLists]
+    glEndList()
+
+  def draw(self, lines):
+    """Draw lines of (pos, string) at raster positions, compiling the ones that changed since the last draw"""
+    if self.base is None:
+      self.compileFont()
+    if self.list is None or len(lines) != len(self.lineLists):
+      self.setCount(len(lines))
+    for (i, line) in enumerate(lines):
+      if line != self.lines[i]:
+        self.compileLine(i, line)
+    glCallList(self.list)
+
+  def release(self):
+    """Free the display lists"""
+    if self.base is not None:
+      glDeleteLists(self.base, 256)
+    [glDeleteLists(l, 1) for l in self.lineLists + (self.list is not None and [self.list] or [])]
+    self.base = self.list = None
+    self.lineLists = []
+    self.lines = []
+
+class ACViewer(ACRenderer, ACEngine):
+  """Window that shows the objects of a board file"""
+  def __init__(self, filename):
+    ACRenderer.__init__(self)
+    ACEngine.__init__(self, filename)
+
+class ACBatch:
+  """Range of triangles in the vertex buffer that share a material and texture"""
+  def __init__(self, material, texture):
+    self.material = material
+    self.texture = texture
+    self.data = array('f')  # interleaved vertex data, until it is packed into the buffer
+    self.first = 0
+    self.count = 0
+
+class ACBatchRenderer:
+  """Render backend that draws all static objects from one vertex buffer
+
+  Every surface of every static object is triangulated once, in board
+  coordinates, and grouped by material and texture. A frame then costs one
+  draw call per group instead of a display list and a set of material
+  calls per surface. Objects that move or hide keep drawing themselves.
+  """
+
+  def __init__(self, renderer):
+    self.renderer = renderer
+    self.batches = []
+    self.buffer = None
+    self.triangles = 0
+
+  def build(self, objects):
+    """Triangulate the static objects and upload them into the vertex buffer"""
+    groups = {}
+    self.__collect(objects, groups)
+
+    # Pack every group into one buffer, one after the other
+    data = array('f')
+    for b in groups.values():
+      b.first = len(data)/BATCH_FLOATS
+      b.count = len(b.data)/BATCH_FLOATS
+      data.extend(b.data)
+      b.data = None
+      if b.count:
+        self.batches.append(b)
+    self.triangles = len(data)/BATCH_FLOATS/3
+
+    if len(data):
+      self.buffer = glGenBuffers(1)
+      glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+      glBufferData(GL_ARRAY_BUFFER, len(data)*4, data.tostring(), GL_STATIC_DRAW)
+      glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+  def __collect(self, objects, groups):
+    """Add static objects to the material groups, returns whether all of them were batched"""
+    all = True
+    for obj in objects:
+      if obj.static and len(obj.surfaces):
+        self.__add(obj, groups)
+        obj.batched = True
+
+      # Whole subtrees with nothing left to draw can be skipped when rendering
+      kids = self.__collect(obj.subobjects, groups)
+      obj.subtreeBatched = kids and (obj.batched or not len(obj.surfaces))
+      all = all and obj.subtreeBatched
+    return all
+
+  def __add(self, obj, groups):
+    """Triangulate the surfaces of an object into its material groups"""
+    verts = obj.getVertices()
+    p = obj.vecAdd(obj.position, obj.meshOffset)
+
+    mat = DEFAULT_MATERIAL
+    for s in obj.surfaces:
+      refs = s['refs']
+      if len(refs) < 3:
+        continue
+
+      # A surface without a material keeps the one before it, like in genList
+      if s.has_key('material'):
+        mat = s['material']
+      key = (id(mat), obj.texture)
+      if not groups.has_key(key):
+        groups[key] = ACBatch(mat, obj.texture)
+      data = groups[key].data
+
+      # Fan triangulation, surfaces are drawn as convex GL_POLYGONs otherwise
+      n = tuple(s['norm'])
+      for i in range(1, len(refs) - 1):
+        for r in (refs[0], refs[i], refs[i+1]):
+          v = verts[r[0]]
+          data.extend((p[0] + v[0], p[1] + v[1], p[2] + v[2]) + n + (r[1], r[2]))
 
-    try:
-      image = Image.open(file)
-    except:
-      print "Failed to load texture %s" % file
+  def draw(self):
+    """Draw every batch"""
+    if not self.buffer:
       return
 
-    # read image data as raw pixel data
-    ix = image.size[0]
-    iy = image.size[1]
-    image = image.tostring("raw", "RGBX", 0, -1)
-
-    # Generate an openGL texture based on the raw texture data
-    self.texture = glGenTextures(1)
-    glBindTexture(GL_TEXTURE_2D, self.texture)
-    glPixelStorei(GL_UNPACK_ALIGNMENT,1)
-    glTexImage2D(GL_TEXTURE_2D, 0, 3, ix, iy, 0, GL_RGBA, GL_UNSIGNED_BYTE, image)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
-    glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
-
-class ACLight(ACObject):
-  """Specialized class that creates an OpenGL light at the specified location"""
-  def __init__(self, data, r):
-    ACObject.__init__(self, data, r)
-    glLightfv(GL_LIGHT1, GL_AMBIENT, (0.4, 0.4, 0.4, 1.0))
-    glLightfv(GL_LIGHT1, GL_DIFFUSE, (0.4, 0.4, 0.4, 1.0))
-    glLightfv(GL_LIGHT1, GL_SPECULAR, (1.0, 1.0, 1.0, 1.0))
-    glLightfv(GL_LIGHT1, GL_POSITION, self.location)
-    glEnable(GL_LIGHT1)
+    glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+    glVertexPointer(3, GL_FLOAT, BATCH_STRIDE, ctypes.c_void_p(0))
+    glNormalPointer(GL_FLOAT, BATCH_STRIDE, ctypes.c_void_p(12))
+    glTexCoordPointer(2, GL_FLOAT, BATCH_STRIDE, ctypes.c_void_p(24))
+
+    if self.renderer.wireframe:
+      glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+
+    for b in self.batches:
+      glBindTexture(GL_TEXTURE_2D, b.texture and b.texture.name or 0)
+      setMaterial(b.material)
+      glDrawArrays(GL_TRIANGLES, b.first, b.count)
+
+    if self.renderer.wireframe:
+      glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+
+    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+  def release(self):
+    """Free the vertex buffer"""
+    if self.buffer:
+      glDeleteBuffers(1, [self.buffer])
+      self.buffer = None
+    self.batches = []
 
 if __name__ == "__main__":
   glutInit(sys.argv)
@@ -349,5 +600,5 @@ if __name__ == "__main__":
     print "Usage: acrenderer.py <filename>"
     sys.exit(0)
 
-  ren = ACRenderer(sys.argv[1])
+  ren = ACViewer(sys.argv[1])
   ren.run()
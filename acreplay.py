@@ -0,0 +1,180 @@
+
+import zlib
+import bisect
+import struct
+import marshal
+
+
+REPLAY_MAGIC = 'ACR1'
+HEADER = struct.Struct('<4sI')    # magic, version
+RECORD = struct.Struct('<cI')     # record type, physics step
+BLOCK = struct.Struct('<I')       # length of the data that follows
+KEY = struct.Struct('<bH')        # key direction, length of the key that follows
+
+REPLAY_VERSION = 1
+
+
+class ACReplayError(Exception):
+  """The replay file is not one, or can not be played on the game"""
+  pass
+
+def stateLayout(engine):
+  """Get the names of the state attributes of every object, what a checkpoint holds"""
+  return [list(o.state) for o in [engine] + engine.allObjects()]
+
+def saveState(engine):
+  """Serialize a checkpoint of the engine, the same state always gives the same bytes"""
+  return marshal.dumps(engine.checkpoint(), 2)
+
+
+class ACRecorder:
+  """Records a game to a compact binary replay file as it is played
+
+  The file starts with info, whatever the game needs to be set up the same
+  way again, and a checkpoint of the state recording started from. Then
+  every key press is written with the physics step it came before, and a
+  compressed checkpoint every interval steps, so a replay can be played
+  from any of them. Only keys that go through the engine's input are
+  recorded, anything else that changes the game shows up as a mismatch when
+  the replay is played back.
+  """
+
+  def __init__(self, engine, filename, info = None, interval = 1000):
+    self.engine = engine
+    self.interval = interval
+    self.file = open(filename, 'wb')
+    self.file.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION))
+    info = dict(info or {})
+    info['state'] = stateLayout(engine)
+    self.block('H', marshal.dumps(info, 2))
+    self.checkpoint()
+    engine.replay = self
+
+  def block(self, type, data):
+    """Write a record with a block of data"""
+    self.file.write(RECORD.pack(type, self.engine.steps) + BLOCK.pack(len(data)) + data)
+
+  def checkpoint(self):
+    """Write a checkpoint of the state as it is now"""
+    self.block('C', zlib.compress(saveState(self.engine)))
+    self.file.flush()
+
+  def input(self, engine, direction, key):
+    """Write a key press, and let it through to the game"""
+    self.file.write(RECORD.pack('K', engine.steps) + KEY.pack(direction, len(key)) + key)
+    return True
+
+  def stepping(self, engine):
+    """Called before each physics step"""
+    pass
+
+  def stepped(self, engine):
+    """Called after each physics step, checkpoints are taken before any keys of the next step"""
+    if engine.steps % self.interval == 0:
+      self.checkpoint()
+
+  def close(self):
+    """Write where the replay ends and close the file"""
+    if self.file.closed:
+      return
+    self.file.write(RECORD.pack('E', self.engine.steps))
+    self.file.close()
+    if self.engine.replay is self:
+      self.engine.replay = None
+
+
+class ACReplay:
+  """A replay file read back, to play on an engine set up the way info says
+
+  Once attached with play, the recorded keys are passed to the engine before
+  the steps they were pressed at, and live keys are ignored. Every checkpoint
+  that is passed is compared with the state the engine is in, and the steps
+  where they differ are added to mismatches, so a replay doubles as a test
+  that the physics still play out exactly the same. seek jumps to any step
+  from the last checkpoint before it, without playing from the start.
+  """
+
+  def __init__(self, filename):
+    self.info = {}
+    self.keys = {}          # step -> [(direction, key)] pressed before it
+    self.checkpoints = []   # (step, compressed state) in step order
+    self.states = {}        # step -> compressed state
+    self.end = 0            # step the recording stopped at
+    self.complete = False   # The recording was closed, rather than cut short
+    self.mismatches = []    # steps where the state differed from the checkpoint
+    self.read(open(filename, 'rb').read())
+
+  def read(self, data):
+    """Parse the records of a replay, stopping at one cut short"""
+    if len(data) < HEADER.size or HEADER.unpack_from(data)[0] != REPLAY_MAGIC:
+      raise ACReplayError("Not a replay file")
+    if HEADER.unpack_from(data)[1] != REPLAY_VERSION:
+      raise ACReplayError("Replay format version %d is not supported" % HEADER.unpack_from(data)[1])
+
+    pos = HEADER.size
+    while pos + RECORD.size <= len(data):
+      (type, step) = RECORD.unpack_from(data, pos)
+      pos += RECORD.size
+      if type == 'E':
+        self.end = step
+        self.complete = True
+        break
+
+      head = type == 'K' and KEY or BLOCK
+      if pos + head.size > len(data):
+        break
+      fields = head.unpack_from(data, pos)
+      end = pos + head.size + fields[-1]
+      if end > len(data):
+        break
+      block = data[pos + head.size:end]
+      pos = end
+
+      if type == 'K':
+        self.keys.setdefault(step, []).append((fields[0], block))
+      elif type == 'C':
+        self.checkpoints.append((step, block))
+        self.states[step] = block
+      elif type == 'H':
+        self.info = marshal.loads(block)
+      self.end = max(self.end, step)
+
+    if not self.checkpoints:
+      raise ACReplayError("Replay has no checkpoints to start from")
+
+  def play(self, engine):
+    """Attach to an engine and go to the start of the replay"""
+    if self.info.get('state') != stateLayout(engine):
+      raise ACReplayError("Replay was recorded with different game state, record it again")
+    engine.replay = self
+    self.mismatches = []
+    self.seek(engine, self.checkpoints[0][0])
+
+  def seek(self, engine, step):
+    """Go to a step, restoring the last checkpoint at or before it and playing on from there"""
+    i = bisect.bisect_right([s for (s, data) in self.checkpoints], step) - 1
+    if i < 0:
+      raise ACReplayError("Replay starts at step %d" % self.checkpoints[0][0])
+    engine.restore(marshal.loads(zlib.decompress(self.checkpoints[i][1])))
+    while engine.steps < step:
+      engine.step()
+
+  def finish(self, engine):
+    """Play the rest of the replay as fast as possible"""
+    while engine.steps < self.end:
+      engine.step()
+
+  def input(self, engine, direction, key):
+    """Live keys are ignored while playing"""
+    return False
+
+  def stepping(self, engine):
+    """Press the keys recorded before this step"""
+    for (direction, key) in self.keys.get(engine.steps, ()):
+      engine.keyFunc(direction, key, 0, 0)
+
+  def stepped(self, engine):
+    """Check the state against the checkpoint taken after this step, if there was one"""
+    data = self.states.get(engine.steps)
+    if data is not None and zlib.decompress(data) != saveState(engine):
+      self.mismatches.append(engine.steps)
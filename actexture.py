@@ -0,0 +1,148 @@
+
+import os
+import sys
+
+try:
+  from OpenGL.GL import *
+  import Image
+except ImportError, e:
+  print "Error: You need to have the python-pil and python-opengl packages installed to run this (On Ubuntu anyway)"
+  sys.exit(1)
+
+import Queue
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+
+def decodeTexture(file):
+  """Read a texture file as raw pixel data, returns (width, height, data) or None if it can't be read"""
+  try:
+    image = Image.open(file)
+    return (image.size[0], image.size[1], image.tostring("raw", "RGBX", 0, -1))
+  except:
+    print "Failed to load texture %s" % file
+    return None
+
+class ACTexture:
+  """A texture file and the GL texture it gets uploaded to
+
+  The name stays 0 until the file has been decoded and uploaded, so objects
+  using it draw untextured until then.
+  """
+  def __init__(self, key):
+    self.key = key
+    self.width = 0
+    self.height = 0
+    self.bytes = 0
+    self.name = 0           # GL texture name
+    self.refs = 0           # number of objects using the texture
+    self.pending = True     # still being decoded
+
+class ACTextureCache:
+  """Renderer wide texture cache, so each texture file is decoded and uploaded once
+
+  Textures are keyed by path and file stamp. Textures that no objects use any
+  more stay loaded, so swapping back to a board is free, until the total size
+  goes over maxBytes. Then the least recently used ones are deleted first.
+
+  Files are decoded on a pool of worker threads, and uploadPending has to be
+  called from the GL thread to upload whatever has finished decoding.
+  """
+
+  def __init__(self, maxBytes = 64*1024*1024, workers = 2):
+    self.maxBytes = maxBytes
+    self.textures = OrderedDict()  # key -> ACTexture, least recently used first
+    self.bytes = 0                 # bytes of texture memory in use
+    self.pending = 0               # textures waiting to be decoded or uploaded
+    self.ready = Queue.Queue()     # (texture, decoded data) waiting for upload
+    self.pool = workers and ThreadPool(workers) or None
+
+  def key(self, file):
+    """Get the cache key for a texture file"""
+    st = os.stat(file)
+    return (os.path.abspath(file), st.st_mtime, st.st_size)
+
+  def acquire(self, file):
+    """Get the texture for a file, starting to load it if needed. Returns None if the file is missing"""
+    tex = self.__lookup(file)
+    if tex:
+      tex.refs += 1
+      self.evict()
+    return tex
+
+  def prefetch(self, files):
+    """Start decoding texture files that objects will use soon"""
+    [self.__lookup(f) for f in files]
+
+  def __lookup(self, file):
+    """Find the texture for a file, creating it and queuing the decode if it is not loaded yet"""
+    try:
+      key = self.key(file)
+    except OSError:
+      print "Failed to load texture %s" % file
+      return None
+
+    tex = self.textures.pop(key, None)
+    if tex is None:
+      tex = ACTexture(key)
+      self.pending += 1
+      if self.pool:
+        self.pool.apply_async(decodeTexture, (file,), callback=lambda data: self.ready.put((tex, data)))
+      else:
+        self.ready.put((tex, decodeTexture(file)))
+
+    self.textures[key] = tex   # (re)insert as most recently used
+    return tex
+
+  def release(self, tex):
+    """Let the cache know an object stopped using a texture"""
+    tex.refs -= 1
+    self.evict()
+
+  def evict(self):
+    """Delete unused textures, least recently used first, until under the size limit"""
+    for (key, tex) in self.textures.items():
+      if self.bytes <= self.maxBytes:
+        break
+      if tex.refs <= 0 and not tex.pending:
+        if tex.name:
+          glDeleteTextures([tex.name])
+        del self.textures[key]
+        self.bytes -= tex.bytes
+
+  def uploadPending(self, wait = False):
+    """Upload decoded textures, must be called from the GL thread. With wait set, finish every pending texture"""
+    while self.pending:
+      try:
+        (tex, data) = self.ready.get(wait)
+      except Queue.Empty:
+        break
+
+      self.pending -= 1
+      tex.pending = False
+      if data:
+        (tex.width, tex.height) = data[0:2]
+        self.upload(tex, data[2])
+    self.evict()
+
+  def upload(self, tex, data):
+    """Generate an openGL texture based on the raw texture data"""
+    tex.name = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, tex.name)
+    glPixelStorei(GL_UNPACK_ALIGNMENT,1)
+    glTexImage2D(GL_TEXTURE_2D, 0, 3, tex.width, tex.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
+
+    tex.bytes = tex.width*tex.height*3   # Stored as RGB, the 4 bytes a pixel are only how it is passed in
+    self.bytes += tex.bytes
+
+  def report(self):
+    """Describe the textures currently loaded"""
+    used = len([t for t in self.textures.values() if t.refs > 0])
+    return "%d textures (%d in use, %d pending), %.1f KB texture memory" % (len(self.textures), used, self.pending, self.bytes/1024.0)
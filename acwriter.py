@@ -0,0 +1,71 @@
+
+import sys
+
+from acloader import *
+
+
+class ACWriter:
+  """Write materials and objects, in the form built by ACLoader, back out as an AC3D file"""
+  def __init__(self, name, materials, objects):
+    self.file = open(name, 'w')
+    try:
+      self.file.write("AC3Db\n")
+      [self.__writeMaterial(m) for m in materials]
+      [self.__writeObject(o, materials) for o in objects]
+    finally:
+      self.file.close()
+
+  def __nums(self, nums):
+    """Format numbers so they parse back to exactly the same values"""
+    return ' '.join([repr(n) for n in nums])
+
+  def __writeMaterial(self, m):
+    """Write a MATERIAL line"""
+    self.file.write('MATERIAL "%s" rgb %s  amb %s  emis %s  spec %s  shi %d  trans %s\n' % (
+      m['name'], self.__nums(m['rgb']), self.__nums(m['amb']), self.__nums(m['emis']),
+      self.__nums(m['spec']), m['shi'], repr(m['trans'])))
+
+  def __writeObject(self, obj, materials):
+    """Write an OBJECT and its kids"""
+    w = self.file.write
+    w("OBJECT %s\n" % obj['type'])
+    if obj.has_key('name'):
+      w('name "%s"\n' % obj['name'])
+    if obj.has_key('data'):
+      w("data %d\n%s\n" % (len(obj['data']), obj['data']))
+    if obj.has_key('texture'):
+      w('texture "%s"\n' % obj['texture'])
+    if obj.has_key('texrep'):
+      w("texrep %s\n" % self.__nums(obj['texrep']))
+    if obj.has_key('rot'):
+      w("rot %s\n" % self.__nums(obj['rot'][0] + obj['rot'][1] + obj['rot'][2]))
+    if obj['loc'] != (0.0, 0.0, 0.0):
+      w("loc %s\n" % self.__nums(obj['loc']))
+    if obj.has_key('url'):
+      w("url %s\n" % obj['url'])
+
+    if len(obj['verts']):
+      w("numvert %d\n" % len(obj['verts']))
+      [w("%s\n" % self.__nums(tuple(v))) for v in obj['verts']]
+
+    if len(obj['surfaces']):
+      w("numsurf %d\n" % len(obj['surfaces']))
+      for s in obj['surfaces']:
+        w("SURF 0x%X\n" % s['type'])
+        if s.has_key('mat'):
+          w("mat %d\n" % s['mat'])
+        w("refs %d\n" % len(s['refs']))
+        [w("%d %s\n" % (r[0], self.__nums(r[1:3]))) for r in s['refs']]
+
+    kids = obj.get('kids', [])
+    w("kids %d\n" % len(kids))
+    [self.__writeObject(k, materials) for k in kids]
+
+
+if __name__ == "__main__":
+  if (len(sys.argv) != 3):
+    print "Usage: acwriter.py <source> <dest>"
+    sys.exit(0)
+
+  loader = ACLoader(sys.argv[1])
+  ACWriter(sys.argv[2], loader.materials, loader.objects)
@@ -10,32 +10,43 @@ Options:
  -s ..., --start=...    The number of the starting pad for the ball
  -v ..., --vel=...      An initial velocity x,y
  -w, --wire             Display model as a wireframe
+ -a, --arrays           Store board geometry in numpy arrays instead of tuples
+ -b, --batch            Draw the static board from vertex buffers batched by material
+ -i, --instance         Share geometry between objects that are translated copies of the same mesh
+ -n, --nocull           Draw every object, even when it is out of view
+ -r ..., --rate=...     Physics steps per second (default 200)
+ -f ..., --fps=...      Target frames per second (default 100)
+ -B ..., --balls=...    Number of balls launched together for multiball (default 1)
+ -R ..., --record=...   Record the game to a replay file
+ -P ..., --play=...     Watch a replay file, played with the board and settings it was recorded with
+ -p, --profile          Show how long each phase of a frame takes, over the last 300 frames
+ -t ..., --trace=...    Write the timings of every frame to a Chrome trace file on exit
+ -l ..., --log=...      Log the hits, scores, rounds and drops to an event log file
  -h, --help             Display this meun
  -d, --debug            Show debug output
 """
 
-import math
-import getopt
-from acgame import *
+import copy
+import atexit
+from pinballgame import *
+from acrenderer import *
 
-class Pinball(ACGame):
+
+class Pinball(ACRenderer, PinballGame):
+  """Pinball in an OpenGL window"""
   def __init__(self, settings):
-    self.starting = {}  # lookup for starting points
-    self.ball = None    # reference to the child ball
     self.viewMode = settings['mode'] # 0 = angle, 1 = top, 2 = ball view
-    self.paddles = {}   # reference to l and r paddles
-    self.done = True    # The round is complete
-    self.ball_count = 0 # the number of balls left in the round
-
-    ACGame.__init__(self, settings['gamefile'], title="Pinball!!!", wireframe=settings['wireframe'])
 
-    # Set ball data from settings
-    self.startVelocity = settings['velocity']
-    self.startLocation = self.starting['start%d'%settings['start']].position
-    self.startOffset = settings['offset']
+    ACRenderer.__init__(self, title="Pinball!!!", wireframe=settings['wireframe'], batch=settings['batch'], culling=settings['culling'],
+                        physicsRate=settings['rate'], frameRate=settings['fps'])
+    PinballGame.__init__(self, settings)
+    self.hud = ACText()   # Score, FPS and messages drawn over the board
 
-    # Set key for launching the ball
-    self.launchKey = settings['keys']['fire']
+    # Configure basic overhead light
+    glLightfv(GL_LIGHT2, GL_AMBIENT, (0.2, 0.2, 0.2, 1.0))
+    glLightfv(GL_LIGHT2, GL_DIFFUSE, (0.5, 0.5, 0.5, 1.0))
+    glLightfv(GL_LIGHT2, GL_SPECULAR, (1.0, 1.0, 1.0, 1.0))
+    glEnable(GL_LIGHT2)
 
     # Create the right-click menu for changing keys
     menu = glutCreateMenu(self.paddleSetKey)
@@ -44,46 +55,6 @@ class Pinball(ACGame):
     glutAddMenuEntry("Change Launch Key", 2)
     glutAttachMenu(GLUT_RIGHT_BUTTON)
 
-    # Set the keys used, connecting paddles with keys
-    self.paddles['l'].key = settings['keys']['l']
-    self.paddles['r'].key = settings['keys']['r']
-
-    # trigger game-over to wait for new round start
-    self.gameOver()
-
-  def gameOver(self):
-    """"Set the status variables to signify the end of a round"""
-    self.done = True
-    self.ball.hidden = True
-    self.ball_count = 5
-
-  def nextBall(self):
-    """Set up the ball at the starting point and start round"""
-    self.done = False
-    self.ball.location = list(self.ball.vecAdd(self.startLocation, self.startOffset))
-    self.ball.velocity = list(self.startVelocity)
-    self.ball.hidden = False
-
-  def roundComplete(self):
-    """A round is complete, the ball reached the bottom"""
-    self.ball.hidden = True
-
-    if self.ball_count == 0:
-      self.gameOver()
-
-  def roundStart(self):
-    """Start a new round, init score and such"""
-    if self.done:
-      self.ball_count = 5
-      self.score = 0
-      self.nextBall()
-    elif (not self.ball.hidden) and self.ball_count == 0:
-      self.roundComplete()
-    else:
-      self.nextBall()
-
-    self.ball_count -= 1
-
   def render(self):
     """Render the whole game"""
 
@@ -104,55 +75,33 @@ class Pinball(ACGame):
         a = math.atan(v[0]/v[2]) + factor
         glRotated(a*-180/math.pi, 0.0, 1.0, 0.0)
 
-      p = self.ball.location
+      p = self.ball.renderLocation()
       glTranslatef(-1*p[0], -0.1, -1*p[2])
 
 
+    # Render light above current view location
+    glLightfv(GL_LIGHT2, GL_POSITION, (0, 4.24, 4.24))
+
     # Render the scene now that the view is configured
-    ACGame.render(self)
+    ACRenderer.render(self)
 
     glDisable(GL_LIGHTING)
     glColor3f(0.0, 0.0, 0.0)
 
     # render text for score and fps and balls remaining
     self.set2D()
+    message = ''
     if self.done:
-      self.displayString((-2.5, 0.0, 14.0), "Press space to Start")
-    elif self.ball.hidden:
-      self.displayString((-2.5, 0.0, 14.0), "Press space to continue")
-
-    self.displayString((2.0, 0.0, 22.0), "FPS: %s" % self.fps)
-    self.displayString((-2.5, 0.0, 22.0), "Remaining: %d" % self.ball_count)
-    self.displayString((-2.5, 0.0, 19.0), "Score: %d" % self.score)
-
-
-  def getObjectClass(self, dat):
-    """Get the Class to use for a given object, based on the AC3D object name"""
-    if dat.has_key('name'):
-      if dat['name'].startswith('paddle'):
-        return Paddle
-      elif dat['name'] == 'ball':
-        return Ball
-      elif dat['name'] == 'peg':
-        return Peg
-      elif dat['name'].startswith('triangle'):
-        return RubberTriangle
-      elif dat['name'] == 'drop':
-        return Drop
-      elif dat['name'] == 'dropitem':
-        return DropItem
-      elif dat['name'] == 'bumperbase':
-        return Bumper
-      elif dat['name'].startswith('start'):
-        return StartPoint
-      elif dat['name'] == 'gameover':
-        return GameOver
-      elif dat['name'] == 'spinner':
-        return Spinner
-
-    return ACGame.getObjectClass(self, dat)
-
+      message = "Press space to Start"
+    elif not self.inPlay():
+      message = "Press space to continue"
 
+    self.drawText(self.hud, [
+      ((-2.5, 0.0, 14.0), message),
+      ((2.0, 0.0, 22.0), "FPS: %s" % self.fps),
+      ((-2.5, 0.0, 22.0), "Remaining: %d" % self.ball_count),
+      ((-2.5, 0.0, 19.0), "Score: %d" % self.score),
+    ])
 
   def set2D(self):
     """Set up a 2D ortho view of the board"""
@@ -192,17 +141,7 @@ class Pinball(ACGame):
       self.viewMode = (self.viewMode + 1)%3
       self.reshapeFunc(self.width, self.height)
 
-    # Check for ball launch, and start round
-    elif key == self.launchKey:
-      self.roundStart()
-      pass
-
-    # If it is None, the menu option was selected, so save the first key pressed
-    elif self.launchKey is None:
-      self.launchKey = key
-
-    ACGame.keyDown(self, key, x, y)
-
+    ACRenderer.keyDown(self, key, x, y)
 
   def paddleSetKey(self, type):
     """Menu callback for right-click menu"""
@@ -218,340 +157,20 @@ class Pinball(ACGame):
       self.launchKey = None
 
 
-
-
-
-
-
-
-
-class Paddle(ACGameObject):
-  """Paddle class that manages the behavior of the paddle rendered in the game
-
-  Rotates the vertices of the object based on angle, and recognizes key presses and such
-  """
-
-  def __init__(self, dat, r):
-    self.angle = 0        # Current angle of paddle
-    self.direction = -1   # Current direction of motion (up or down)
-    self.side = dat['name'].endswith('-r') and -1 or 1    # Control which direction each paddle rotates
-    self.max_angle = 40   # Max allowed angle of paddle
-    self.key = None       # the key to watch for to control this paddle
-    self.waiting = False  # The paddle has no key selected, this means it should grab the next key pressed
-    self.calcVerts = []   # The computed rotated vertices
-
-    # set reference to paddle in renderer
-    r.paddles[dat['name'][-1]] = self
-
-    ACGameObject.__init__(self, dat, r)
-
-  def keyPress(self, dir, key, x, y):
-    """Key press handler for paddle"""
-    if self.waiting:
-      self.key = key
-      self.waiting = False
-    if self.key == key:
-      self.direction = -1*dir
-
-  def __inMotion(self):
-    return (self.angle < self.max_angle and self.direction == 1) or (self.angle > 0 and self.direction == -1)
-
-  def update(self, time):
-    """Animation function. Updates the angle based on the elapsed time"""
-    if self.__inMotion():
-      self.angle += self.direction*time.microseconds/2000.0
-      self.calcVerts = []
-      self.getVertices()
-
-    if self.angle < 0:
-      self.angle = 0
-    elif self.angle > self.max_angle:
-      self.angle = self.max_angle
-
-  def draw(self):
-    """Draw the paddle rotated by the given angle"""
-    glRotate(self.side * self.angle, 0.0, 1.0, 0.0)
-    # Renders using the a standard display list
-    ACGameObject.draw(self)
-    glRotate(-1*self.side*self.angle, 0.0, 1.0, 0.0)
-
-  def getVertices(self):
-    """Override default vertex function to return computed rotated vertices"""
-    if not self.calcVerts:
-      # Multiple each vertex by the rotation matrix
-      a = -1*self.side*self.angle*math.pi/180
-      self.calcVerts = [(v[0]*math.cos(a) - v[2]*math.sin(a), v[1], v[2]*math.cos(a) + v[0]*math.sin(a)) for v in self.vertices]
-      self.processSurfaces()
-
-    return self.calcVerts
-
-  def hitBy(self, object, surface):
-    """Callback when hit by ball"""
-    #If the paddle is moving and the ball hits it, it adds a bit of the surface normal vector to the ball's velocity
-    if self.__inMotion():
-      mult = 1.5
-      object.velocity = list(self.vecAdd(object.velocity, self.vecMult(surface['norm'], mult)))
-    ACGameObject.hitBy(self, object, surface)
-
-
-
-
-
-
-class Ball(ACGameObject):
-  """Ball class that calculates collisions with other renderer objects
-  and other fanciness
-  """
-
-  def __init__(self, dat, r):
-    ACGameObject.__init__(self, dat, r)
-    r.ball = self # Set ball reference on renderer
-
-    self.hidden = True
-    self.radius = math.sqrt(sum([i*i for i in self.vertices[0]]))
-
-  def update(self, time):
-    """Animation callback for ball, checks for collisions and modifies velocity of ball"""
-    if self.hidden:
-      return
-
-    speed = self.vecMag(self.velocity)
-    # Check for collision based on current position and velocity
-    (surface, object, distance) = self.getClosestSurface()
-    if object :
-      n = surface['norm']
-
-      print "Hit %s" % (object.name, )
-
-
-      # Passive objects are affected by ball, but have no effect on it
-      if not object.passive:
-
-        # move back along path to just before collision with surface
-        mv =  0.004 + self.radius - distance
-        self.location = self.vecSub(self.location, self.vecMult(self.velocity, mv/speed))
-
-        # calculate new velocity reflected off the surface normal
-        mag = -2*self.vecDot(n, self.velocity)/speed
-        new_vel = self.vecAdd(self.velocity, self.vecMult(n,mag))
-
-        # set new velocity and scale, plus account for velocity changes during previous vector calculations
-        new_vel = self.vecMult(new_vel, speed/self.vecMag(new_vel))
-
-        # scale velocity by collision factor
-        self.velocity = list(self.vecMult(new_vel, object.collisionFactor))
-
-      # Trigger the object's hitBy function
-      object.hitBy(self, surface)
-    
-    # Cap the speed so it doesn't get too crazy
-    if speed > 3.5:
-      self.velocity = list(self.vecMult(self.velocity, 2.0/self.vecMag(self.velocity)))
-    # Apply some gravity
-    self.velocity[2] += time.microseconds*(math.tan(7*math.pi/180)*6.0)/500000
-
-    ACGameObject.update(self, time)
-
-  def getClosestSurface(self, objs = None):
-    """Get the closest surface and object based on a list of objects"""
-    if objs == None:
-      objs = self.renderer.loaders
-
-    (surface, object, dist) = (None, None, float('inf'))
-
-    # Check every object to find which has the closest surface
-    for o in objs:
-      if o == self or o.hidden:
-        continue
-      # Check the object first
-      v = self.getClosestObjectSurface(o)
-      if abs(v[1]) < abs(dist):
-        (surface, object, dist) = (v[0], o, v[1])
-      # Then check the object's children
-      v = self.getClosestSurface(o.subobjects)
-
-      if abs(v[2]) < abs(dist):
-        (surface, object, dist) = v
-
-    return (surface, object, dist)
-
-  def getClosestObjectSurface(self, obj):
-    """Get the closest surface of a given object"""
-    dbg = self.debug
-
-    if dbg: print "Checking surfaces of %s" % obj.name
-
-    (surface, dist) = (None, float('inf'))
-    if len(obj.surfaces) < 3:
-      return (surface, dist)
-    loc = self.location
-
-    verts = obj.getVertices()
-
-    outside = False
-    for s in obj.surfaces:
-      if dbg: print "Checking Norm: %s Center %s" % (s['norm'], s['center'])
-      p1 = verts[s['refs'][0][0]]
-      n = s['norm']
-      # Ignore surface if its normal is horizontal
-      if abs(n[1]) > 0.05:
-        if dbg: print "Discarding, not vertical"
-        continue
-
-      # Calculate signed distance from the plane
-      D = ((n[0]*loc[0] + n[1]*loc[1] + n[2]*loc[2]) - (n[0]*(obj.position[0]+p1[0]) + n[1]*(obj.position[1]+p1[1]) + n[2]*(obj.position[2] + p1[2])))
-
-      if dbg: print "Distance: %f Current: %f" % (D, dist)
-
-      # If ball farther than radius, it cannot be inside, so break
-      if D > self.radius:
-        outside = True
-        if dbg: print "object is outside, breaking"
-        break
-
-      # Use abs to find the surface that the ball is closest to
-      if abs(D) < abs(dist):
-        if dbg: print "Surface is at distance %f, less that %f" % (D, dist)
-        (surface, dist) = (s, D)
-
-    # If we broke, it is outside the object
-    if outside:
-      return (None, float('inf'))
-
-    if dbg: print "Final Surface: dist: %f surf:%s" % (dist, surface)
-    return (surface, dist)
-
-
-
-
-class Peg(ACGameObject):
-  """Peg class to specify basic peg characteristics"""
-  def __init__(self, data, r):
-    ACGameObject.__init__(self, data, r)
-    self.collisionFactor = 0.95
-    self.points = 100
-
-
-class RubberTriangle(ACGameObject):
-  """Triangle class to specify triangle characteristics"""
-  def __init__(self, data, r):
-    ACGameObject.__init__(self, data, r)
-    self.collisionFactor = 1.0
-    self.points = 200
-    
-  def hitBy(self, object, surface):
-    """The triangles add a bit of speed to the ball, based on surface normal"""
-    mult = 1.0
-    object.velocity = list(self.vecAdd(object.velocity, self.vecMult(surface['norm'], mult)))
-    ACGameObject.hitBy(self, object, surface)
-
-
-
-
-class Drop(ACGameObject):
-  """Parent drop class for each group of three drop items"""
-  def __init__(self, data, r):
-    ACGameObject.__init__(self, data, r)
-    self.count = 0
-
-  def childHit(self, child):
-    """Triggered when a drop item is hit, when all three are hit, 
-    we add extra points and show all items again
-    """
-    self.count += 1
-    child.points = 500
-
-    if self.count == 3:
-      child.points = 5000
-      self.count = 0
-      for o in self.subobjects:
-        o.hidden = False
-
-class DropItem(ACGameObject):
-  """Drop item class for basic params and triggers parent event"""
-  def __init__(self, data, r):
-    ACGameObject.__init__(self, data, r)
-    self.collisionFactor = 0.7
-
-  def hitBy(self, obj, surface):
-    self.hidden = True
-    self.parent.childHit(self) #let the parent know this child was hit
-    ACGameObject.hitBy(self, obj, surface)
-
-class Bumper(ACGameObject):
-  """Bumper specific settings"""
-  def __init__(self, data, r):
-    ACGameObject.__init__(self, data, r)
-    self.collisionFactor = 1.1
-    self.points = 200
-
-class StartPoint(ACGameObject):
-  """Starting point class to just let renderer know available starting points"""
-  def __init__(self, data, renderer):
-    ACGameObject.__init__(self, data, renderer);
-    renderer.starting[self.name] = self
-
-class GameOver(ACGameObject):
-  """GameOver class to track when the bottom block on the game board gets hit"""
-  def hitBy(self, obj, surface):
-    self.renderer.roundComplete()
-
-
-class Spinner(ACGameObject):
-  """Fancy spinner class to manage animation and such"""
-  def __init__(self, data, renderer):
-    ACGameObject.__init__(self, data, renderer);
-    self.passive = True   # The ball makes this move, but the ball doesn't bounce off of it
-    self.angle = 0        # Current animation angle
-    self.speed = 0        # current animation speed
-
-    self.points = 1000    
-
-    self.rot = self.surfaces[3]['norm']   # Rotation axis vector, manually set by looking at file
-
-  def hitBy(self, obj, surface):
-    """When hit by ball, start spinning"""
-    self.speed = 20
-
-  def update(self, time):
-    """Animation function. Increase angle based on speed and slowly decrease speed"""
-    self.angle += self.speed*10000/time.microseconds
-
-    self.speed -= 0.1
-    if self.speed < 0:
-      self.speed = 0
-
-  def draw(self):
-    """Render the spinner rotated around the rotation axit"""
-    r = self.rot
-    glRotate(self.angle, r[0], r[1], r[2])
-    ACGameObject.draw(self)
-    glRotate(-1*self.angle, r[0], r[1], r[2])
-
-
-
 if __name__ == '__main__':
   glutInit(sys.argv)
 
-  # default settings for pinball
-  settings = {
-    'mode': 0,
-    'start': 1,
-    'velocity': [0,0,-3.2],
-    'offset': [0, 0, 0],
-    'debug': False,
-    'keys': {
-      'l': 'z',
-      'r': '/',
-      'fire': ' ',
-    },
-    'gamefile': 'Pinball0_5.ac',
-    'wireframe': False,
-  }
+  settings = copy.deepcopy(SETTINGS)
+  record = None
+  play = None
+  profile = False
+  trace = None
+  log = None
 
   # Read command line arguments and override default settings where applicable
   try:
-    opts, args = getopt.getopt(sys.argv[1:], 'g:m:s:v:o:hdw', ["game=", "mode=", "start=", "vel=", "offset=", "help", 'debug', 'wire'])
+    opts, args = getopt.getopt(sys.argv[1:], 'g:m:s:v:o:r:f:B:R:P:t:l:hdwabinp', ["game=", "mode=", "start=", "vel=", "offset=", "rate=", "fps=", "balls=", "record=", "play=",
+                                                                           "trace=", "log=", "help", 'debug', 'wire', 'arrays', 'batch', 'instance', 'nocull', 'profile'])
   except getopt.GetoptError:
     print __doc__
     sys.exit(2)
@@ -571,12 +190,59 @@ if __name__ == '__main__':
       settings['gamefile'] = arg
     elif opt in ('-w', '--wire'):   # Display board in wireframe mode
       settings['wireframe'] = True
+    elif opt in ('-a', '--arrays'): # Use array backed geometry
+      settings['arrays'] = True
+    elif opt in ('-b', '--batch'):  # Use the batched vertex buffer renderer
+      settings['batch'] = True
+    elif opt in ('-i', '--instance'): # Share geometry between copies of a mesh
+      settings['instancing'] = True
+    elif opt in ('-n', '--nocull'): # Turn off view frustum culling
+      settings['culling'] = False
+    elif opt in ('-r', '--rate'):   # Physics steps per second
+      settings['rate'] = int(arg)
+    elif opt in ('-f', '--fps'):    # Target frame rate
+      settings['fps'] = int(arg)
+    elif opt in ('-B', '--balls'):  # Multiball
+      settings['balls'] = int(arg)
+    elif opt in ('-R', '--record'): # Record the game
+      record = arg
+    elif opt in ('-P', '--play'):   # Watch a replay
+      play = arg
+    elif opt in ('-p', '--profile'): # Show the frame phase timings
+      profile = True
+    elif opt in ('-t', '--trace'):  # Save the frame phase timings
+      trace = arg
+    elif opt in ('-l', '--log'):    # Log game events
+      log = arg
     elif opt in ('-h', '--help'):   # Display usage
       print __doc__
       sys.exit()
     elif opt in ('-d', '--debug'):  # This does nothing :P
       settings['debug'] = bool(arg)
 
+  if play:
+    replay = ACReplay(play)
+    settings.update(replay.info['settings'])
+
+  game = Pinball(settings)
+  if play:
+    replay.play(game)
+  elif record:
+    # The window is closed with sys.exit, so finish the replay on the way out
+    recorder = ACRecorder(game, record, {'settings': dict([(k, settings[k]) for k in REPLAY_SETTINGS])})
+    atexit.register(recorder.close)
+
+  if log:
+    game.log = ACEventLog(log, settings['rate'], LOG_LIMITS)
+    atexit.register(game.log.close)
+
+  if profile or trace:
+    profiler = ACProfiler(trace=trace is not None)
+    profiler.overlay = profile
+    profiler.attach(game)
+    if trace:
+      atexit.register(profiler.writeTrace, trace)
+
   # Exec main loop
-  Pinball(settings).run()
+  game.run()
 
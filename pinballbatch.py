@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+"""Vectorized pinball, steps many independent tables at once without OpenGL
+
+Usage: python pinballbatch.py [options]
+
+Options:
+ -g ..., --game=...     Specify different game model ac file (default Pinball0_6.ac)
+ -n ..., --tables=...   Number of tables to step at once (default 256)
+ -t ..., --time=...     Seconds of game time to simulate (default 10)
+ -r ..., --rate=...     Physics steps per second (default 200)
+ -x ..., --seed=...     Seed for the random paddle presses (default 0)
+ -c, --compare          Also time the same number of steps of a single PinballGame
+ -h, --help             Display this menu
+
+Every table gets its own random paddle presses. The throughput is printed in
+table-steps per second, along with the scores the tables reached.
+"""
+
+import sys
+import copy
+import time
+import getopt
+
+from pinballgame import *
+
+
+class PinballBatch:
+  """Many tables of the same board, stepped together by one batched kernel
+
+  A template PinballGame is loaded once for the geometry and the kind of
+  each object. After that, the state of every table, its ball, paddles,
+  score and drop targets, lives in numpy arrays with a row per table, and
+  each step moves all balls at once. The physics follows Ball.update step
+  for step, the overlap check, speed cap, substeps and swept bounces, with
+  the arithmetic in the same order, so a single table runs the same game as
+  PinballGame with the same key presses.
+
+  Use it like a vectorized Gym environment. step takes a paddle action for
+  every table, 1 to hold a paddle up and 0 to let it drop, with the columns
+  in the order of paddles, and returns (observations, rewards, done). A
+  table is done when its last ball drains, and it starts a new game on the
+  next step. A drained ball is relaunched on the next step too.
+  """
+  paddles = ('l', 'r')    # Order of the paddle columns in actions
+  ballsPerGame = 5
+
+  def __init__(self, settings, tables):
+    if numpy is None:
+      raise ImportError("The batch simulator needs the python-numpy package installed")
+
+    game = PinballGame(settings)    # Only its board is used, it is never stepped
+    self.game = game
+    self.count = tables
+    self.steps = 0
+    self.dt = game.delta
+    self.radius = game.ball.radius
+
+    self.__describe(game)
+
+    # State of every table
+    self.location = numpy.zeros((tables, 3))
+    self.velocity = numpy.zeros((tables, 3))
+    self.live = numpy.zeros(tables, dtype=bool)     # The ball is in play
+    self.done = numpy.ones(tables, dtype=bool)      # The game is over, a new one starts on the next step
+    self.balls = numpy.zeros(tables, dtype=int)     # Balls left after the one in play
+    self.score = numpy.zeros(tables, dtype=numpy.int64)
+    self.angle = numpy.zeros((tables, len(self.paddles)))
+    self.direction = -1*numpy.ones((tables, len(self.paddles)), dtype=int)
+    self.spin = numpy.zeros((tables, len(self.paddles) + 1))
+    self.hidden = numpy.zeros((tables, len(self.objects)), dtype=bool)
+    self.dropCount = numpy.zeros((tables, len(self.groups)), dtype=int)
+    self.hits = numpy.zeros((tables, len(self.objects)), dtype=int)   # Times each object was hit
+
+    # Launch settings, per table so they can be varied
+    self.startLocation = numpy.tile(game.ball.vecAdd(game.startLocation, game.startOffset), (tables, 1))
+    self.startVelocity = numpy.tile(numpy.array(game.startVelocity, dtype=float), (tables, 1))
+
+    self.__turn()
+
+  def __describe(self, game):
+    """Flatten the board into per object and per plane arrays"""
+    planes = game.collisions.planes
+    frames = [game.paddles[p] for p in self.paddles]
+
+    self.objects = []
+    rows = []
+    for (order, o) in game.collisions.entries:
+      if not o.collides or len(o.surfaces) < 3:
+        continue
+      (start, count) = planes.lookup(o)
+      if count:
+        self.objects.append(o)
+        rows.append((start, count))
+    self.names = [o.name for o in self.objects]
+
+    # Planes of all objects, paddle planes are in the unturned paddle's frame
+    cols = numpy.concatenate([numpy.arange(s, s + c) for (s, c) in rows])
+    counts = numpy.array([c for (s, c) in rows])
+    (norms, consts) = planes.views()
+    norms = norms[cols]
+    (self.nx, self.ny, self.nz) = (norms[:, 0], norms[:, 1], norms[:, 2])
+    self.consts = consts[cols]
+    self.counts = counts
+    self.starts = numpy.cumsum(counts) - counts
+    self.owner = numpy.repeat(numpy.arange(len(self.objects)), counts)
+
+    # Frame 0 is the world, frame k is paddle k - 1
+    frame = numpy.array([o in frames and frames.index(o) + 1 or 0 for o in self.objects])
+    self.frame = frame
+    self.colFrame = frame[self.owner]
+    self.side = numpy.array([p.side for p in frames])
+    self.maxAngle = numpy.array([p.max_angle for p in frames], dtype=float)
+    self.swingRate = numpy.array([p.swingRate for p in frames])
+    self.pivot = numpy.array([[0.0, 0.0]] + [[p.position[0], p.position[2]] for p in frames])
+
+    # Where the ball has to be to touch each object, at about the height it starts at
+    self.height = game.startLocation[1] + game.startOffset[1]
+    self.yTolerance = game.collisions.yTolerance
+    boxes = []
+    for o in self.objects:
+      box = game.collisions.region(o, self.radius, self.height)
+      boxes.append(box is True and (-numpy.inf, -numpy.inf, numpy.inf, numpy.inf) or box or (numpy.inf, numpy.inf, -numpy.inf, -numpy.inf))
+    self.boxes = numpy.array(boxes, dtype=float)
+
+    # How each object reacts to being hit
+    self.passive = numpy.array([o.passive for o in self.objects])
+    self.factor = numpy.array([o.collisionFactor for o in self.objects])
+    self.points = numpy.array([(not isinstance(o, (Spinner, GameOver))) and o.points or 0 for o in self.objects])
+    self.boost = numpy.array([isinstance(o, RubberTriangle) for o in self.objects])
+    self.drain = numpy.array([isinstance(o, GameOver) for o in self.objects])
+
+    # Drop targets, each group comes back once all of its items are down
+    self.groups = []
+    group = []
+    for o in self.objects:
+      if isinstance(o, DropItem):
+        if o.parent not in self.groups:
+          self.groups.append(o.parent)
+        group.append(self.groups.index(o.parent))
+      else:
+        group.append(-1)
+    self.group = numpy.array(group)
+
+  def reset(self, tables = None):
+    """Start a new game on the tables in a mask or list of indices, or on all of them"""
+    if tables is None:
+      tables = numpy.ones(self.count, dtype=bool)
+    self.score[tables] = 0
+    self.balls[tables] = self.ballsPerGame
+    self.done[tables] = False
+    self.live[tables] = False
+    self.hidden[tables] = False
+    self.dropCount[tables] = 0
+    self.hits[tables] = 0
+    self.angle[tables] = 0
+    self.direction[tables] = -1
+    self.__turn()
+    return self.observe()
+
+  def observe(self):
+    """Get the observation of every table, one row of ball x, z, velocity x, z and paddle angles"""
+    return numpy.column_stack((self.location[:, 0], self.location[:, 2], self.velocity[:, 0], self.velocity[:, 2], self.angle))
+
+  def step(self, actions = None):
+    """Run one physics step of every table, returns (observations, rewards, done)
+
+    actions is an array with a row per table and a column per paddle, or None
+    to keep the paddles as they are.
+    """
+    if self.done.any():
+      self.reset(self.done)
+
+    # Launch the next ball on tables where it drained
+    launch = ~self.live
+    self.location[launch] = self.startLocation[launch]
+    self.velocity[launch] = self.startVelocity[launch]
+    self.live[launch] = True
+    self.balls[launch] -= 1
+
+    if actions is not None:
+      self.direction[:] = numpy.where(numpy.asarray(actions) > 0, 1, -1)
+
+    score = self.score.copy()
+    self.__swing()
+    self.__update()
+    self.steps += 1
+    return (self.observe(), self.score - score, self.done.copy())
+
+  def __swing(self):
+    """Move the paddles, like Paddle.update"""
+    d = self.direction
+    moving = ((self.angle < self.maxAngle) & (d == 1)) | ((self.angle > 0) & (d == -1))
+    self.angle = numpy.where(moving, self.angle + d*self.swingRate*self.dt, self.angle)
+    self.angle = numpy.clip(self.angle, 0, self.maxAngle)
+
+    moving = ((self.angle < self.maxAngle) & (d == 1)) | ((self.angle > 0) & (d == -1))
+    self.spin[:, 1:] = numpy.where(moving, -1*self.side*d*self.swingRate*math.pi/180, 0.0)
+    self.__turn()
+
+  def __turn(self):
+    """Work out the rotation of every paddle frame, frames that aren't turned keep the world origin"""
+    rotation = numpy.zeros(self.spin.shape)
+    rotation[:, 1:] = -1*self.side*self.angle*math.pi/180
+    self.cos = numpy.cos(rotation)
+    self.sin = numpy.sin(rotation)
+    turned = rotation != 0
+    self.originX = numpy.where(turned, self.pivot[:, 0], 0.0)
+    self.originZ = numpy.where(turned, self.pivot[:, 1], 0.0)
+
+  def __pairs(self, rows, p0, p1, solid):
+    """Find the objects each ball could touch moving from p0 to p1, like ACCollisionIndex.near
+
+    Returns (pair, column, first, ball, object). The pairs of a ball and an
+    object come grouped by ball, in board order for each ball, with ball and
+    object giving the row in rows and the object of each pair, and first the
+    index of its first plane. pair and column give the pair and plane table
+    column of every plane to check.
+    """
+    (lo, hi) = (numpy.minimum(p0, p1), numpy.maximum(p0, p1))
+    b = self.boxes
+    near = (lo[:, 0:1] <= b[:, 2]) & (hi[:, 0:1] >= b[:, 0]) & (lo[:, 2:3] <= b[:, 3]) & (hi[:, 2:3] >= b[:, 1])
+
+    # The regions only hold near the height they were worked out for
+    near |= (numpy.abs(p0[:, 1] - self.height) > self.yTolerance)[:, None]
+    near &= ~self.hidden[rows]
+    if solid:
+      near &= ~self.passive
+
+    (ball, obj) = numpy.nonzero(near)
+    counts = self.counts[obj]
+    first = numpy.cumsum(counts) - counts
+    pair = numpy.repeat(numpy.arange(len(obj)), counts)
+    col = self.starts[obj][pair] + numpy.arange(counts.sum()) - first[pair]
+    return (pair, col, first, ball, obj)
+
+  def __local(self, rows, p, ball, col):
+    """Get the x, y and z of balls in the frame of each plane, like ACObject.localPoint"""
+    (ox, oz) = (self.originX[rows], self.originZ[rows])
+    (c, s) = (self.cos[rows], self.sin[rows])
+    (x, z) = (p[:, 0:1] - ox, p[:, 2:3] - oz)
+    f = self.colFrame[col]
+    return ((ox + x*c + z*s)[ball, f], p[ball, 1], (oz - x*s + z*c)[ball, f])
+
+  def __distances(self, col, l):
+    """Get the signed distance from local points to planes"""
+    return (self.nx[col]*l[0] + self.ny[col]*l[1] + self.nz[col]*l[2]) - self.consts[col]
+
+  def __best(self, ball, value):
+    """Get the pair with the lowest finite value for each ball, the first one on ties"""
+    order = numpy.lexsort((numpy.arange(len(ball)), value, ball))
+    first = order[numpy.r_[True, ball[order][1:] != ball[order][:-1]]]
+    return first[numpy.isfinite(value[first])]
+
+  def __plane(self, pairs, pair, match):
+    """Get the first plane of each of the given pairs where match is set"""
+    chosen = numpy.zeros(len(match), dtype=bool)
+    chosen[pairs] = True
+    hits = numpy.nonzero(chosen[pair] & match)[0]
+    (found, index) = numpy.unique(pair[hits], return_index=True)
+    return hits[index][numpy.searchsorted(found, pairs)]
+
+  def __world(self, rows, col):
+    """Get the world space normals of planes, like ACObject.worldSurface"""
+    f = self.colFrame[col]
+    (c, s) = (self.cos[rows, f], self.sin[rows, f])
+    (nx, ny, nz) = (self.nx[col], self.ny[col], self.nz[col])
+    return numpy.column_stack((nx*c - nz*s, ny, nx*s + nz*c))
+
+  def __update(self):
+    """Move the balls in play through the step, like Ball.update"""
+    rows = numpy.nonzero(self.live)[0]
+    if len(rows):
+      self.__resolve(rows)
+
+    # Cap the speed so it doesn't get too crazy
+    v = self.velocity[rows]
+    speed = numpy.abs(numpy.sqrt(v[:, 0]**2 + v[:, 1]**2 + v[:, 2]**2))
+    fast = speed > Ball.maxSpeed
+    self.velocity[rows[fast]] = v[fast]*(Ball.cappedSpeed/speed[fast])[:, None]
+
+    # Split the step up so gravity is applied smoothly
+    v = self.velocity[rows]
+    speed = numpy.abs(numpy.sqrt(v[:, 0]**2 + v[:, 1]**2 + v[:, 2]**2))
+    dt = self.dt
+    substeps = numpy.maximum(1, numpy.ceil(speed*dt/(Ball.substepTravel*self.radius))).astype(int)
+    for i in xrange(len(rows) and substeps.max()):
+      # Like Ball.update, a ball that drained while overlapping still moves one substep
+      keep = (substeps > i) & (self.live[rows] | (i == 0))
+      (r, n) = (rows[keep], substeps[keep])
+      self.velocity[r, 2] += GRAVITY*dt/n
+      self.__move(r, dt/n)
+
+  def __resolve(self, rows):
+    """Push balls out of anything they overlap, like the start of Ball.update"""
+    loc = self.location[rows]
+    (pair, col, first, ball, obj) = self.__pairs(rows, loc, loc, False)
+    if not len(pair):
+      return
+    D = self.__distances(col, self.__local(rows, loc, ball[pair], col))
+
+    # The ball is inside an object when it is within its radius of all the object's planes
+    A = numpy.abs(D)
+    inside = numpy.maximum.reduceat(D, first) <= self.radius
+    closest = numpy.where(inside, numpy.minimum.reduceat(A, first), numpy.inf)
+    best = self.__best(ball, closest)
+    if not len(best):
+      return
+
+    plane = self.__plane(best, pair, A == closest[pair])
+    (rows, obj, col) = (rows[ball[best]], obj[best], col[plane])
+    (n, d) = (self.__world(rows, col), D[plane])
+
+    # Passive objects are affected by the ball, but have no effect on it
+    solid = ~self.passive[obj]
+    (r, o, m) = (rows[solid], obj[solid], n[solid])
+    self.location[r] = self.location[r] + m*(self.radius - d[solid] + Ball.skin)[:, None]
+    self.__bounce(r, o, m, self.location[r] - m*self.radius)
+
+    self.__hit(rows, obj, n)
+
+  def __move(self, rows, dt):
+    """Move balls along their velocities, bouncing off surfaces in the order they reach them, like Ball.move"""
+    for i in range(Ball.maxBounces):
+      if not len(rows):
+        return
+      start = self.location[rows]
+      end = start + self.velocity[rows]*dt[:, None]
+      (t, obj, col) = self.__sweep(rows, start, end)
+
+      free = obj < 0
+      self.location[rows[free]] = end[free]
+
+      hit = ~free
+      (rows, dt, t, obj, col, start) = (rows[hit], dt[hit], t[hit], obj[hit], col[hit], start[hit])
+      n = self.__world(rows, col)
+
+      # Move up to the surface, stopping just short of it, and use up that much of the step
+      self.location[rows] = start + self.velocity[rows]*(dt*t)[:, None] + n*Ball.skin
+      dt = dt*(1 - t)
+
+      self.__bounce(rows, obj, n, self.location[rows] - n*self.radius)
+      self.__hit(rows, obj, n)
+
+      keep = self.live[rows]
+      (rows, dt) = (rows[keep], dt[keep])
+
+  def __sweep(self, rows, p0, p1):
+    """Find the first plane each ball runs into, like ACPlaneTable.sweep
+
+    Returns (t, object, plane) arrays, with the object -1 where the ball gets
+    to p1 without running into anything.
+    """
+    t = numpy.inf*numpy.ones(len(rows))
+    obj = -1*numpy.ones(len(rows), dtype=int)
+    plane = numpy.zeros(len(rows), dtype=int)
+    (pair, col, first, ball, objs) = self.__pairs(rows, p0, p1, True)
+    if not len(pair):
+      return (t, obj, plane)
+
+    l0 = self.__local(rows, p0, ball[pair], col)
+    l1 = self.__local(rows, p1, ball[pair], col)
+    f = self.__distances(col, l0) - self.radius
+    df = self.nx[col]*(l1[0] - l0[0]) + self.ny[col]*(l1[1] - l0[1]) + self.nz[col]*(l1[2] - l0[2])
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      s = -f/df
+    entering = numpy.where(df < 0, s, -numpy.inf)
+    enter = numpy.maximum.reduceat(entering, first)
+    leave = numpy.minimum.reduceat(numpy.where(df > 0, s, numpy.inf), first)
+    outside = numpy.logical_or.reduceat((df == 0) & (f > 0), first)
+
+    enter = numpy.where((enter >= 0) & (enter <= 1) & (enter <= leave) & ~outside, enter, numpy.inf)
+    best = self.__best(ball, enter)
+    k = ball[best]
+    (t[k], obj[k]) = (enter[best], objs[best])
+    plane[k] = col[self.__plane(best, pair, entering == enter[pair])]
+    return (t, obj, plane)
+
+  def __bounce(self, rows, obj, n, point):
+    """Reflect velocities off surfaces, relative to how fast the surfaces move, like Ball.bounce"""
+    f = self.frame[obj]
+    spin = self.spin[rows, f]
+    (px, pz) = (self.pivot[f, 0], self.pivot[f, 1])
+    surface = numpy.column_stack((-1*spin*(point[:, 2] - pz), numpy.zeros(len(rows)), spin*(point[:, 0] - px)))
+
+    rel = self.velocity[rows] - surface
+    dot = n[:, 0]*rel[:, 0] + n[:, 1]*rel[:, 1] + n[:, 2]*rel[:, 2]
+    new = (rel - n*(2*dot)[:, None])*self.factor[obj][:, None] + surface
+    self.velocity[rows] = numpy.where((dot < 0)[:, None], new, self.velocity[rows])
+
+  def __hit(self, rows, obj, n):
+    """Apply what the objects do when the ball hits them, like their hitBy"""
+    self.hits[rows, obj] += 1
+    points = self.points[obj]
+
+    # Triangles add a bit of speed along the surface normal
+    b = self.boost[obj]
+    self.velocity[rows[b]] = self.velocity[rows[b]] + n[b]*1.0
+
+    # Drop items go down, and all of a group come back up once the last one is down
+    g = self.group[obj]
+    for k in numpy.nonzero(g >= 0)[0]:
+      (r, o) = (rows[k], obj[k])
+      self.hidden[r, o] = True
+      self.dropCount[r, g[k]] += 1
+      points[k] = 500
+      if self.dropCount[r, g[k]] == 3:
+        points[k] = 5000
+        self.dropCount[r, g[k]] = 0
+        self.hidden[r, self.group == g[k]] = False
+    self.score[rows] += points
+
+    # The ball reached the bottom, and the game is over if it was the last one
+    d = rows[self.drain[obj]]
+    self.live[d] = False
+    self.done[d] = self.balls[d] == 0
+
+
+if __name__ == '__main__':
+  settings = copy.deepcopy(SETTINGS)
+  settings['gamefile'] = 'Pinball0_6.ac'
+  tables = 256
+  seconds = 10.0
+  seed = 0
+  compare = False
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'g:n:t:r:x:ch', ["game=", "tables=", "time=", "rate=", "seed=", "compare", "help"])
+  except getopt.GetoptError:
+    print __doc__
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt in ('-g', '--game'):
+      settings['gamefile'] = arg
+    elif opt in ('-n', '--tables'):
+      tables = int(arg)
+    elif opt in ('-t', '--time'):
+      seconds = float(arg)
+    elif opt in ('-r', '--rate'):
+      settings['rate'] = int(arg)
+    elif opt in ('-x', '--seed'):
+      seed = int(arg)
+    elif opt in ('-c', '--compare'):
+      compare = True
+    elif opt in ('-h', '--help'):
+      print __doc__
+      sys.exit()
+
+  batch = PinballBatch(settings, tables)
+  steps = int(seconds*settings['rate'])
+  rand = numpy.random.RandomState(seed)
+
+  # Each paddle of each table flips its state every 40 steps on average
+  actions = numpy.zeros((tables, len(batch.paddles)), dtype=int)
+  flips = rand.random_sample((steps, tables, len(batch.paddles))) < 1.0/40
+  games = 0
+  best = 0
+
+  start = time.time()
+  for s in xrange(steps):
+    actions ^= flips[s]
+    (obs, rewards, done) = batch.step(actions)
+    games += done.sum()
+    best = max(best, batch.score.max())
+  elapsed = time.time() - start
+
+  print "%d tables, %d steps in %.2f s: %.0f table-steps/s" % (tables, steps, elapsed, tables*steps/elapsed)
+  print "Games finished: %d  Best score: %d  Mean score in play: %.0f" % (games, best, batch.score.mean())
+
+  if compare:
+    game = PinballGame(settings)
+    game.roundStart()
+    start = time.time()
+    for s in xrange(steps):
+      game.step()
+      if game.ball.hidden:
+        game.roundStart()
+    elapsed = time.time() - start
+    print "1 PinballGame, %d steps in %.2f s: %.0f table-steps/s" % (steps, elapsed, steps/elapsed)
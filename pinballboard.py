@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Synthetic pinball board generator, for testing how the game scales with board size
+
+Usage: python pinballboard.py [options] output-file
+
+Options:
+ -p ..., --pegs=...       Number of pegs (default 100)
+ -b ..., --bumpers=...    Number of bumpers (default 4)
+ -t ..., --triangles=...  Number of rubber triangles (default 4)
+ -d ..., --drops=...      Number of groups of three drop targets (default 2)
+ -n ..., --spinners=...   Number of spinners (default 1)
+ -s ..., --sides=...      Sides of round objects, the ball gets this many segments (default 12)
+ -x ..., --seed=...       Seed for where the objects go (default 0)
+ -h, --help               Display this menu
+
+The board has walls, a pair of paddles with a funnel down to them, a
+gameover block under them and a ball launched from start1 at the top. The
+objects are spread over a staggered grid, with enough room between them for
+the ball to get through, and the board grows to fit however many there are.
+The same options and seed always give the same file.
+"""
+
+import sys
+import math
+import getopt
+import random
+
+from acwriter import *
+
+
+SLOT = 0.18           # Distance between grid slots, objects are kept under 0.1 across so the ball always fits between
+BALL_RADIUS = 0.027   # Same ball as the shipped boards
+WALL = 0.09           # Thickness of the outer walls
+HEIGHT = 0.11         # Height of the walls
+SURFACE = 0x10        # Flat shaded polygon
+
+
+def material(name, rgb):
+  """Build a material in the form ACLoader gives"""
+  return {'name': name, 'rgb': rgb, 'amb': (0.2, 0.2, 0.2), 'emis': (0.0, 0.0, 0.0), 'spec': (0.2, 0.2, 0.2), 'shi': 128, 'trans': 0.0}
+
+MATERIALS = [
+  material('floor', (0.266667, 0.266667, 0.266667)),
+  material('wall', (0.5, 0.3, 0.1)),
+  material('peg', (1.0, 1.0, 0.0)),
+  material('bumper', (1.0, 0.0, 0.0)),
+  material('rubber', (0.0, 0.8, 0.0)),
+  material('target', (0.0, 0.3, 1.0)),
+  material('paddle', (1.0, 1.0, 1.0)),
+  material('ball', (0.8, 0.8, 0.8)),
+]
+MATERIAL = dict([(m['name'], i) for (i, m) in enumerate(MATERIALS)])
+
+
+def polyObject(name, loc, verts, surfaces):
+  """Build a poly object in the form ACLoader gives"""
+  return {'type': 'poly', 'name': name, 'loc': tuple(loc), 'verts': verts, 'surfaces': surfaces, 'kids': []}
+
+def groupObject(name, loc, kids):
+  """Build a group of objects"""
+  return {'type': 'group', 'name': name, 'loc': tuple(loc), 'verts': [], 'surfaces': [], 'kids': kids}
+
+def surface(refs, mat):
+  """Build a surface from vertex numbers"""
+  return {'type': SURFACE, 'mat': MATERIAL[mat], 'refs': [(r, 0.0, 0.0) for r in refs]}
+
+def prism(name, loc, points, height, mat):
+  """Build an upright prism from a convex polygon of (x, z) points around loc
+
+  The sides are upright, so the ball collides with them, and the top and
+  bottom are left out of collisions as they are flat.
+  """
+  # Go around the polygon the way that has the sides facing out
+  area = sum([points[i - 1][0]*p[1] - p[0]*points[i - 1][1] for (i, p) in enumerate(points)])
+  if area < 0:
+    points = points[::-1]
+
+  n = len(points)
+  h = height/2.0
+  verts = [(x, -h, z) for (x, z) in points] + [(x, h, z) for (x, z) in points]
+  surfaces = [surface((i, n + i, n + (i + 1) % n, (i + 1) % n), mat) for i in range(n)]
+  surfaces.append(surface(range(n, 2*n)[::-1], mat))
+  surfaces.append(surface(range(n), mat))
+  return polyObject(name, loc, verts, surfaces)
+
+def circle(radius, sides):
+  """Get the points of a polygon around a circle"""
+  return [(radius*math.cos(2*math.pi*i/sides), radius*math.sin(2*math.pi*i/sides)) for i in range(sides)]
+
+def rectangle(sx, sz, angle = 0.0):
+  """Get the points of a rectangle sx by sz, turned by angle about its center
+
+  The long sides of an unturned rectangle come second and fourth, so the
+  spinner's fourth surface faces along z like on the shipped boards.
+  """
+  (c, s) = (math.cos(angle), math.sin(angle))
+  corners = [(sx/2, -sz/2), (sx/2, sz/2), (-sx/2, sz/2), (-sx/2, -sz/2)]
+  return [(x*c - z*s, x*s + z*c) for (x, z) in corners]
+
+def wall(name, p0, p1, thickness, mat = 'wall'):
+  """Build a wall from one (x, z) point to another"""
+  (dx, dz) = (p1[0] - p0[0], p1[1] - p0[1])
+  points = rectangle(math.hypot(dx, dz), thickness, math.atan2(dz, dx))
+  return prism(name, ((p0[0] + p1[0])/2, HEIGHT/2, (p0[1] + p1[1])/2), points, HEIGHT, mat)
+
+def sphere(name, loc, radius, sides, mat):
+  """Build a sphere with sides segments around and half as many rings"""
+  rings = max(2, sides/2)
+  verts = [(0.0, radius, 0.0)]
+  for r in range(1, rings):
+    a = math.pi*r/rings
+    verts.extend([(radius*math.sin(a)*x, radius*math.cos(a), radius*math.sin(a)*z) for (x, z) in circle(1.0, sides)])
+  verts.append((0.0, -radius, 0.0))
+
+  ring = lambda r, i: 1 + (r - 1)*sides + i % sides
+  surfaces = [surface((0, ring(1, i + 1), ring(1, i)), mat) for i in range(sides)]
+  for r in range(1, rings - 1):
+    surfaces.extend([surface((ring(r, i), ring(r, i + 1), ring(r + 1, i + 1), ring(r + 1, i)), mat) for i in range(sides)])
+  surfaces.extend([surface((len(verts) - 1, ring(rings - 1, i), ring(rings - 1, i + 1)), mat) for i in range(sides)])
+  return polyObject(name, loc, verts, surfaces)
+
+def flat(name, loc, sx, sz, mat):
+  """Build a flat rectangle facing up, that the ball rolls over"""
+  verts = [(sx/2, 0.0, -sz/2), (sx/2, 0.0, sz/2), (-sx/2, 0.0, sz/2), (-sx/2, 0.0, -sz/2)]
+  return polyObject(name, loc, verts, [surface((0, 3, 2, 1), mat)])
+
+def paddle(side, loc):
+  """Build a paddle turning about loc, reaching in from the left (1) or right (-1)"""
+  points = [(-0.03, -0.03), (0.17, 0.04), (0.17, 0.065), (-0.03, 0.03)]
+  return prism(side == 1 and 'paddle-l' or 'paddle-r', loc, [(side*x, z) for (x, z) in points], 0.072, 'paddle')
+
+def place(kind, x, z, sides):
+  """Build one object of the field, centered on a grid slot"""
+  if kind == 'peg':
+    return prism('peg', (x, 0.027, z), circle(0.009, sides), 0.054, 'peg')
+  elif kind == 'bumper':
+    return groupObject('bumper', (x, 0.028, z), [prism('bumperbase', (0, 0, 0), circle(0.035, sides), 0.055, 'bumper')])
+  elif kind == 'triangle':
+    return prism('triangle', (x, 0.039, z), circle(0.05, 3), 0.04, 'rubber')
+  elif kind == 'drop':
+    items = [prism('dropitem', (dx, 0, 0.01), rectangle(0.012, 0.03), 0.058, 'target') for dx in (-0.035, 0.0, 0.035)]
+    return groupObject('drop', (x, 0.034, z), items + [prism('block', (0, 0.009, -0.025), rectangle(0.1, 0.012), 0.084, 'wall')])
+  elif kind == 'spinner':
+    return prism('spinner', (x, 0.066, z), rectangle(0.1, 0.02), 0.074, 'target')
+
+def layout(width, depth):
+  """Get the paddle row, the top of the funnel down to it, and the (x, z) of every grid slot for a board size"""
+  paddles = depth/2 - 0.33
+  funnel = paddles - 0.5*(width/2 - 0.3)
+  (top, bottom) = (-depth/2 + 0.3, funnel - 0.1)
+  (left, right) = (-width/2 + 0.12, width/2 - 0.12)
+
+  slots = []
+  row = 0
+  z = top
+  while z <= bottom:
+    x = left + (row % 2)*SLOT/2
+    while x <= right:
+      slots.append((x, z))
+      x += SLOT
+    z += SLOT*math.sqrt(3)/2
+    row += 1
+  return (paddles, funnel, slots)
+
+def generateBoard(pegs = 100, bumpers = 4, triangles = 4, drops = 2, spinners = 1, sides = 12, seed = 0):
+  """Generate a board, returns its (materials, objects) for ACWriter"""
+  rand = random.Random(seed)
+  kinds = ['peg']*pegs + ['bumper']*bumpers + ['triangle']*triangles + ['drop']*drops + ['spinner']*spinners
+
+  # Start from the size of the shipped boards, and grow until every object has a slot
+  (width, depth) = (1.44, 2.2)
+  (paddles, funnel, slots) = layout(width, depth)
+  while len(slots) < len(kinds):
+    (width, depth) = (width*1.1, depth*1.1)
+    (paddles, funnel, slots) = layout(width, depth)
+
+  (w, d) = (width/2, depth/2)
+  kids = [
+    flat('mesh', (0, 0, 0), width, depth, 'floor'),
+    wall('block', (-w - WALL/2, -d - WALL), (-w - WALL/2, d + WALL), WALL),
+    wall('block', (w + WALL/2, -d - WALL), (w + WALL/2, d + WALL), WALL),
+    wall('block', (-w - WALL, -d - WALL/2), (w + WALL, -d - WALL/2), WALL),
+    wall('gameover', (-w, d + WALL/2), (w, d + WALL/2), WALL),
+    wall('block', (-w, funnel), (-0.3, paddles - 0.04), 0.03),
+    wall('block', (w, funnel), (0.3, paddles - 0.04), 0.03),
+    paddle(1, (-0.25, 0.037, paddles)),
+    paddle(-1, (0.25, 0.037, paddles)),
+    flat('start1', (0, 0, -d + 0.12), 0.06, 0.06, 'floor'),
+    sphere('ball', (0, BALL_RADIUS, -d + 0.12), BALL_RADIUS, sides, 'ball'),
+  ]
+
+  rand.shuffle(kinds)
+  for (kind, (x, z)) in zip(kinds, rand.sample(slots, len(kinds))):
+    kids.append(place(kind, x, z, sides))
+
+  return (MATERIALS, [{'type': 'world', 'loc': (0.0, 0.0, 0.0), 'verts': [], 'surfaces': [], 'kids': kids}])
+
+def writeBoard(name, **options):
+  """Generate a board and write it to an AC3D file"""
+  (materials, objects) = generateBoard(**options)
+  ACWriter(name, materials, objects)
+
+
+if __name__ == "__main__":
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'p:b:t:d:n:s:x:h', ["pegs=", "bumpers=", "triangles=", "drops=", "spinners=", "sides=", "seed=", "help"])
+  except getopt.GetoptError:
+    print __doc__
+    sys.exit(2)
+
+  options = {}
+  for opt, arg in opts:
+    if opt in ('-p', '--pegs'):
+      options['pegs'] = int(arg)
+    elif opt in ('-b', '--bumpers'):
+      options['bumpers'] = int(arg)
+    elif opt in ('-t', '--triangles'):
+      options['triangles'] = int(arg)
+    elif opt in ('-d', '--drops'):
+      options['drops'] = int(arg)
+    elif opt in ('-n', '--spinners'):
+      options['spinners'] = int(arg)
+    elif opt in ('-s', '--sides'):
+      options['sides'] = max(3, int(arg))
+    elif opt in ('-x', '--seed'):
+      options['seed'] = int(arg)
+    elif opt in ('-h', '--help'):
+      print __doc__
+      sys.exit()
+
+  if len(args) != 1:
+    print __doc__
+    sys.exit(2)
+
+  writeBoard(args[0], **options)
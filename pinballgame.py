@@ -0,0 +1,777 @@
+#!/usr/bin/env python
+"""Headless pinball, runs the game physics as fast as possible without OpenGL
+
+Usage: python pinballgame.py [options]
+
+Options:
+ -g ..., --game=...     Specify different game model ac file
+ -o ..., --offset=...   The initial offset from the start point x,y
+ -s ..., --start=...    The number of the starting pad for the ball
+ -v ..., --vel=...      An initial velocity x,y
+ -r ..., --rate=...     Physics steps per second (default 200)
+ -t ..., --time=...     Seconds of game time to simulate (default 60)
+ -p ..., --flip=...     Flip both paddles every this many seconds (default never)
+ -a, --arrays           Store board geometry in numpy arrays instead of tuples
+ -i, --instance         Share geometry between objects that are translated copies of the same mesh
+ -B ..., --balls=...    Number of balls launched together for multiball (default 1)
+ -R ..., --record=...   Record the game to a replay file
+ -P ..., --play=...     Play a replay file instead, checking it still plays out the same
+ -k ..., --seek=...     Start playing the replay from this second of game time
+ -l ..., --log=...      Log the hits, scores, rounds and drops to an event log file
+ -h, --help             Display this menu
+
+Balls are launched again as soon as they drain, until the game is over or
+the time is up. The score and the hits on each object are printed. An
+event log is read back with 'python aclog.py log-file'.
+
+A replay holds the key presses of a game and checkpoints of its state, and
+is played back with the board and settings it was recorded with. Every
+checkpoint has to match exactly, or the steps where it did not are printed
+and the exit status is 1.
+"""
+
+import sys
+import copy
+import math
+import atexit
+import getopt
+from acgame import *
+
+# default settings for pinball
+SETTINGS = {
+  'mode': 0,
+  'start': 1,
+  'velocity': [0,0,-3.2],
+  'offset': [0, 0, 0],
+  'debug': False,
+  'keys': {
+    'l': 'z',
+    'r': '/',
+    'fire': ' ',
+  },
+  'gamefile': 'Pinball0_5.ac',
+  'wireframe': False,
+  'arrays': False,
+  'batch': False,
+  'instancing': False,
+  'culling': True,
+  'rate': 200,
+  'fps': 100,
+  'balls': 1,
+}
+
+REPLAY_SETTINGS = ('gamefile', 'start', 'velocity', 'offset', 'keys', 'rate', 'arrays', 'instancing', 'balls')  # What a replay is played back with
+
+GRAVITY = math.tan(7*math.pi/180)*12.0   # Acceleration down the tilted board, in units per second squared
+
+LOG_LIMITS = {'hit': 50}   # Most events of a kind written to an event log per second of game time
+
+
+class PinballGame(ACGame):
+  """The rules of pinball, without any GL so games can be simulated headless
+
+  Pinball adds the window. Without one, drive the game with input and
+  step or simulate, and read score, ball_count and, if it was set to a
+  list, events.
+
+  With settings['balls'] above one, the board's ball is copied that many
+  times for multiball. Every launch sends all of them out one after another,
+  and the round goes on until the last one drains. The balls are then moved
+  by the game after the rest of the board, with their board checks batched
+  together and contacts between balls found by sweep and prune.
+  """
+  state = ACGame.state + ('done', 'ball_count', 'launchKey', 'queued', 'launchWait')
+  launchInterval = 0.1  # Seconds between the balls of multiball being launched
+
+  def __init__(self, settings):
+    self.starting = {}  # lookup for starting points
+    self.ball = None    # reference to the child ball
+    self.balls = []     # every ball, the first is the board's own
+    self.multiball = settings['balls']  # Number of balls in play at once
+    self.queued = 0     # Balls of multiball still waiting to be launched
+    self.launchWait = 0 # Steps until the next one is launched
+    self.paddles = {}   # reference to l and r paddles
+    self.done = True    # The round is complete
+    self.ball_count = 0 # the number of balls left in the round
+
+    ACGame.__init__(self, settings['gamefile'], arrays=settings['arrays'], instancing=settings['instancing'], physicsRate=settings['rate'])
+    self.launchGap = max(1, int(self.launchInterval*settings['rate']))
+
+    # Set ball data from settings
+    self.startVelocity = settings['velocity']
+    self.startLocation = self.starting['start%d'%settings['start']].position
+    self.startOffset = settings['offset']
+
+    # Set key for launching the ball
+    self.launchKey = settings['keys']['fire']
+
+    # Set the keys used, connecting paddles with keys
+    self.paddles['l'].key = settings['keys']['l']
+    self.paddles['r'].key = settings['keys']['r']
+
+    # trigger game-over to wait for new round start
+    self.gameOver()
+
+  def gameOver(self):
+    """"Set the status variables to signify the end of a round"""
+    self.done = True
+    for b in self.balls:
+      b.hidden = True
+    self.queued = 0
+    self.ball_count = 5
+    self.event('gameover')
+
+  def placeBall(self, ball):
+    """Put a ball at the starting point with the launch velocity"""
+    ball.location = list(ball.vecAdd(self.startLocation, self.startOffset))
+    ball.velocity = list(self.startVelocity)
+    ball.hidden = False
+    self.event('launch', ball)
+
+  def nextBall(self):
+    """Set up the ball at the starting point and start round, the rest of multiball follows"""
+    self.done = False
+    self.event('roundstart')
+    self.placeBall(self.ball)
+    for b in self.balls[1:]:
+      b.hidden = True
+    self.queued = len(self.balls) - 1
+    self.launchWait = self.launchGap
+
+  def inPlay(self):
+    """Check if any ball is on the board or waiting to be launched"""
+    return bool(self.queued or [b for b in self.balls if not b.hidden])
+
+  def roundComplete(self, ball = None):
+    """A ball reached the bottom, the round is complete once no balls are left in play
+
+    Without a ball, every ball in play is taken off the board.
+    """
+    for b in ball and [ball] or [b for b in self.balls if not b.hidden] or [self.ball]:
+      b.hidden = True
+      self.event('drain', b)
+
+    if ball and self.inPlay():
+      return
+    self.queued = 0
+    self.event('roundend')
+    if self.ball_count == 0:
+      self.gameOver()
+
+  def roundStart(self):
+    """Start a new round, init score and such"""
+    if self.done:
+      self.ball_count = 5
+      self.score = 0
+      self.nextBall()
+    elif self.inPlay() and self.ball_count == 0:
+      self.roundComplete()
+    else:
+      self.nextBall()
+
+    self.ball_count -= 1
+
+  def keyFunc(self, direction, key, x, y):
+    """Launch the ball with the launch key, and pass keys on to the paddles"""
+    if direction == -1:
+      # Check for ball launch, and start round
+      if key == self.launchKey:
+        self.roundStart()
+
+      # If it is None, the menu option was selected, so save the first key pressed
+      elif self.launchKey is None:
+        self.launchKey = key
+
+    ACGame.keyFunc(self, direction, key, x, y)
+
+  def update(self, time):
+    """Update the board, then move the balls of multiball together"""
+    ACGame.update(self, time)
+    if len(self.balls) > 1:
+      self.updateBalls(time)
+
+  def updateBalls(self, time):
+    """Launch the next ball when it is due, then move every ball in play and bounce them off each other"""
+    if self.queued:
+      self.launchWait -= 1
+      if self.launchWait <= 0:
+        ball = self.balls[-self.queued]
+        self.placeBall(ball)
+        ball.saveState()
+        self.queued -= 1
+        self.launchWait = self.launchGap
+
+    balls = [b for b in self.balls if not b.hidden]
+    if not balls:
+      return
+
+    # All balls are checked against the board at once, an object hit by an earlier ball may have gone since
+    for (b, contact) in zip(balls, self.collisions.closestSurfaces(balls)):
+      if contact[1] and self.collisions.isHidden(contact[1]):
+        contact = b.getClosestSurface()
+      if not b.hidden:
+        b.advance(time, contact)
+
+    for (i, j) in touchingPairs([(b.location, b.radius) for b in balls]):
+      if not (balls[i].hidden or balls[j].hidden):
+        balls[i].collide(balls[j])
+
+  def createObjects(self, objs, parent=None):
+    """Create the objects of the board, with a copy of the ball for every extra ball of multiball"""
+    return ACGame.createObjects(self, self.__copyBalls(objs), parent)
+
+  def __copyBalls(self, objs):
+    for obj in objs:
+      yield obj
+      if obj.get('name') == 'ball':
+        for i in range(self.multiball - 1):
+          yield obj
+
+  def getObjectClass(self, dat):
+    """Get the Class to use for a given object, based on the AC3D object name"""
+    if dat.has_key('name'):
+      if dat['name'].startswith('paddle'):
+        return Paddle
+      elif dat['name'] == 'ball':
+        return Ball
+      elif dat['name'] == 'peg':
+        return Peg
+      elif dat['name'].startswith('triangle'):
+        return RubberTriangle
+      elif dat['name'] == 'drop':
+        return Drop
+      elif dat['name'] == 'dropitem':
+        return DropItem
+      elif dat['name'] == 'bumperbase':
+        return Bumper
+      elif dat['name'].startswith('start'):
+        return StartPoint
+      elif dat['name'] == 'gameover':
+        return GameOver
+      elif dat['name'] == 'spinner':
+        return Spinner
+
+    return ACGame.getObjectClass(self, dat)
+
+
+class Paddle(ACGameObject):
+  """Paddle class that manages the behavior of the paddle rendered in the game
+
+  Turns the object based on angle, and recognizes key presses and such. The
+  vertices stay unrotated, collisions are worked out in the paddle's frame.
+  """
+  static = False
+  state = ACGameObject.state + ('angle', 'direction', 'spin', 'key', 'waiting')
+
+  def __init__(self, dat, r):
+    self.angle = 0        # Current angle of paddle
+    self.direction = -1   # Current direction of motion (up or down)
+    self.side = dat['name'].endswith('-r') and -1 or 1    # Control which direction each paddle rotates
+    self.max_angle = 40   # Max allowed angle of paddle
+    self.key = None       # the key to watch for to control this paddle
+    self.waiting = False  # The paddle has no key selected, this means it should grab the next key pressed
+    self.swingRate = 500.0  # Degrees per second the paddle swings at
+    self.spin = 0.0       # Current angular velocity about the y axis, in radians per second
+
+    # set reference to paddle in the game
+    r.paddles[dat['name'][-1]] = self
+
+    ACGameObject.__init__(self, dat, r)
+
+  def keyPress(self, dir, key, x, y):
+    """Key press handler for paddle"""
+    if self.waiting:
+      self.key = key
+      self.waiting = False
+    if self.key == key:
+      self.direction = -1*dir
+
+  def __inMotion(self):
+    return (self.angle < self.max_angle and self.direction == 1) or (self.angle > 0 and self.direction == -1)
+
+  def update(self, time):
+    """Animation function. Updates the angle based on the elapsed time"""
+    if self.__inMotion():
+      self.angle += self.direction*self.swingRate*time
+
+    if self.angle < 0:
+      self.angle = 0
+    elif self.angle > self.max_angle:
+      self.angle = self.max_angle
+
+    # Turn the collision frame with the paddle
+    self.rotation = -1*self.side*self.angle*math.pi/180
+    self.spin = self.__inMotion() and -1*self.side*self.direction*self.swingRate*math.pi/180 or 0.0
+
+  def pointVelocity(self, point):
+    """Velocity of a point on the paddle as it swings"""
+    return (-1*self.spin*(point[2] - self.position[2]), 0.0, self.spin*(point[0] - self.position[0]))
+
+  def hitBy(self, object, surface):
+    """Callback when hit by ball, the ball's bounce already took the paddle's swing into account"""
+    ACGameObject.hitBy(self, object, surface)
+
+
+
+
+
+
+class Ball(ACGameObject):
+  """Ball class that calculates collisions with other game objects
+  and other fanciness
+  """
+  static = False
+  maxSpeed = 3.5        # Faster balls get slowed down to cappedSpeed
+  cappedSpeed = 2.0     # Speed a ball over maxSpeed is slowed down to
+  maxBounces = 4        # Surfaces the ball can bounce off in one substep before the rest of it is dropped
+  substepTravel = 0.5   # Longest distance to move in one substep, in ball radii
+  skin = 0.0001         # Gap left between the ball and a surface after bouncing off it
+  ballFactor = 0.9      # Factor to multiply the speed two balls hit each other at by
+  collides = False      # Balls are left out of the board's collision grid
+
+  def __init__(self, dat, r):
+    ACGameObject.__init__(self, dat, r)
+    r.ball = r.ball or self # Set ball reference on the game
+    r.balls.append(self)
+
+    self.hidden = True
+    self.radius = math.sqrt(sum([i*i for i in self.vertices[0]]))
+
+  def update(self, time):
+    """Animation callback for ball, with multiball the game moves all the balls instead"""
+    if self.hidden or len(self.engine.balls) > 1:
+      return
+    self.advance(time, self.getClosestSurface())
+
+  def advance(self, time, contact):
+    """Move the ball through the step and bounce it off anything in its way, contact is its closest surface"""
+    # The ball can start out overlapping an object, if a paddle swung into it or it is passing through a passive object
+    (surface, object, distance) = contact
+    if object :
+      self.engine.event('hit', object)
+
+      # Passive objects are affected by ball, but have no effect on it
+      if not object.passive:
+        # push the ball back out along the surface normal
+        n = surface['norm']
+        self.location = self.vecAdd(self.location, self.vecMult(n, self.radius - distance + self.skin))
+        self.bounce(n, object, self.vecSub(self.location, self.vecMult(n, self.radius)))
+
+      # Trigger the object's hitBy function
+      object.hitBy(self, surface)
+
+    # Cap the speed so it doesn't get too crazy
+    speed = self.vecMag(self.velocity)
+    if speed > self.maxSpeed:
+      self.velocity = list(self.vecMult(self.velocity, self.cappedSpeed/speed))
+
+    # Split the step up so gravity is applied smoothly however long the step is
+    dt = time
+    substeps = max(1, int(math.ceil(self.vecMag(self.velocity)*dt/(self.substepTravel*self.radius))))
+    for i in range(substeps):
+      self.velocity[2] += GRAVITY*dt/substeps
+      self.move(dt/substeps)
+      if self.hidden:
+        break
+
+    [child.update(time) for child in self.subobjects]
+
+  def move(self, dt):
+    """Move the ball along its velocity for dt seconds, bouncing off surfaces in the order it reaches them"""
+    index = self.engine.collisions
+    for i in range(self.maxBounces):
+      end = self.vecAdd(self.location, self.vecMult(self.velocity, dt))
+      objs = [o for o in index.near(self, end) if not o.passive]
+      (t, surface, object) = index.planes.sweep(objs, self.location, end, self.radius)
+      if object is None:
+        self.location = end
+        return
+
+      self.engine.event('hit', object)
+
+      # Move up to the surface, stopping just short of it, and use up that much of the step
+      n = surface['norm']
+      self.location = self.vecAdd(self.vecAdd(self.location, self.vecMult(self.velocity, dt*t)), self.vecMult(n, self.skin))
+      dt *= 1 - t
+
+      self.bounce(n, object, self.vecSub(self.location, self.vecMult(n, self.radius)))
+      object.hitBy(self, surface)
+      if self.hidden:
+        return
+
+  def collide(self, other):
+    """Push two touching balls apart, and bounce them off each other if they are moving closer
+
+    Balls roll on the board, so they only push each other along it, never up or down.
+    """
+    d = (other.location[0] - self.location[0], 0.0, other.location[2] - self.location[2])
+    dist = self.vecMag(d)
+    if dist == 0:
+      return
+    n = self.vecMult(d, 1.0/dist)
+
+    self.engine.event('hit', other)
+
+    push = (self.radius + other.radius - dist)/2 + self.skin
+    self.location = self.vecSub(self.location, self.vecMult(n, push))
+    other.location = self.vecAdd(other.location, self.vecMult(n, push))
+
+    # Balls weigh the same, so they trade the part of their velocity along n
+    dot = self.vecDot(self.vecSub(self.velocity, other.velocity), n)
+    if dot > 0:
+      j = self.vecMult(n, dot*(1 + self.ballFactor)/2)
+      self.velocity = list(self.vecSub(self.velocity, j))
+      other.velocity = list(self.vecAdd(other.velocity, j))
+
+  def bounce(self, n, object, point):
+    """Reflect the velocity off a surface with normal n, touching it at point
+
+    The bounce is worked out relative to how fast that point of the object
+    is moving, so a swinging paddle hits harder near its tip. The velocity
+    relative to the surface is scaled by the object's collision factor.
+    """
+    surface = object.pointVelocity(point)
+    rel = self.vecSub(self.velocity, surface)
+    dot = self.vecDot(n, rel)
+    if dot < 0:
+      new_vel = self.vecSub(rel, self.vecMult(n, 2*dot))
+      self.velocity = list(self.vecAdd(self.vecMult(new_vel, object.collisionFactor), surface))
+
+  def getClosestSurface(self, objs = None):
+    """Get the closest surface and object based on a list of objects"""
+    if objs == None:
+      if self.engine.collisions:
+        return self.engine.collisions.closestSurface(self)
+      objs = self.engine.loaders
+
+    (surface, object, dist) = (None, None, float('inf'))
+
+    # Check every object to find which has the closest surface
+    for o in objs:
+      if o == self or o.hidden or not o.collides:
+        continue
+      # Check the object first
+      v = self.getClosestObjectSurface(o)
+      if abs(v[1]) < abs(dist):
+        (surface, object, dist) = (v[0], o, v[1])
+      # Then check the object's children
+      v = self.getClosestSurface(o.subobjects)
+
+      if abs(v[2]) < abs(dist):
+        (surface, object, dist) = v
+
+    return (surface, object, dist)
+
+  def getClosestObjectSurface(self, obj):
+    """Get the closest surface of a given object"""
+    dbg = self.debug
+
+    if dbg: print "Checking surfaces of %s" % obj.name
+
+    (surface, dist) = (None, float('inf'))
+    if len(obj.surfaces) < 3:
+      return (surface, dist)
+    loc = obj.localPoint(self.location) # Surfaces of turned objects are in their own frame
+
+    verts = obj.getVertices()
+    pos = obj.vecAdd(obj.position, obj.meshOffset) # Shared mesh vertices are relative to the first copy
+
+    if obj.geometry is not None:
+      (surface, dist) = self.getClosestGeometrySurface(obj, verts, pos, loc)
+      return (surface and obj.worldSurface(surface), dist)
+
+    outside = False
+    for s in obj.surfaces:
+      if dbg: print "Checking Norm: %s Center %s" % (s['norm'], s['center'])
+      p1 = verts[s['refs'][0][0]]
+      n = s['norm']
+      # Ignore surface if its normal is horizontal
+      if abs(n[1]) > 0.05:
+        if dbg: print "Discarding, not vertical"
+        continue
+
+      # Calculate signed distance from the plane
+      D = ((n[0]*loc[0] + n[1]*loc[1] + n[2]*loc[2]) - (n[0]*(pos[0]+p1[0]) + n[1]*(pos[1]+p1[1]) + n[2]*(pos[2] + p1[2])))
+
+      if dbg: print "Distance: %f Current: %f" % (D, dist)
+
+      # If ball farther than radius, it cannot be inside, so break
+      if D > self.radius:
+        outside = True
+        if dbg: print "object is outside, breaking"
+        break
+
+      # Use abs to find the surface that the ball is closest to
+      if abs(D) < abs(dist):
+        if dbg: print "Surface is at distance %f, less that %f" % (D, dist)
+        (surface, dist) = (s, D)
+
+    # If we broke, it is outside the object
+    if outside:
+      return (None, float('inf'))
+
+    if dbg: print "Final Surface: dist: %f surf:%s" % (dist, surface)
+    return (surface and obj.worldSurface(surface), dist)
+
+  def getClosestGeometrySurface(self, obj, verts, pos, loc):
+    """Same as getClosestObjectSurface, but tests all surfaces of array geometry at once"""
+    g = obj.geometry
+    n = g.norms
+
+    # Ignore surfaces with horizontal normals
+    keep = numpy.abs(n[:, 1]) <= 0.05
+    p = g.firstVerts(verts)[keep] + pos
+    n = n[keep]
+
+    # Calculate signed distance from every plane
+    D = numpy.dot(n, loc) - (n*p).sum(axis=1)
+
+    # If ball farther than radius from any plane, it cannot be inside
+    if not len(D) or (D > self.radius).any():
+      return (None, float('inf'))
+
+    i = numpy.abs(D).argmin()
+    return (g[numpy.nonzero(keep)[0][i]], float(D[i]))
+
+
+
+
+class Peg(ACGameObject):
+  """Peg class to specify basic peg characteristics"""
+  def __init__(self, data, r):
+    ACGameObject.__init__(self, data, r)
+    self.collisionFactor = 0.95
+    self.points = 100
+
+
+class RubberTriangle(ACGameObject):
+  """Triangle class to specify triangle characteristics"""
+  def __init__(self, data, r):
+    ACGameObject.__init__(self, data, r)
+    self.collisionFactor = 1.0
+    self.points = 200
+    
+  def hitBy(self, object, surface):
+    """The triangles add a bit of speed to the ball, based on surface normal"""
+    mult = 1.0
+    object.velocity = list(self.vecAdd(object.velocity, self.vecMult(surface['norm'], mult)))
+    ACGameObject.hitBy(self, object, surface)
+
+
+
+
+class Drop(ACGameObject):
+  """Parent drop class for each group of three drop items"""
+  state = ACGameObject.state + ('count',)
+
+  def __init__(self, data, r):
+    ACGameObject.__init__(self, data, r)
+    self.count = 0
+
+  def childHit(self, child):
+    """Triggered when a drop item is hit, when all three are hit, 
+    we add extra points and show all items again
+    """
+    self.count += 1
+    child.points = 500
+    self.engine.event('drop', child, self.count)
+
+    if self.count == 3:
+      child.points = 5000
+      self.engine.event('dropset', self)
+      self.count = 0
+      for o in self.subobjects:
+        o.hidden = False
+
+class DropItem(ACGameObject):
+  """Drop item class for basic params and triggers parent event"""
+  static = False
+
+  def __init__(self, data, r):
+    ACGameObject.__init__(self, data, r)
+    self.collisionFactor = 0.7
+
+  def hitBy(self, obj, surface):
+    self.hidden = True
+    self.parent.childHit(self) #let the parent know this child was hit
+    ACGameObject.hitBy(self, obj, surface)
+
+class Bumper(ACGameObject):
+  """Bumper specific settings"""
+  def __init__(self, data, r):
+    ACGameObject.__init__(self, data, r)
+    self.collisionFactor = 1.1
+    self.points = 200
+
+class StartPoint(ACGameObject):
+  """Starting point class to just let the game know available starting points"""
+  def __init__(self, data, engine):
+    ACGameObject.__init__(self, data, engine);
+    engine.starting[self.name] = self
+
+class GameOver(ACGameObject):
+  """GameOver class to track when the bottom block on the game board gets hit"""
+  def hitBy(self, obj, surface):
+    self.engine.roundComplete(obj)
+
+
+class Spinner(ACGameObject):
+  """Fancy spinner class to manage animation and such"""
+  static = False
+  state = ACGameObject.state + ('angle', 'prevAngle', 'speed')
+
+  def __init__(self, data, engine):
+    ACGameObject.__init__(self, data, engine);
+    self.passive = True   # The ball makes this move, but the ball doesn't bounce off of it
+    self.angle = 0        # Current animation angle
+    self.prevAngle = 0    # Angle before the last physics step
+    self.speed = 0        # current animation speed
+
+    self.points = 1000    
+
+    self.rot = self.surfaces[3]['norm']   # Rotation axis vector, manually set by looking at file
+
+  def hitBy(self, obj, surface):
+    """When hit by ball, start spinning"""
+    self.speed = 20
+
+  def update(self, time):
+    """Animation function. Increase angle based on speed and slowly decrease speed"""
+    self.angle += self.speed*0.01/time
+
+    self.speed -= 0.1
+    if self.speed < 0:
+      self.speed = 0
+
+  def saveState(self):
+    """Remember the angle before a physics step too"""
+    ACGameObject.saveState(self)
+    self.prevAngle = self.angle
+
+  def drawRotation(self):
+    """Draw the spinner rotated around the rotation axis"""
+    return (self.lerp(self.prevAngle, self.angle), self.rot)
+
+
+if __name__ == '__main__':
+  settings = copy.deepcopy(SETTINGS)
+  seconds = 60.0
+  flip = 0.0
+  record = None
+  play = None
+  seek = 0.0
+  log = None
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'g:s:v:o:r:t:p:aiB:R:P:k:l:h', ["game=", "start=", "vel=", "offset=", "rate=", "time=", "flip=", "arrays", "instance",
+                                                                             "balls=", "record=", "play=", "seek=", "log=", "help"])
+  except getopt.GetoptError:
+    print __doc__
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt in ('-s', '--start'):
+      settings['start'] = int(arg)
+    elif opt in ('-v', '--vel'):
+      v = arg.split(',')
+      settings['velocity'] = [float(v[0]), 0, float(v[1])]
+    elif opt in ('-o', '--offset'):
+      o = arg.split(',')
+      settings['offset'] = [float(o[0]), 0, float(o[1])]
+    elif opt in ('-g', '--game'):
+      settings['gamefile'] = arg
+    elif opt in ('-r', '--rate'):
+      settings['rate'] = int(arg)
+    elif opt in ('-t', '--time'):
+      seconds = float(arg)
+    elif opt in ('-p', '--flip'):
+      flip = float(arg)
+    elif opt in ('-a', '--arrays'):
+      settings['arrays'] = True
+    elif opt in ('-i', '--instance'):
+      settings['instancing'] = True
+    elif opt in ('-B', '--balls'):
+      settings['balls'] = int(arg)
+    elif opt in ('-R', '--record'):
+      record = arg
+    elif opt in ('-P', '--play'):
+      play = arg
+    elif opt in ('-k', '--seek'):
+      seek = float(arg)
+    elif opt in ('-l', '--log'):
+      log = arg
+    elif opt in ('-h', '--help'):
+      print __doc__
+      sys.exit()
+
+  if play:
+    replay = ACReplay(play)
+    settings.update(replay.info['settings'])
+    game = PinballGame(settings)
+    game.events = []
+    replay.play(game)
+    replay.seek(game, max(game.steps, int(seek*settings['rate'])))
+    if log:
+      game.log = ACEventLog(log, settings['rate'], LOG_LIMITS)
+      atexit.register(game.log.close)
+
+    start = monotonic()
+    first = game.steps
+    replay.finish(game)
+    elapsed = max(monotonic() - start, 1e-6)
+
+    print "Played %.1f s of %s in %.2f s, %.0fx real time" % (float(game.steps - first)/settings['rate'], play, elapsed,
+                                                              float(game.steps - first)/settings['rate']/elapsed)
+    print "Score: %d  Balls left: %d  Game over: %s" % (game.score, game.ball_count, game.done)
+    if not replay.complete:
+      print "Replay was cut short, played up to the last record"
+    if replay.mismatches:
+      print "State differs from the recording at steps %s" % ', '.join([str(s) for s in replay.mismatches])
+      sys.exit(1)
+    print "Every checkpoint matched"
+    sys.exit()
+
+  game = PinballGame(settings)
+  game.events = []
+  if log:
+    game.log = ACEventLog(log, settings['rate'], LOG_LIMITS)
+  keys = settings['keys']
+  if record:
+    recorder = ACRecorder(game, record, {'settings': dict([(k, settings[k]) for k in REPLAY_SETTINGS])})
+
+  # Hold both paddles up for a fifth of a second every flip seconds
+  period = int(flip*settings['rate'])
+  hold = max(1, settings['rate']/5)
+
+  # Balls are launched with the launch key, so a recording has every launch
+  game.input(-1, keys['fire'])
+  game.input(1, keys['fire'])
+  for s in xrange(int(seconds*settings['rate'])):
+    if period and s % period == 0:
+      game.input(-1, keys['l'])
+      game.input(-1, keys['r'])
+    elif period and s % period == hold:
+      game.input(1, keys['l'])
+      game.input(1, keys['r'])
+
+    game.step()
+    if not game.inPlay():
+      if game.done:
+        break
+      game.input(-1, keys['fire'])
+      game.input(1, keys['fire'])
+
+  if record:
+    recorder.close()
+  if log:
+    game.log.close()
+
+  hits = {}
+  for (step, name, obj) in game.events:
+    if name == 'hit':
+      hits[obj] = hits.get(obj, 0) + 1
+
+  print "Simulated %.1f s in %d steps" % (float(game.steps)/settings['rate'], game.steps)
+  print "Score: %d  Balls left: %d  Game over: %s" % (game.score, game.ball_count, game.done)
+  for name in sorted(hits):
+    print "%-20s %6d hits" % (name, hits[name])
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""Sweep of ball launch settings, played out headless over a pool of processes
+
+Usage: python pinballsweep.py [options] results-file
+
+Options:
+ -g ..., --game=...     Specify different game model ac file
+ -s ..., --start=...    Comma separated starting pads to launch from (default 1)
+ -v ..., --vel=...      Launch velocities x,z (default 0,-3.2)
+ -o ..., --offset=...   Offsets from the start point x,z (default 0,0)
+ -t ..., --time=...     Longest a launch is played for, in seconds of game time (default 30)
+ -r ..., --rate=...     Physics steps per second (default 200)
+ -j ..., --jobs=...     Number of worker processes (default one per core)
+ -h, --help             Display this menu
+
+Each x and z can be a single value or lo:hi:count for count evenly spaced
+values, and every combination of start, velocity and offset is launched
+once. A launch is played with the paddles down until the ball drains or
+the time runs out.
+
+The board is loaded once, before the worker processes are started, and
+they inherit it. With numpy installed, the vertices are mapped read only
+from the compiled board file, and the collision grid and planes are built
+beforehand into flat arrays that the workers only read, so those stay shared.
+The board's objects themselves are Python objects: Python writes to an
+object's memory just by using it, so each worker ends up with its own copy
+of the pages holding the objects it touches, a few tens of MB on big boards.
+
+One tab separated line per launch is added to the results file as soon as
+it is done. Launches that are already in the file are skipped, so an
+interrupted sweep picks up where it stopped when run again.
+"""
+
+import os
+import sys
+import copy
+import signal
+import getopt
+import itertools
+import multiprocessing
+
+from pinballgame import *
+
+
+COLUMNS = ('start', 'vx', 'vz', 'ox', 'oz', 'drained', 'steps', 'score', 'hits', 'bumpers')
+
+game = None       # The game every worker plays on, loaded once and reset for every launch
+initial = None    # Checkpoint of the game before its first launch
+bumpers = None    # Names of the objects that are bumpers
+
+
+def parseRange(arg):
+  """Turn a value or lo:hi:count into a list of values"""
+  parts = [float(p) for p in arg.split(':')]
+  if len(parts) == 1:
+    return parts
+  (lo, hi, count) = (parts[0], parts[1], int(parts[2]))
+  if count < 2:
+    return [lo]
+  return [lo + (hi - lo)*i/(count - 1) for i in range(count)]
+
+def parsePair(arg):
+  """Turn x,z where each is a value or a range into a list of (x, z)"""
+  (x, z) = arg.split(',')
+  return list(itertools.product(parseRange(x), parseRange(z)))
+
+def launchKey(launch):
+  """Key of a launch, as it is written to and read back from the results file"""
+  return (str(int(launch[0])),) + tuple([repr(float(v)) for v in launch[1:]])
+
+def readDone(name):
+  """Get the keys of the launches already in a results file"""
+  done = set()
+  if not os.path.exists(name):
+    return done
+  for line in open(name):
+    fields = line.rstrip('\n').split('\t')
+    # Skip the header, and a line cut short by an interrupted run
+    if line.startswith('#') or not line.endswith('\n') or len(fields) != len(COLUMNS):
+      continue
+    done.add(launchKey(fields[0:5]))
+  return done
+
+def loadBoard(settings):
+  """Load the board and build its collision tables, so forked workers all start out sharing them"""
+  global game, initial, bumpers
+  game = PinballGame(settings)
+  game.events = []
+  game.collisions.build(game.ball.radius, game.startLocation[1])
+  [game.collisions.planes.lookup(o) for o in game.allObjects() if len(o.surfaces) >= 3]
+  initial = game.checkpoint()
+  bumpers = set([o.name for o in game.allObjects() if isinstance(o, Bumper)])
+
+def initWorker(settings):
+  """Set up a worker process, loading the board if it was not inherited from the main process"""
+  signal.signal(signal.SIGINT, signal.SIG_IGN)   # Leave ctrl-c to the main process
+  if game is None:
+    loadBoard(settings)
+
+def runLaunch(args):
+  """Play out one launch from a freshly reset board, returns its line for the results file"""
+  (launch, steps) = args
+  (start, vx, vz, ox, oz) = launch
+  game.restore(initial)
+  del game.events[:]
+
+  game.startLocation = game.starting['start%d' % start].position
+  game.startVelocity = [vx, 0, vz]
+  game.startOffset = [ox, 0, oz]
+  game.roundStart()
+  first = game.steps
+  for s in xrange(steps):
+    game.step()
+    if game.ball.hidden:
+      break
+
+  hits = [e for e in game.events if e[1] == 'hit']
+  row = launchKey(launch) + (int(game.ball.hidden), game.steps - first, game.score, len(hits),
+                             len([e for e in hits if e[2] in bumpers]))
+  return '\t'.join([str(v) for v in row]) + '\n'
+
+
+if __name__ == '__main__':
+  settings = copy.deepcopy(SETTINGS)
+  starts = [1]
+  vels = [(0.0, -3.2)]
+  offsets = [(0.0, 0.0)]
+  seconds = 30.0
+  jobs = multiprocessing.cpu_count()
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], 'g:s:v:o:t:r:j:h', ["game=", "start=", "vel=", "offset=", "time=", "rate=", "jobs=", "help"])
+  except getopt.GetoptError:
+    print __doc__
+    sys.exit(2)
+
+  for opt, arg in opts:
+    if opt in ('-g', '--game'):
+      settings['gamefile'] = arg
+    elif opt in ('-s', '--start'):
+      starts = [int(s) for s in arg.split(',')]
+    elif opt in ('-v', '--vel'):
+      vels = parsePair(arg)
+    elif opt in ('-o', '--offset'):
+      offsets = parsePair(arg)
+    elif opt in ('-t', '--time'):
+      seconds = float(arg)
+    elif opt in ('-r', '--rate'):
+      settings['rate'] = int(arg)
+    elif opt in ('-j', '--jobs'):
+      jobs = int(arg)
+    elif opt in ('-h', '--help'):
+      print __doc__
+      sys.exit()
+
+  if len(args) != 1:
+    print __doc__
+    sys.exit(2)
+  name = args[0]
+
+  launches = [(s,) + v + o for s in starts for v in vels for o in offsets]
+  done = readDone(name)
+  todo = [l for l in launches if launchKey(l) not in done]
+  print "%d launches, %d already done, %d to run on %d processes" % (len(launches), len(launches) - len(todo), len(todo), jobs)
+  if not todo:
+    sys.exit()
+
+  # Compile the board so its geometry can be mapped from the file, and load it before starting the workers
+  settings['arrays'] = numpy is not None
+  ACCachedLoader(settings['gamefile'])
+  loadBoard(settings)
+
+  # Opened for update rather than appending, so a line cut short by an interrupted run can be dropped, it gets run again
+  out = open(name, os.path.exists(name) and 'r+' or 'w+')
+  text = out.read()
+  if not text.endswith('\n'):
+    text = text[:text.rfind('\n') + 1]
+  out.seek(len(text))
+  out.truncate()
+  if not text:
+    out.write('#' + '\t'.join(COLUMNS) + '\n')
+
+  steps = int(seconds*settings['rate'])
+  pool = multiprocessing.Pool(jobs, initWorker, (settings,))
+  try:
+    results = pool.imap_unordered(runLaunch, [(l, steps) for l in todo])
+    for count in xrange(1, len(todo) + 1):
+      # Waiting with a timeout lets ctrl-c through
+      out.write(results.next(24*3600))
+      out.flush()
+      if count % 100 == 0 or count == len(todo):
+        sys.stderr.write("\r%d/%d" % (count, len(todo)))
+    sys.stderr.write("\n")
+  except KeyboardInterrupt:
+    print "\nInterrupted, run again to finish the sweep"
+  finally:
+    pool.terminate()
+    pool.join()
+    out.close()
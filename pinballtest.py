@@ -0,0 +1,25 @@
+"""Helpers shared by the tests, to set up games and play them the same way every time"""
+
+import copy
+
+from pinballgame import *
+
+
+def makeGame(**settings):
+  """Set up a game on the shipped board with some settings changed"""
+  s = copy.deepcopy(SETTINGS)
+  s.update(settings)
+  return PinballGame(s)
+
+def play(game, steps):
+  """Launch and flip the paddles now and then for a number of steps"""
+  game.input(-1, ' ')
+  game.input(1, ' ')
+  for i in range(steps):
+    if i % 140 == 0:
+      game.input(-1, 'z')
+      game.input(-1, '/')
+    if i % 140 == 40:
+      game.input(1, 'z')
+      game.input(1, '/')
+    game.step()
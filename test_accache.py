@@ -0,0 +1,82 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from accache import *
+
+
+class CacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.name = os.path.join(self.dir, 'Pinball0_5.ac')
+    shutil.copy('Pinball0_5.ac', self.name)
+    self.cache = ACCache(self.name)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def header(self):
+    f = open(self.cache.path, 'rb')
+    try:
+      return HEADER.unpack(f.read(HEADER.size))
+    finally:
+      f.close()
+
+  def testMissing(self):
+    self.assertEqual(self.cache.load(), None)
+    self.assertFalse(ACCachedLoader(self.name).cached)
+    self.assertTrue(ACCachedLoader(self.name).cached)
+
+  def testSameData(self):
+    parsed = ACLoader(self.name)
+    ACCachedLoader(self.name)
+    (materials, objects) = self.cache.load()
+    self.assertEqual(materials, parsed.materials)
+    self.assertEqual(len(objects), len(parsed.objects))
+    self.assertEqual(objects[0]['kids'][0]['verts'], parsed.objects[0]['kids'][0]['verts'])
+
+  def testTouched(self):
+    """A source with a new mtime but the same contents is still current, and the stamp is brought up to date"""
+    ACCachedLoader(self.name)
+    st = os.stat(self.name)
+    os.utime(self.name, (st.st_atime, st.st_mtime + 10))
+    self.assertNotEqual(self.header()[2:4], self.cache.sourceStamp())
+    self.assertTrue(ACCachedLoader(self.name).cached)
+    self.assertEqual(self.header()[2:4], self.cache.sourceStamp())
+
+  def testChanged(self):
+    ACCachedLoader(self.name)
+    data = open(self.name, 'rb').read().replace('MATERIAL "', 'MATERIAL "x', 1)
+    f = open(self.name, 'wb')
+    f.write(data)
+    f.close()
+    self.assertEqual(self.cache.load(), None)
+    self.assertFalse(ACCachedLoader(self.name).cached)
+    self.assertEqual(self.header()[4], self.cache.sourceHash())
+
+  def truncate(self, arrays):
+    ACCachedLoader(self.name)
+    size = os.path.getsize(self.cache.path)
+    for length in (0, HEADER.size - 1, HEADER.size, size/2, size - 1):
+      f = open(self.cache.path, 'r+b')
+      f.truncate(length)
+      f.close()
+      self.assertEqual(self.cache.load(arrays), None)
+      loader = ACCachedLoader(self.name, arrays=arrays)
+      self.assertFalse(loader.cached)
+      self.assertEqual(os.path.getsize(self.cache.path), size)
+
+  def testTruncated(self):
+    self.truncate(False)
+
+  def testTruncatedArrays(self):
+    if not numpy:
+      self.skipTest("numpy is not installed")
+    self.truncate(True)
+
+
+if __name__ == "__main__":
+  unittest.main()
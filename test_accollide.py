@@ -0,0 +1,68 @@
+
+import unittest
+
+from pinballtest import *
+
+
+class CollisionIndexTest(unittest.TestCase):
+  """The grid has to find the same closest surface as checking every object"""
+
+  def points(self, game, count = 30):
+    """Ball locations spread over the whole board, at the height the ball rolls at"""
+    xs = [o.position[0] for o in game.allObjects()]
+    zs = [o.position[2] for o in game.allObjects()]
+    (x0, x1, z0, z1) = (min(xs) - 0.1, max(xs) + 0.1, min(zs) - 0.1, max(zs) + 0.1)
+    y = game.ball.location[1]
+    return [[x0 + (x1 - x0)*i/count, y, z0 + (z1 - z0)*j/count] for i in range(count + 1) for j in range(count + 1)]
+
+  def assertSame(self, found, expected):
+    self.assertTrue(found[1] is expected[1], "found %s instead of %s" % (found[1] and found[1].name, expected[1] and expected[1].name))
+    if expected[1]:
+      self.assertAlmostEqual(found[2], expected[2], 9)
+      self.assertEqual(tuple(found[0]['norm']), tuple(expected[0]['norm']))
+
+  def compare(self, game):
+    ball = game.ball
+    hits = 0
+    for loc in self.points(game):
+      ball.location = loc
+      expected = ball.getClosestSurface(game.loaders)
+      self.assertSame(game.collisions.closestSurface(ball), expected)
+      hits += expected[1] is not None
+    self.assertTrue(hits > 0)
+
+  def compareMany(self, game):
+    balls = game.balls
+    points = self.points(game, 16)
+    for start in range(0, len(points) - len(balls), len(balls)):
+      for (b, loc) in zip(balls, points[start:]):
+        b.location = loc
+      found = game.collisions.closestSurfaces(balls)
+      for (b, f) in zip(balls, found):
+        self.assertSame(f, b.getClosestSurface(game.loaders))
+
+  def testTuples(self):
+    self.compare(makeGame())
+
+  def testArrays(self):
+    if not numpy:
+      self.skipTest("numpy is not installed")
+    self.compare(makeGame(arrays=True))
+
+  def testPaddlesUp(self):
+    game = makeGame()
+    game.input(-1, 'z')
+    game.input(-1, '/')
+    for i in range(40):
+      game.step()
+    self.compare(game)
+
+  def testMultiball(self):
+    game = makeGame(balls=4)
+    for b in game.balls:
+      b.hidden = False
+    self.compareMany(game)
+
+
+if __name__ == "__main__":
+  unittest.main()
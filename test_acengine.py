@@ -0,0 +1,34 @@
+
+import unittest
+
+from pinballtest import *
+
+
+class InstancingTest(unittest.TestCase):
+  """Sharing meshes between copies must not change how the game plays"""
+
+  def compare(self, **settings):
+    plain = makeGame(**settings)
+    shared = makeGame(instancing=True, **settings)
+
+    meshes = set([o.mesh for o in shared.allObjects() if o.mesh])
+    self.assertTrue(meshes)
+    for mesh in meshes:
+      self.assertTrue(mesh.users > 1, "mesh with %d users" % mesh.users)
+
+    for i in range(3):
+      play(plain, 1000)
+      play(shared, 1000)
+      self.assertEqual(saveState(shared), saveState(plain))
+
+  def testTuples(self):
+    self.compare()
+
+  def testArrays(self):
+    if not numpy:
+      self.skipTest("numpy is not installed")
+    self.compare(arrays=True)
+
+
+if __name__ == "__main__":
+  unittest.main()
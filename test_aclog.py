@@ -0,0 +1,80 @@
+
+import os
+import tempfile
+import unittest
+
+from aclog import *
+
+
+class EventLogTest(unittest.TestCase):
+
+  def setUp(self):
+    (fd, self.filename) = tempfile.mkstemp(suffix='.acl')
+    os.close(fd)
+
+  def tearDown(self):
+    os.remove(self.filename)
+
+  def makeLog(self, **options):
+    """A log whose writer only wakes up when it is closed, so what gets dropped does not depend on timing"""
+    options.setdefault('batch', 1000000)
+    return ACEventLog(self.filename, interval=3600, **options)
+
+  def testClose(self):
+    log = self.makeLog()
+    for i in range(100):
+      log.log(i, 'hit', 'peg%d' % (i % 3), i)
+    log.close()
+    log.close()
+    self.assertEqual(readLog(self.filename), [(i, 'hit', 'peg%d' % (i % 3), i) for i in range(100)])
+
+  def testOverflow(self):
+    log = self.makeLog(capacity=16)
+    for i in range(2000):
+      log.log(i, 'hit', 'peg', i)
+    log.close()
+    events = readLog(self.filename)
+    self.assertEqual(events[:-1], [(i, 'hit', 'peg', i) for i in range(1984, 2000)])
+    self.assertEqual(events[-1], (1999, 'dropped', '', 1984))
+
+  def testLimits(self):
+    log = self.makeLog(rate=200, limits={'hit': 3})
+    for i in range(10):
+      log.log(i, 'hit', 'peg')
+      log.log(i, 'score', 'peg', 100)
+    for i in range(200, 205):
+      log.log(i, 'hit', 'bumper')
+    log.close()
+
+    events = readLog(self.filename)
+    self.assertEqual([e for e in events if e[1] == 'hit'],
+                     [(0, 'hit', 'peg', 0), (1, 'hit', 'peg', 0), (2, 'hit', 'peg', 0),
+                      (200, 'hit', 'bumper', 0), (201, 'hit', 'bumper', 0), (202, 'hit', 'bumper', 0)])
+    self.assertEqual(len([e for e in events if e[1] == 'score']), 10)
+    # The count left out of a second is written when the next one starts, and the last one on close
+    self.assertEqual([e for e in events if e[1] == 'suppressed'], [(200, 'suppressed', 'hit', 7), (399, 'suppressed', 'hit', 2)])
+
+  def testTruncated(self):
+    log = self.makeLog()
+    for i in range(10):
+      log.log(i, 'hit', 'peg')
+    log.log(10, 'hit', 'bumper')
+    log.close()
+    size = os.path.getsize(self.filename)
+
+    # Cut into the last event, the name the last event introduced, and that name's record
+    for cut in (1, EVENT.size + 3, EVENT.size + NAME.size + 1):
+      f = open(self.filename, 'r+b')
+      f.truncate(size - cut)
+      f.close()
+      self.assertEqual(readLog(self.filename), [(i, 'hit', 'peg', 0) for i in range(10)])
+
+  def testNotALog(self):
+    f = open(self.filename, 'wb')
+    f.write('ACR1')
+    f.close()
+    self.assertRaises(ValueError, readLog, self.filename)
+
+
+if __name__ == "__main__":
+  unittest.main()
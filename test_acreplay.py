@@ -0,0 +1,53 @@
+
+import os
+import tempfile
+import unittest
+
+from pinballtest import *
+
+
+class ReplayTest(unittest.TestCase):
+
+  def setUp(self):
+    (fd, self.filename) = tempfile.mkstemp(suffix='.rpl')
+    os.close(fd)
+
+  def tearDown(self):
+    os.remove(self.filename)
+
+  def roundTrip(self, **settings):
+    """Record a game, then seek into the replay and play it to the end"""
+    game = makeGame(**settings)
+    recorder = ACRecorder(game, self.filename, {}, 250)
+    play(game, 1200)
+    recorder.close()
+    end = saveState(game)
+
+    replay = ACReplay(self.filename)
+    self.assertTrue(replay.complete)
+    other = makeGame(**settings)
+    replay.play(other)
+    replay.seek(other, 700)
+    self.assertEqual(other.steps, 700)
+    for ball in other.balls:
+      self.assertEqual([type(x) for x in ball.location], [float]*3)
+    replay.finish(other)
+    self.assertEqual(replay.mismatches, [])
+    self.assertEqual(saveState(other), end)
+
+  def testTuples(self):
+    self.roundTrip()
+
+  def testArrays(self):
+    if not numpy:
+      self.skipTest("numpy is not installed")
+    self.roundTrip(arrays=True)
+
+  def testArraysMultiball(self):
+    if not numpy:
+      self.skipTest("numpy is not installed")
+    self.roundTrip(arrays=True, balls=4)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,47 @@
+
+import random
+import unittest
+
+from pinballtest import *
+from pinballbatch import PinballBatch
+
+
+class BatchTest(unittest.TestCase):
+  """A table of the batch simulator has to play exactly the same game as PinballGame"""
+
+  def compare(self, board, steps):
+    if not numpy:
+      self.skipTest("numpy is not installed")
+    settings = copy.deepcopy(SETTINGS)
+    settings['gamefile'] = board
+    game = makeGame(**settings)
+    batch = PinballBatch(settings, 1)
+    keys = settings['keys']
+
+    rand = random.Random(0)
+    action = [0, 0]
+    for i in range(steps):
+      # Flip each paddle now and then, and relaunch a drained ball the way the batch does
+      for (c, side) in enumerate(batch.paddles):
+        if rand.random() < 1.0/40:
+          action[c] = 1 - action[c]
+          game.input(action[c] and -1 or 1, keys[side])
+      if game.ball.hidden:
+        game.input(-1, keys['fire'])
+        game.input(1, keys['fire'])
+
+      game.step()
+      batch.step([action])
+      self.assertEqual(list(game.ball.location), batch.location[0].tolist(), "location differs at step %d" % i)
+      self.assertEqual(list(game.ball.velocity), batch.velocity[0].tolist(), "velocity differs at step %d" % i)
+      self.assertEqual(game.score, batch.score[0], "score differs at step %d" % i)
+
+  def testBoard5(self):
+    self.compare('Pinball0_5.ac', 2500)
+
+  def testBoard6(self):
+    self.compare('Pinball0_6.ac', 1500)
+
+
+if __name__ == "__main__":
+  unittest.main()